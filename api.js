@@ -35,8 +35,13 @@ async function checkWebSocketAvailability() {
 
 /**
  * 主要的消息发送函数 - 自动选择最佳通信方式
+ * @param {string} message 用户消息
+ * @param {Function} [onProgress] 可选，接收增量进度事件 (仅WebSocket模式)
  */
-async function sendMessageToBackend(message) {
+async function sendMessageToBackend(message, onProgress = null) {
+    // 幂等键：每轮对话生成一次，WebSocket重试和降级到HTTP都携带同一个键，后端只执行一次
+    const idempotencyKey = crypto.randomUUID();
+
     // 检查WebSocket可用性
     if (USE_WEBSOCKET && !WEBSOCKET_AVAILABLE) {
         await checkWebSocketAvailability();
@@ -45,21 +50,21 @@ async function sendMessageToBackend(message) {
     // 根据可用性选择通信方式
     if (USE_WEBSOCKET && WEBSOCKET_AVAILABLE) {
         try {
-            return await sendMessageToBackendWS(message);
+            return await sendMessageToBackendWS(message, onProgress, idempotencyKey);
         } catch (error) {
             console.warn('WebSocket通信失败，降级到HTTP:', error.message);
             // 降级到HTTP
-            return await sendMessageToBackendHTTP(message);
+            return await sendMessageToBackendHTTP(message, idempotencyKey);
         }
     } else {
-        return await sendMessageToBackendHTTP(message);
+        return await sendMessageToBackendHTTP(message, idempotencyKey);
     }
 }
 
 /**
  * HTTP方式发送消息 (原有实现，重命名)
  */
-async function sendMessageToBackendHTTP(message) {
+async function sendMessageToBackendHTTP(message, idempotencyKey = null) {
     try {
         // 检查是否有自定义配置（包括代理设置）
         const settings = await new Promise((resolve) => {
@@ -109,6 +114,9 @@ async function sendMessageToBackendHTTP(message) {
 
             // 如果启用了代理，将代理信息传递给后端
             const requestBody = { message: message };
+            if (idempotencyKey) {
+                requestBody.idempotency_key = idempotencyKey;
+            }
             if (settings.proxyEnabled && settings.proxyHost && settings.proxyPort) {
                 requestBody.proxyConfig = {
                     enabled: true,
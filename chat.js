@@ -555,6 +555,43 @@ document.addEventListener('DOMContentLoaded', async () => {
         event.target.value = '';
     }
 
+    // 流式回复：token增量以纯文本追加到占位消息，收到最终结果后替换为渲染后的Markdown
+    function createStreamingMessage() {
+        const messageWrapper = document.createElement('div');
+        messageWrapper.classList.add('message-wrapper');
+        const messageElement = document.createElement('div');
+        messageElement.classList.add('message', 'llm', 'streaming');
+        messageWrapper.appendChild(messageElement);
+
+        let text = '';
+        let tool = null;
+        const render = () => {
+            messageElement.textContent = tool ? `${text}\n\n🔧 正在执行 ${tool}...` : text;
+            if (!messageWrapper.parentNode) {
+                chatBox.appendChild(messageWrapper);
+            }
+            chatBox.scrollTop = chatBox.scrollHeight;
+        };
+
+        return {
+            onProgress(event) {
+                if (event.event === 'token') {
+                    text += event.text;
+                } else if (event.event === 'tool_started') {
+                    tool = event.tool;
+                } else if (event.event === 'tool_finished') {
+                    tool = null;
+                } else {
+                    return;
+                }
+                render();
+            },
+            remove() {
+                messageWrapper.remove();
+            }
+        };
+    }
+
     async function sendMessage() {
         const message = messageInput.value.trim();
         if (message) {
@@ -562,8 +599,13 @@ document.addEventListener('DOMContentLoaded', async () => {
             messageInput.value = ''; // Clear input
 
             // Call the backend API
-            const llmResponse = await sendMessageToBackend(message);
-            appendMessage('llm', llmResponse);
+            const streaming = createStreamingMessage();
+            try {
+                const llmResponse = await sendMessageToBackend(message, event => streaming.onProgress(event));
+                appendMessage('llm', llmResponse);
+            } finally {
+                streaming.remove();
+            }
         }
     }
 
@@ -123,27 +123,43 @@ function bindContextMenuEvents() {
     });
 }
 
-// 加载文件夹树
+// 每次请求的子节点数量
+const FOLDER_PAGE_SIZE = 200;
+
+// 获取文件夹的一层子节点 (分页)
+async function fetchFolderChildren(path, cursor = null) {
+    const params = new URLSearchParams({ path: path || '.', limit: FOLDER_PAGE_SIZE });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    
+    const response = await fetch(`${API_BASE_URL}/api/folders/children?${params}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    return response.json();
+}
+
+// 加载文件夹树 (只加载第一层，展开节点时再按需加载)
 async function loadFolderTree(path = '.') {
     const treeContainer = document.getElementById('folder-tree');
     treeContainer.innerHTML = '<div class="loading">加载中...</div>';
     
     try {
-        const response = await fetch(`${API_BASE_URL}/api/folders/tree?path=${encodeURIComponent(path)}&max_depth=3`);
-        
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-        }
+        const data = await fetchFolderChildren(path);
+        const root = data.node;
+        root.children = data.children;
+        root.nextCursor = data.next_cursor;
+        root.expanded = true;
         
-        const data = await response.json();
-        fileManagerState.folderTree = data;
+        fileManagerState.folderTree = root;
         fileManagerState.currentPath = path;
         
         // 更新当前路径显示
         document.getElementById('current-path').textContent = path || './';
         
         // 渲染文件夹树
-        renderFolderTree(data.tree, treeContainer);
+        renderFolderTree(root, treeContainer);
         
         console.log('文件夹树加载成功:', data);
     } catch (error) {
@@ -174,7 +190,8 @@ function createTreeNode(node, depth) {
     const expandIcon = document.createElement('span');
     expandIcon.className = 'expand-icon';
     
-    if (node.type === 'folder' && node.children && node.children.length > 0) {
+    const hasChildren = node.has_children || (node.children && node.children.length > 0);
+    if (node.type === 'folder' && hasChildren) {
         expandIcon.textContent = node.expanded ? '📂' : '📁';
         expandIcon.style.cursor = 'pointer';
         expandIcon.addEventListener('click', function(e) {
@@ -218,31 +235,83 @@ function createTreeNode(node, depth) {
     
     nodeElement.appendChild(nodeContent);
     
-    // 子节点容器
-    if (node.type === 'folder' && node.children) {
+    // 子节点容器 (子节点在首次展开时加载)
+    if (node.type === 'folder') {
         const childrenContainer = document.createElement('div');
         childrenContainer.className = 'tree-children';
         childrenContainer.style.display = node.expanded ? 'block' : 'none';
-        
-        node.children.forEach(child => {
-            const childElement = createTreeNode(child, depth + 1);
-            childrenContainer.appendChild(childElement);
-        });
-        
         nodeElement.appendChild(childrenContainer);
+        
+        if (node.children) {
+            appendChildNodes(node, node.children, childrenContainer, depth + 1);
+        }
     }
     
     return nodeElement;
 }
 
+// 追加一页子节点，还有更多时在末尾显示"加载更多"
+function appendChildNodes(node, children, container, depth) {
+    const loadMore = container.querySelector(':scope > .tree-load-more');
+    if (loadMore) {
+        loadMore.remove();
+    }
+    
+    children.forEach(child => {
+        container.appendChild(createTreeNode(child, depth));
+    });
+    
+    if (node.nextCursor) {
+        const moreElement = document.createElement('div');
+        moreElement.className = 'tree-node-content tree-load-more';
+        moreElement.style.paddingLeft = `${depth * 20}px`;
+        moreElement.textContent = '加载更多...';
+        moreElement.addEventListener('click', async function(e) {
+            e.stopPropagation();
+            moreElement.textContent = '加载中...';
+            try {
+                const data = await fetchFolderChildren(node.path, node.nextCursor);
+                node.children.push(...data.children);
+                node.nextCursor = data.next_cursor;
+                appendChildNodes(node, data.children, container, depth);
+            } catch (error) {
+                console.error('加载子节点失败:', error);
+                moreElement.textContent = `加载失败: ${error.message}`;
+            }
+        });
+        container.appendChild(moreElement);
+    }
+}
+
+// 首次展开时加载文件夹的子节点
+async function loadChildNodes(node, nodeElement) {
+    const childrenContainer = nodeElement.querySelector(':scope > .tree-children');
+    const depth = Math.round(parseInt(nodeElement.style.paddingLeft || '0', 10) / 20) + 1;
+    childrenContainer.innerHTML = '<div class="loading">加载中...</div>';
+    
+    try {
+        const data = await fetchFolderChildren(node.path);
+        node.children = data.children;
+        node.nextCursor = data.next_cursor;
+        childrenContainer.innerHTML = '';
+        appendChildNodes(node, node.children, childrenContainer, depth);
+    } catch (error) {
+        console.error('加载子节点失败:', error);
+        childrenContainer.innerHTML = `<div class="error">加载失败: ${error.message}</div>`;
+    }
+}
+
 // 切换文件夹展开/折叠
 function toggleFolder(node, nodeElement) {
     node.expanded = !node.expanded;
     
-    const expandIcon = nodeElement.querySelector('.expand-icon');
-    const childrenContainer = nodeElement.querySelector('.tree-children');
+    const expandIcon = nodeElement.querySelector(':scope > .tree-node-content .expand-icon');
+    const childrenContainer = nodeElement.querySelector(':scope > .tree-children');
     
     if (node.expanded) {
+        if (!node.children) {
+            loadChildNodes(node, nodeElement);
+        }
         expandIcon.textContent = '📂';
         if (childrenContainer) {
             childrenContainer.style.display = 'block';
@@ -488,33 +557,44 @@ async function handleModalConfirm() {
     }
 }
 
-// 处理创建文件夹
-async function handleCreateFolder() {
-    const folderName = document.getElementById('folder-name').value.trim();
-    const folderPath = document.getElementById('folder-path').value.trim();
-    
-    if (!folderName) {
-        throw new Error('请输入文件夹名称');
-    }
-    
-    const response = await fetch(`${API_BASE_URL}/api/folders/create`, {
+// 批量文件操作：一次请求提交多个 create/write/move/delete 操作，返回每个操作的结果
+async function batchFileOperations(operations) {
+    const response = await fetch(`${API_BASE_URL}/api/files/batch`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({
-            path: folderPath,
-            name: folderName
-        })
+        body: JSON.stringify({ operations })
     });
     
+    const data = await response.json();
     if (!response.ok) {
-        const error = await response.json();
-        throw new Error(error.detail || '创建文件夹失败');
+        const detail = data.detail;
+        if (detail && detail.errors) {
+            throw new Error(detail.errors.map(e => e.message).join('\n'));
+        }
+        throw new Error(detail || '批量操作失败');
+    }
+    
+    const failed = data.results.filter(r => r.status !== 'ok');
+    if (failed.length > 0) {
+        throw new Error(failed.map(r => r.message).join('\n'));
+    }
+    return data.results;
+}
+
+// 处理创建文件夹
+async function handleCreateFolder() {
+    const folderName = document.getElementById('folder-name').value.trim();
+    const folderPath = document.getElementById('folder-path').value.trim();
+    
+    if (!folderName) {
+        throw new Error('请输入文件夹名称');
     }
     
-    const result = await response.json();
-    console.log('文件夹创建成功:', result);
+    const path = `${folderPath}/${folderName}`.replace(/^\/+|\/+$/g, '');
+    const results = await batchFileOperations([{ op: 'create', path }]);
+    console.log('文件夹创建成功:', results);
 }
 
 // 处理重命名
@@ -526,45 +606,15 @@ async function handleRenameFolder() {
         throw new Error('请输入新名称');
     }
     
-    const response = await fetch(`${API_BASE_URL}/api/folders/rename`, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            old_path: oldPath,
-            new_name: newName
-        })
-    });
-    
-    if (!response.ok) {
-        const error = await response.json();
-        throw new Error(error.detail || '重命名失败');
-    }
-    
-    const result = await response.json();
-    console.log('重命名成功:', result);
+    const parent = oldPath.includes('/') ? oldPath.slice(0, oldPath.lastIndexOf('/') + 1) : '';
+    const results = await batchFileOperations([{ op: 'move', path: oldPath, dest: parent + newName }]);
+    console.log('重命名成功:', results);
 }
 
 // 处理删除
 async function handleDeleteFolder() {
     const path = document.getElementById('folder-modal').getAttribute('data-path');
     
-    const response = await fetch(`${API_BASE_URL}/api/folders/delete`, {
-        method: 'DELETE',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            path: path
-        })
-    });
-    
-    if (!response.ok) {
-        const error = await response.json();
-        throw new Error(error.detail || '删除失败');
-    }
-    
-    const result = await response.json();
-    console.log('删除成功:', result);
+    const results = await batchFileOperations([{ op: 'delete', path }]);
+    console.log('删除成功:', results);
 }
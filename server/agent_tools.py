@@ -17,10 +17,13 @@ import platform
 import socket
 import psutil
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any
 import httpx
 from dotenv import load_dotenv
 
+import file_window
+from completion import post_chat_completion
+
 # 加载环境变量
 load_dotenv()
 
@@ -31,6 +34,7 @@ os.makedirs(base_dir, exist_ok=True)
 # AI API配置
 deepseek_api_key = os.getenv('DEEPSEEK_API_KEY')
 tavily_api_key = os.getenv('TAVILY_API_KEY')
+DEEPSEEK_API_BASE = os.getenv('DEEPSEEK_API_BASE', 'https://api.deepseek.com')
 
 # 尝试导入pydantic-ai
 try:
@@ -66,15 +70,23 @@ def _validate_path(target_path: Path, check_existence=False, expect_dir=False, e
     except Exception as e:
         return False, f"路径验证时发生异常：{e}"
 
-def read_file(name: str) -> str:
-    """读取文件内容"""
-    print(f"(read_file '{name}')")
+def read_file(name: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+              offset: Optional[int] = None, length: Optional[int] = None,
+              head: Optional[int] = None, tail: Optional[int] = None) -> str:
+    """读取文件内容 (大文件或指定窗口时只读取一个窗口)"""
+    print(f"(read_file '{name}' lines={start_line}-{end_line} offset={offset} length={length} head={head} tail={tail})")
     p = base_dir / name
     ok, msg = _validate_path(p, check_existence=True, expect_file=True)
     if not ok: return msg
-    try: 
+    try:
+        if file_window.is_windowed(start_line, end_line, offset, length, head, tail) or \
+                p.stat().st_size > file_window.READ_WINDOW_MAX_BYTES:
+            window = file_window.read_window(p.resolve(), offset, length, start_line, end_line, head, tail)
+            return file_window.render(name, window)
         return p.read_text(encoding='utf-8')
-    except Exception as e: 
+    except file_window.WindowError as e:
+        return f"错误：{e}"
+    except Exception as e:
         return f"读取文件 '{name}' 时发生错误：{e}"
 
 def list_files(path: str = ".") -> list[str]:
@@ -227,7 +239,7 @@ BASE_SYSTEM_PROMPT = f"""你是 ShellAI，一个经验丰富的程序员助手
 
 可用工具:
 - 文件/目录操作 (所有路径参数均相对于 './{base_dir.name}/'):
-  `read_file(name: str)`: 读取文件内容。
+  `read_file(name: str, start_line: int = None, end_line: int = None, offset: int = None, length: int = None, head: int = None, tail: int = None)`: 读取文件内容。大文件每次最多返回256KB，可按行范围 (从1开始)、字节偏移/长度或开头/末尾N行读取一部分，四种方式只能选一种。
   `list_files(path: str = ".")`: 列出目录内容。
   `write_file(name: str, content: str, mode: str = 'w')`: 写入文件 (w覆盖, a追加)。
   `create_directory(name: str)`: 创建目录。
@@ -284,6 +296,20 @@ def create_intelligent_agent(proxy_config: Optional[Dict] = None):
         'system_prompt': BASE_SYSTEM_PROMPT
     }
 
+def _invoke_tool(agent, tool_name: str, *args):
+    """执行工具，并通过agent['on_event']通知调用方工具开始/结束"""
+    on_event = agent.get('on_event')
+    if on_event:
+        on_event('tool_started', tool=tool_name)
+    success = False
+    try:
+        result = agent['tools'][tool_name](*args)
+        success = True
+        return result
+    finally:
+        if on_event:
+            on_event('tool_finished', tool=tool_name, success=success)
+
 def run_agent_with_tools(agent, message: str) -> str:
     """运行智能体处理消息（简化版本）"""
     if not agent:
@@ -296,26 +322,28 @@ def run_agent_with_tools(agent, message: str) -> str:
             if 'tavily_search_tool' in agent['tools']:
                 search_query = message.replace('搜索', '').replace('查找', '').replace('查询', '').strip()
                 if search_query:
-                    return agent['tools']['tavily_search_tool'](search_query)
+                    return _invoke_tool(agent, 'tavily_search_tool', search_query)
 
         # 检查是否是文件操作请求
         if any(keyword in message.lower() for keyword in ['列出', 'ls', '目录', '文件']):
             if 'list_files' in agent['tools']:
-                result = agent['tools']['list_files']()
+                result = _invoke_tool(agent, 'list_files')
                 if isinstance(result, list):
                     return '\n'.join(result)
                 return result
 
         if any(keyword in message.lower() for keyword in ['系统信息', '电脑信息', 'system info']):
             if 'get_system_info' in agent['tools']:
-                result = agent['tools']['get_system_info']()
+                result = _invoke_tool(agent, 'get_system_info')
                 return result
 
         # 构建完整的提示，包含系统提示和用户消息
         full_prompt = f"{agent['system_prompt']}\n\n用户: {message}\n\n助手: "
 
-        # 调用DeepSeek API
-        response = _call_deepseek_api(full_prompt, agent['proxy_config'])
+        # 调用DeepSeek API (优先复用调用方提供的连接池)
+        # 调用方提供on_token时流式调用，逐段转发token增量
+        response = _call_deepseek_api(full_prompt, agent['proxy_config'], agent.get('http_client'),
+                                      agent.get('on_token'))
 
         # 检查是否需要调用工具
         response = _process_tool_calls(response, agent['tools'])
@@ -325,12 +353,14 @@ def run_agent_with_tools(agent, message: str) -> str:
     except Exception as e:
         return f"智能体处理失败: {str(e)}"
 
-def _call_deepseek_api(prompt: str, proxy_config: Optional[Dict] = None) -> str:
-    """调用DeepSeek API"""
+def _call_deepseek_api(prompt: str, proxy_config: Optional[Dict] = None,
+                       http_client: Optional[httpx.Client] = None,
+                       on_token: Optional[Callable[[str], None]] = None) -> str:
+    """调用DeepSeek API，传入http_client时复用该客户端且不关闭它；传入on_token时以流式响应逐段回调"""
     if not deepseek_api_key:
         return "未配置DEEPSEEK_API_KEY，当前为测试模式。"
 
-    endpoint = "https://api.deepseek.com/v1/chat/completions"
+    endpoint = f"{DEEPSEEK_API_BASE.rstrip('/')}/v1/chat/completions"
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {deepseek_api_key}'
@@ -344,29 +374,26 @@ def _call_deepseek_api(prompt: str, proxy_config: Optional[Dict] = None) -> str:
         'max_tokens': 4000
     }
 
-    # 配置代理
-    if proxy_config and proxy_config.get('enabled'):
-        proxy_url = _build_proxy_url(proxy_config)
-        client = httpx.Client(
-            timeout=httpx.Timeout(60.0),
-            proxy=proxy_url
-        )
-    else:
-        client = httpx.Client(timeout=httpx.Timeout(60.0))
+    owns_client = http_client is None
+    if owns_client:
+        # 配置代理
+        if proxy_config and proxy_config.get('enabled'):
+            proxy_url = _build_proxy_url(proxy_config)
+            http_client = httpx.Client(
+                timeout=httpx.Timeout(60.0),
+                proxy=proxy_url
+            )
+        else:
+            http_client = httpx.Client(timeout=httpx.Timeout(60.0))
 
     try:
-        with client:
-            response = client.post(endpoint, headers=headers, json=data)
-            response.raise_for_status()
-
-            result = response.json()
-            if result.get('choices') and result['choices'][0].get('message'):
-                return result['choices'][0]['message']['content']
-            else:
-                raise Exception("API响应格式异常")
+        return post_chat_completion(http_client, endpoint, headers, data, on_token)
 
     except Exception as e:
         return f"API调用失败: {str(e)}"
+    finally:
+        if owns_client:
+            http_client.close()
 
 def _build_proxy_url(proxy_config: Dict) -> str:
     """构建代理URL"""
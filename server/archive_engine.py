@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行、流式的归档创建
+- zip: 每个文件切分为 ARCHIVE_BLOCK_BYTES 大小的块，由线程池并行压缩 (zlib压缩时释放GIL)；
+  每块以前一块末尾的32KB作为预置字典、以 Z_SYNC_FLUSH 结束 (与pigz相同)，按顺序拼接后
+  就是一个完整的deflate流。写入线程按成员和块的顺序写盘，文件头中的CRC和大小在成员写完后回填；
+  已提交但未写入的块数不超过 ARCHIVE_WINDOW，内存占用与文件大小无关。超过4GB时自动使用zip64
+- tar.zst: tar流直接写入多线程的zstd压缩流 (需要安装zstandard)
+- tar / tar.gz / tar.bz2: 与之前相同的tarfile流式写入
+- 每写完一块或一个成员通过 on_progress 报告进度
+"""
+
+import os
+import time
+import zlib
+import struct
+import tarfile
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Callable, Deque, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# --- 归档配置 ---
+ARCHIVE_WORKERS = int(os.getenv('ARCHIVE_WORKERS', '0')) or (os.cpu_count() or 1)   # 压缩线程数，0表示CPU核心数
+ARCHIVE_ZIP_LEVEL = int(os.getenv('ARCHIVE_ZIP_LEVEL', '6'))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv('ARCHIVE_ZSTD_LEVEL', '3'))
+ARCHIVE_BLOCK_BYTES = 1 << 20            # zip并行压缩的块大小
+ARCHIVE_DICT_BYTES = 32 * 1024           # deflate窗口大小，块之间的预置字典
+ARCHIVE_WINDOW = 4                       # 每个压缩线程最多领先写入线程的块数
+
+TAR_MODES = {"tar": "w", "gztar": "w:gz", "bztar": "w:bz2"}
+FORMATS = ("zip", "zstdtar", *TAR_MODES)
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+_LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+_CENTRAL_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+_END_RECORD = struct.Struct('<4sHHHHLLH')
+_END_RECORD64 = struct.Struct('<4sQHHLLQQQQ')
+_END_LOCATOR64 = struct.Struct('<4sLQL')
+
+
+class Member(NamedTuple):
+    """要归档的一个条目"""
+    path: Path            # 磁盘上的路径
+    arcname: str          # 归档中的名称 (使用/分隔)
+    is_dir: bool
+
+
+class ArchiveProgress(NamedTuple):
+    """归档进度"""
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+
+
+ProgressCallback = Callable[[ArchiveProgress], None]
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _compress_block(path: Path, offset: int, length: int, last: bool, level: int) -> Tuple[bytes, int, int]:
+    """
+    压缩文件的一块 (线程池中执行)
+
+    Returns:
+        (压缩数据, 原始数据的CRC32, 原始数据长度)
+    """
+    with open(path, 'rb') as f:
+        dict_start = max(0, offset - ARCHIVE_DICT_BYTES)
+        f.seek(dict_start)
+        zdict = f.read(offset - dict_start)
+        data = f.read(length)
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.crc32(data), len(data)
+
+
+class _ZipEntry(NamedTuple):
+    name: bytes
+    flags: int
+    method: int
+    dostime: int
+    dosdate: int
+    crc: int
+    compress_size: int
+    file_size: int
+    offset: int
+    external_attr: int
+
+
+class ZipStreamWriter:
+    """只追加的zip写入器：成员的内容按块到达，写完后回填文件头"""
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self.entries: List[_ZipEntry] = []
+
+    def begin(self, arcname: str, st: os.stat_result, is_dir: bool) -> dict:
+        """写入成员的本地文件头，返回用于 write/end 的状态"""
+        name = arcname + '/' if is_dir and not arcname.endswith('/') else arcname
+        try:
+            encoded, flags = name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            encoded, flags = name.encode('utf-8'), 0x800
+        # 与zipfile相同的估计：压缩后可能超过4GB的文件预留zip64字段
+        zip64 = not is_dir and st.st_size * 1.05 > ZIP64_LIMIT
+        dostime, dosdate = _dos_datetime(st.st_mtime)
+        method = zipfile.ZIP_STORED if is_dir else zipfile.ZIP_DEFLATED
+        offset = self.fp.tell()
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        size_field = ZIP64_LIMIT if zip64 else 0
+        self.fp.write(_LOCAL_HEADER.pack(b'PK\x03\x04', 45 if zip64 else 20, flags, method, dostime, dosdate,
+                                         0, size_field, size_field, len(encoded), len(extra)))
+        self.fp.write(encoded)
+        self.fp.write(extra)
+        mode = (st.st_mode & 0xFFFF) | (0o040000 if is_dir else 0)
+        return {'name': encoded, 'flags': flags, 'method': method, 'dostime': dostime, 'dosdate': dosdate,
+                'offset': offset, 'zip64': zip64, 'crc': 0, 'csize': 0, 'usize': 0,
+                'external_attr': (mode << 16) | (0x10 if is_dir else 0)}
+
+    def write(self, state: dict, compressed: bytes, crc: int, length: int) -> None:
+        self.fp.write(compressed)
+        # 第一个块的CRC就是成员的CRC；之后的块才需要合并 (整块长度相同，推进矩阵只构建一次)
+        state['crc'] = crc if state['usize'] == 0 else _crc32_combine(state['crc'], crc, length)
+        state['csize'] += len(compressed)
+        state['usize'] += length
+
+    def end(self, state: dict) -> None:
+        """回填CRC和大小"""
+        if not state['zip64'] and max(state['csize'], state['usize']) > ZIP64_LIMIT:
+            raise ValueError(f"文件 '{state['name'].decode('utf-8')}' 在归档过程中增大到超过4GB")
+        end = self.fp.tell()
+        self.fp.seek(state['offset'] + 14)
+        if state['zip64']:
+            self.fp.write(struct.pack('<L', state['crc']))
+            self.fp.seek(state['offset'] + _LOCAL_HEADER.size + len(state['name']) + 4)
+            self.fp.write(struct.pack('<QQ', state['usize'], state['csize']))
+        else:
+            self.fp.write(struct.pack('<LLL', state['crc'], state['csize'], state['usize']))
+        self.fp.seek(end)
+        self.entries.append(_ZipEntry(state['name'], state['flags'], state['method'], state['dostime'],
+                                      state['dosdate'], state['crc'], state['csize'], state['usize'],
+                                      state['offset'], state['external_attr']))
+
+    def close(self) -> None:
+        """写入中央目录和结束记录"""
+        cd_offset = self.fp.tell()
+        for e in self.entries:
+            extra_values = [v for v in (e.file_size, e.compress_size, e.offset) if v >= ZIP64_LIMIT]
+            extra = struct.pack(f'<HH{len(extra_values)}Q', 1, 8 * len(extra_values), *extra_values) if extra_values else b''
+            self.fp.write(_CENTRAL_HEADER.pack(
+                b'PK\x01\x02', (3 << 8) | 45, 45 if extra else 20, e.flags, e.method, e.dostime, e.dosdate, e.crc,
+                min(e.compress_size, ZIP64_LIMIT), min(e.file_size, ZIP64_LIMIT), len(e.name), len(extra), 0, 0, 0,
+                e.external_attr, min(e.offset, ZIP64_LIMIT)))
+            self.fp.write(e.name)
+            self.fp.write(extra)
+        cd_end = self.fp.tell()
+        cd_size = cd_end - cd_offset
+        count = len(self.entries)
+        if count > ZIP_FILECOUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            self.fp.write(_END_RECORD64.pack(b'PK\x06\x06', _END_RECORD64.size - 12, 45, 45, 0, 0,
+                                             count, count, cd_size, cd_offset))
+            self.fp.write(_END_LOCATOR64.pack(b'PK\x06\x07', 0, cd_end, 1))
+        self.fp.write(_END_RECORD.pack(b'PK\x05\x06', 0, 0, min(count, ZIP_FILECOUNT_LIMIT),
+                                       min(count, ZIP_FILECOUNT_LIMIT), min(cd_size, ZIP64_LIMIT),
+                                       min(cd_offset, ZIP64_LIMIT), 0))
+
+
+def _gf2_times(matrix: List[int], vec: int) -> int:
+    result = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            result ^= matrix[i]
+        vec >>= 1
+        i += 1
+    return result
+
+
+_crc_shift_cache: dict = {}
+
+
+def _crc_shift_operator(length: int) -> List[int]:
+    """把CRC向后推进length个零字节的GF(2)矩阵 (zlib的crc32_combine)，按长度缓存"""
+    op = _crc_shift_cache.get(length)
+    if op is not None:
+        return op
+    odd = [0xEDB88320] + [1 << i for i in range(31)]      # 一个零比特
+    even = [_gf2_times(odd, odd[i]) for i in range(32)]    # 两个零比特
+    odd = [_gf2_times(even, even[i]) for i in range(32)]   # 四个零比特
+    result = [1 << i for i in range(32)]
+    n = length
+    while n:
+        even = [_gf2_times(odd, odd[i]) for i in range(32)]
+        if n & 1:
+            result = [_gf2_times(even, result[i]) for i in range(32)]
+        n >>= 1
+        if not n:
+            break
+        odd = [_gf2_times(even, even[i]) for i in range(32)]
+        if n & 1:
+            result = [_gf2_times(odd, result[i]) for i in range(32)]
+        n >>= 1
+    if len(_crc_shift_cache) < 64:
+        _crc_shift_cache[length] = result
+    return result
+
+
+def _crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """由两段数据各自的CRC32求拼接后的CRC32"""
+    if length2 == 0:
+        return crc1
+    return _gf2_times(_crc_shift_operator(length2), crc1) ^ crc2
+
+
+def _blocks(size: int) -> List[Tuple[int, int, bool]]:
+    if size == 0:
+        return [(0, 0, True)]
+    starts = range(0, size, ARCHIVE_BLOCK_BYTES)
+    return [(s, min(ARCHIVE_BLOCK_BYTES, size - s), s + ARCHIVE_BLOCK_BYTES >= size) for s in starts]
+
+
+def write_zip(target: Path, members: Iterable[Member], on_progress: Optional[ProgressCallback] = None,
+              workers: Optional[int] = None, level: Optional[int] = None) -> int:
+    """
+    并行压缩写入zip归档
+
+    Returns:
+        写入的成员数
+    """
+    workers = workers or ARCHIVE_WORKERS
+    level = ARCHIVE_ZIP_LEVEL if level is None else level
+    planned = []
+    for member in members:
+        st = os.stat(member.path)
+        planned.append((member, st))
+    files_total = sum(1 for m, _ in planned if not m.is_dir)
+    bytes_total = sum(st.st_size for m, st in planned if not m.is_dir)
+    files_done = bytes_done = 0
+
+    with open(target, 'wb') as fp, ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archive') as pool:
+        writer = ZipStreamWriter(fp)
+        pending: Deque[Tuple[int, Future]] = deque()     # (成员序号, 块的压缩任务)
+        jobs = ((i, member, offset, length, last)
+                for i, (member, st) in enumerate(planned) if not member.is_dir
+                for offset, length, last in _blocks(st.st_size))
+        limit = workers * ARCHIVE_WINDOW
+        current = -1
+        state = None
+
+        def submit_next() -> None:
+            job = next(jobs, None)
+            if job is not None:
+                i, member, offset, length, last = job
+                pending.append((i, pool.submit(_compress_block, member.path, offset, length, last, level)))
+
+        def start_member(i: int) -> dict:
+            # 先写入位于该成员之前的目录条目
+            nonlocal current
+            for j in range(current + 1, i):
+                member, st = planned[j]
+                writer.end(writer.begin(member.arcname, st, True))
+            current = i
+            member, st = planned[i]
+            return writer.begin(member.arcname, st, False)
+
+        try:
+            for _ in range(limit):
+                submit_next()
+            while pending:
+                i, future = pending.popleft()
+                if i != current:
+                    if state is not None:
+                        writer.end(state)
+                        files_done += 1
+                    state = start_member(i)
+                compressed, crc, length = future.result()
+                writer.write(state, compressed, crc, length)
+                bytes_done += length
+                submit_next()
+                if on_progress:
+                    on_progress(ArchiveProgress(files_done, files_total, bytes_done, bytes_total))
+            if state is not None:
+                writer.end(state)
+                files_done += 1
+            for j in range(current + 1, len(planned)):
+                member, st = planned[j]
+                writer.end(writer.begin(member.arcname, st, True))
+            writer.close()
+        except BaseException:
+            for _, future in pending:
+                future.cancel()
+            raise
+    if on_progress:
+        on_progress(ArchiveProgress(files_done, files_total, bytes_done, bytes_total))
+    return len(planned)
+
+
+def write_tar(target: Path, members: Iterable[Member], archive_format: str = "tar",
+              on_progress: Optional[ProgressCallback] = None, workers: Optional[int] = None,
+              level: Optional[int] = None) -> int:
+    """
+    流式写入tar归档 (tar / gztar / bztar / zstdtar)
+
+    Returns:
+        写入的成员数
+    """
+    members = list(members)
+    files_total = sum(1 for m in members if not m.is_dir)
+    bytes_total = sum(os.path.getsize(m.path) for m in members if not m.is_dir)
+    files_done = bytes_done = 0
+
+    def add_all(tf: tarfile.TarFile) -> None:
+        nonlocal files_done, bytes_done
+        for member in members:
+            tf.add(member.path, arcname=member.arcname, recursive=False)
+            if not member.is_dir:
+                files_done += 1
+                bytes_done += os.path.getsize(member.path)
+                if on_progress:
+                    on_progress(ArchiveProgress(files_done, files_total, bytes_done, bytes_total))
+
+    if archive_format == "zstdtar":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("tar.zst 格式需要安装 zstandard")
+        level = ARCHIVE_ZSTD_LEVEL if level is None else level
+        compressor = zstandard.ZstdCompressor(level=level, threads=workers or ARCHIVE_WORKERS)
+        with open(target, 'wb') as fp:
+            with compressor.stream_writer(fp, closefd=False) as zf, tarfile.open(fileobj=zf, mode='w|') as tf:
+                add_all(tf)
+    else:
+        with tarfile.open(target, TAR_MODES[archive_format]) as tf:
+            add_all(tf)
+    return len(members)
+
+
+def write_archive(target: Path, members: Iterable[Member], archive_format: str,
+                  on_progress: Optional[ProgressCallback] = None) -> int:
+    """按格式写入归档"""
+    if archive_format == "zip":
+        return write_zip(target, members, on_progress)
+    if archive_format == "zstdtar" or archive_format in TAR_MODES:
+        return write_tar(target, members, archive_format, on_progress)
+    raise ValueError(f"不支持的归档格式 '{archive_format}'")
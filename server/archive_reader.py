@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档的读取：成员索引、列表和解压
+- 成员索引只读取zip的中央目录或tar的成员头，按 (路径, mtime_ns, 大小) 缓存；
+  成员名规范化 (\\ 转为 /) 后排序，指定成员时精确匹配查字典，目录前缀用二分查找定位区间，
+  耗时与请求数和命中数相关，而不是 成员数 × 请求数
+- zip成员按大小分给多个线程并行解压，每个线程使用独立的文件句柄；目录先顺序创建。
+  每个目标路径都校验在目标目录之内 (拒绝 .. 和绝对路径，不穿过符号链接写出目录)
+- tar (含 tar.gz/bz2/xz 和 tar.zst) 单遍顺序解压选中的成员，使用 tarfile 的 'data' 过滤器；
+  过滤器不可用时自行检查：拒绝目标在目标目录之外的符号链接/硬链接和设备文件，去掉特殊权限位和属主
+"""
+
+import os
+import copy
+import bisect
+import shutil
+import tarfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from archive_engine import ARCHIVE_WORKERS, ZSTD_AVAILABLE, ArchiveProgress
+
+if ZSTD_AVAILABLE:
+    import zstandard
+
+# --- 归档读取配置 ---
+ARCHIVE_INDEX_CACHE_SIZE = 16            # 缓存成员索引的归档数
+EXTRACT_COPY_BUFFER = 1 << 20
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_TAR_FILTER = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+_TAR_FILTER_ERROR = getattr(tarfile, 'FilterError', ())
+
+
+class ArchiveFormatError(ValueError):
+    """无法识别的归档格式"""
+
+
+class ArchiveMember(NamedTuple):
+    """归档中的一个成员"""
+    name: str              # 规范化的名称 (/分隔，目录不带末尾的/)
+    raw_name: str          # 归档中的原始名称
+    is_dir: bool
+    size: int
+    compress_size: Optional[int]    # tar成员没有单独的压缩大小
+
+
+def archive_kind(path: Path) -> Optional[str]:
+    """'zip' / 'tar' / 'zstdtar'，无法识别时返回None"""
+    name = path.name.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    with open(path, 'rb') as f:
+        if f.read(4) == ZSTD_MAGIC:
+            return 'zstdtar'
+    if tarfile.is_tarfile(path):
+        return 'tar'
+    if zipfile.is_zipfile(path):
+        return 'zip'
+    return None
+
+
+def _normalize(name: str) -> str:
+    return name.replace('\\', '/').rstrip('/')
+
+
+class _ZstdTar:
+    """以流模式打开的tar.zst"""
+
+    def __init__(self, path: Path):
+        if not ZSTD_AVAILABLE:
+            raise ArchiveFormatError("tar.zst 格式需要安装 zstandard")
+        self._fp = open(path, 'rb')
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._fp)
+        self.tar = tarfile.open(fileobj=self._reader, mode='r|')
+
+    def __enter__(self) -> tarfile.TarFile:
+        return self.tar
+
+    def __exit__(self, *exc) -> None:
+        self.tar.close()
+        self._reader.close()
+        self._fp.close()
+
+
+def open_tar(path: Path, kind: str):
+    """打开tar归档 (with语句中使用)；tar.zst只能顺序读取"""
+    if kind == 'zstdtar':
+        return _ZstdTar(path)
+    return tarfile.open(path, 'r:*')
+
+
+class MemberIndex:
+    """一个归档的成员索引"""
+
+    def __init__(self, kind: str, members: List[ArchiveMember]):
+        self.kind = kind
+        self.members = sorted(members, key=lambda m: m.name)
+        self.names = [m.name for m in self.members]
+        self.by_name: Dict[str, ArchiveMember] = {m.name: m for m in self.members}
+
+    def under(self, prefix: str) -> List[ArchiveMember]:
+        """名称以 prefix/ 开头的成员 (prefix为空时返回全部)"""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return list(self.members)
+        # '0' 是 '/' 之后的下一个字符：[prefix/, prefix0) 恰好覆盖所有 prefix/ 开头的名称
+        lo = bisect.bisect_left(self.names, prefix + '/')
+        hi = bisect.bisect_left(self.names, prefix + '0', lo)
+        return self.members[lo:hi]
+
+    def select(self, queries: Iterable[str]) -> Tuple[List[ArchiveMember], List[str]]:
+        """
+        按请求选择成员：精确匹配成员名，否则作为目录前缀
+
+        Returns:
+            (选中的成员 (去重，按名称排序), 未匹配到任何成员的请求)
+        """
+        selected: Dict[str, ArchiveMember] = {}
+        missing = []
+        for query in queries:
+            name = _normalize(query)
+            exact = self.by_name.get(name)
+            matched = self.under(name)
+            if exact is not None:
+                selected[exact.name] = exact
+            for m in matched:
+                selected[m.name] = m
+            if exact is None and not matched:
+                missing.append(query)
+        return [selected[name] for name in sorted(selected)], missing
+
+
+def _read_members(path: Path, kind: str) -> List[ArchiveMember]:
+    if kind == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            return [ArchiveMember(_normalize(i.filename), i.filename, i.is_dir(), i.file_size, i.compress_size)
+                    for i in zf.infolist()]
+    with open_tar(path, kind) as tf:
+        return [ArchiveMember(_normalize(t.name), t.name, t.isdir(), t.size, None) for t in tf]
+
+
+_cache: 'OrderedDict[str, Tuple[int, int, MemberIndex]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def member_index(path: Path) -> MemberIndex:
+    """
+    归档的成员索引 (按 mtime 和大小校验缓存)
+
+    Raises:
+        ArchiveFormatError: 无法识别的归档格式
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _cache.move_to_end(key)
+            return cached[2]
+    kind = archive_kind(Path(key))
+    if kind is None:
+        raise ArchiveFormatError(f"无法识别的归档文件格式或文件 '{path.name}' 已损坏")
+    index = MemberIndex(kind, _read_members(Path(key), kind))
+    with _cache_lock:
+        _cache[key] = (st.st_mtime_ns, st.st_size, index)
+        _cache.move_to_end(key)
+        while len(_cache) > ARCHIVE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def safe_target(dest: Path, name: str) -> Optional[Path]:
+    """成员在目标目录 (已解析的真实路径) 中的路径；名称含 .. 或为绝对路径时返回None"""
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith(('/', '\\')) or (parts and ':' in parts[0]) or '..' in parts:
+        return None
+    parts = [p for p in parts if p not in ('', '.')]
+    return dest.joinpath(*parts) if parts else None
+
+
+def _inside(dest: Path, path: Path) -> bool:
+    real = os.path.realpath(path)
+    return real == str(dest) or real.startswith(str(dest) + os.sep)
+
+
+def _extract_zip_files(archive: Path, dest: Path, members: List[ArchiveMember],
+                       on_file: Callable[[ArchiveMember], None]) -> None:
+    """一个线程解压分给它的zip文件成员"""
+    with zipfile.ZipFile(archive) as zf:
+        for member in members:
+            target = safe_target(dest, member.raw_name)
+            if not _inside(dest, target.parent):
+                raise ValueError(f"成员 '{member.raw_name}' 的目标路径不在解压目录中")
+            if target.is_symlink():
+                target.unlink()
+            with zf.open(member.raw_name) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, EXTRACT_COPY_BUFFER)
+            on_file(member)
+
+
+def extract_zip(archive: Path, dest: Path, members: List[ArchiveMember],
+                on_progress: Optional[Callable[[ArchiveProgress], None]] = None,
+                workers: Optional[int] = None) -> Tuple[List[str], List[str]]:
+    """
+    并行解压zip成员到dest
+
+    Returns:
+        (解压的成员名, 因路径不安全跳过的成员名)
+    """
+    dest = Path(os.path.realpath(dest))
+    workers = workers or ARCHIVE_WORKERS
+    extracted, skipped = [], []
+    files = []
+    for member in members:
+        target = safe_target(dest, member.raw_name)
+        if target is None or not _inside(dest, target if member.is_dir else target.parent):
+            skipped.append(member.raw_name)
+            continue
+        if member.is_dir:
+            target.mkdir(parents=True, exist_ok=True)
+            extracted.append(member.raw_name)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            files.append(member)
+
+    # 按大小从大到小轮流分配，使各线程的工作量接近
+    files.sort(key=lambda m: m.size, reverse=True)
+    shards = [files[i::workers] for i in range(workers) if files[i::workers]]
+    files_total, bytes_total = len(files), sum(m.size for m in files)
+    done = {'files': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    def on_file(member: ArchiveMember) -> None:
+        with lock:
+            done['files'] += 1
+            done['bytes'] += member.size
+            extracted.append(member.raw_name)
+            if on_progress:
+                on_progress(ArchiveProgress(done['files'], files_total, done['bytes'], bytes_total))
+
+    if len(shards) <= 1:
+        for shard in shards:
+            _extract_zip_files(archive, dest, shard, on_file)
+    else:
+        with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='extract') as pool:
+            for future in [pool.submit(_extract_zip_files, archive, dest, shard, on_file) for shard in shards]:
+                future.result()
+    return extracted, skipped
+
+
+def _checked_tar_member(dest: Path, info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+    """
+    没有 'data' 过滤器时的等价检查 (旧版本Python)：返回可以解压的成员副本，不安全时返回None
+    """
+    if info.isdev():
+        return None
+    if info.issym() or info.islnk():
+        # 符号链接相对于成员所在目录，硬链接相对于解压根目录
+        base = (dest / info.name).parent if info.issym() else dest
+        if os.path.isabs(info.linkname) or not _inside(dest, base / info.linkname):
+            return None
+    info = copy.copy(info)
+    info.mode &= 0o755
+    info.uid, info.gid, info.uname, info.gname = os.getuid(), os.getgid(), '', ''
+    return info
+
+
+def extract_tar(archive: Path, kind: str, dest: Path, members: Optional[List[ArchiveMember]] = None,
+                on_progress: Optional[Callable[[ArchiveProgress], None]] = None) -> Tuple[List[str], List[str]]:
+    """
+    单遍解压tar成员 (members为None时解压全部)
+
+    Returns:
+        (解压的成员名, 因路径不安全跳过的成员名)
+    """
+    dest = Path(os.path.realpath(dest))
+    wanted = None if members is None else {m.raw_name for m in members}
+    files_total = len(members) if members is not None else 0
+    bytes_total = sum(m.size for m in members) if members is not None else 0
+    extracted, skipped = [], []
+    bytes_done = 0
+    with open_tar(archive, kind) as tf:
+        for info in tf:
+            if wanted is not None and info.name not in wanted:
+                continue
+            if safe_target(dest, info.name) is None:
+                skipped.append(info.name)
+                continue
+            if not _TAR_FILTER:
+                checked = _checked_tar_member(dest, info)
+                if checked is None:
+                    skipped.append(info.name)
+                    continue
+                info = checked
+            try:
+                tf.extract(info, dest, **_TAR_FILTER)
+            except _TAR_FILTER_ERROR:
+                skipped.append(info.name)
+                continue
+            extracted.append(info.name)
+            bytes_done += info.size
+            if on_progress:
+                on_progress(ArchiveProgress(len(extracted), files_total, bytes_done, bytes_total))
+    return extracted, skipped
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Celery Worker执行模式基准测试
+对比 prefork 与 gevent (I/O模式) 下单个Worker的LLM任务吞吐量
+
+用法:
+    cd server
+    python bench_worker_pool.py --tasks 400 --latency 1.0 --modes prefork:4,gevent:200
+
+需要可用的Redis (REDIS_URL)。脚本会启动一个模拟的OpenAI兼容上游服务，
+依次以各执行模式启动一个Worker进程处理同一批 process_ai_message 任务。
+"""
+
+import os
+import sys
+import time
+import uuid
+import json
+import asyncio
+import argparse
+import threading
+import statistics
+import subprocess
+
+from aiohttp import web
+
+
+def start_mock_upstream(host: str, port: int, latency: float) -> None:
+    """在后台线程中启动模拟的 /v1/chat/completions 服务，每个请求延迟 latency 秒"""
+
+    async def completions(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": "ok"}}]
+        })
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port, backlog=4096).start()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    time.sleep(0.5)
+
+
+def start_worker(pool: str, concurrency: int, queue: str, node_name: str) -> subprocess.Popen:
+    """启动一个只消费基准测试队列的Worker进程"""
+    cmd = [
+        sys.executable, '-m', 'celery', '-A', 'tasks', 'worker',
+        f'--pool={pool}', f'--concurrency={concurrency}',
+        '-Q', queue, '-n', node_name, '--loglevel=warning', '--without-gossip', '--without-mingle'
+    ]
+    return subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_worker(celery_app, node_name: str, timeout: float = 60.0) -> None:
+    """等待Worker响应ping"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if celery_app.control.ping(destination=[node_name], timeout=1.0):
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"Worker {node_name} 启动超时")
+
+
+def run_mode(pool: str, concurrency: int, num_tasks: int, upstream_url: str) -> dict:
+    """以指定执行模式处理 num_tasks 个任务，返回吞吐量统计"""
+    from tasks import celery_app, process_ai_message
+
+    queue = f"bench-{pool}-{uuid.uuid4().hex[:8]}"
+    node_name = f"{queue}@bench"
+    worker = start_worker(pool, concurrency, queue, node_name)
+    try:
+        wait_for_worker(celery_app, node_name)
+
+        task_data = {
+            "message": "benchmark",
+            "channel_id": "bench",
+            "api_config": {"endpoint": upstream_url, "api_key": "bench", "model": "bench"}
+        }
+        started = time.perf_counter()
+        submitted = [(time.perf_counter(), process_ai_message.apply_async(args=[task_data], queue=queue))
+                     for _ in range(num_tasks)]
+
+        latencies = []
+        failures = 0
+        for submit_time, result in submitted:
+            payload = result.get(timeout=600)
+            latencies.append(time.perf_counter() - submit_time)
+            if not payload.get('success'):
+                failures += 1
+        elapsed = time.perf_counter() - started
+
+        return {
+            "mode": f"{pool}:{concurrency}",
+            "tasks": num_tasks,
+            "failures": failures,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_s": round(num_tasks / elapsed, 2),
+            "p50_s": round(statistics.median(latencies), 3),
+            "p95_s": round(statistics.quantiles(latencies, n=20)[-1], 3) if len(latencies) >= 20 else None
+        }
+    finally:
+        worker.terminate()
+        try:
+            worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Celery Worker执行模式吞吐量基准测试")
+    parser.add_argument('--tasks', type=int, default=400, help="每种模式提交的任务数")
+    parser.add_argument('--latency', type=float, default=1.0, help="模拟上游每次调用的延迟(秒)")
+    parser.add_argument('--modes', default="prefork:4,gevent:200", help="逗号分隔的 pool:concurrency 列表")
+    parser.add_argument('--port', type=int, default=18080, help="模拟上游服务端口")
+    args = parser.parse_args()
+
+    start_mock_upstream('127.0.0.1', args.port, args.latency)
+    upstream_url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    for mode in args.modes.split(','):
+        pool, concurrency = mode.split(':')
+        print(f"运行模式 {pool} (concurrency={concurrency}) ...")
+        results.append(run_mode(pool, int(concurrency), args.tasks, upstream_url))
+        print(json.dumps(results[-1], ensure_ascii=False))
+
+    print("\n模式                吞吐量(任务/秒)   p50(秒)   p95(秒)   失败")
+    for r in results:
+        print(f"{r['mode']:<20}{r['throughput_per_s']:<18}{r['p50_s']:<10}{str(r['p95_s']):<10}{r['failures']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis负载编解码
+超过阈值的负载经zstd (可选依赖) 或zlib压缩，并以两字节头部标记算法；
+JSON文本不会以 \\0 开头，因此未压缩的负载保持原样，旧数据和未压缩数据可以直接读取。
+发布/订阅消息、结果后端和Redis缓存都通过这里编解码
+"""
+
+import os
+import json
+import zlib
+import threading
+from typing import Any, Union
+
+# zstandard（可选依赖）
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    zstandard = None
+
+# --- 编解码配置 ---
+CODEC_THRESHOLD = int(os.getenv('CODEC_THRESHOLD', '1024'))          # 超过该字节数压缩
+CODEC_ALGORITHM = os.getenv('CODEC_ALGORITHM', 'zstd' if ZSTD_AVAILABLE else 'zlib').lower()
+CODEC_LEVEL = int(os.getenv('CODEC_LEVEL', '3'))
+
+ZLIB_HEADER = b'\x00z'
+ZSTD_HEADER = b'\x00s'
+
+if CODEC_ALGORITHM == 'zstd' and not ZSTD_AVAILABLE:
+    CODEC_ALGORITHM = 'zlib'
+
+# ZstdCompressor/ZstdDecompressor 对象不能被多个线程同时使用，每个线程 (gevent补丁后为每个greenlet) 各建一份
+_zstd_local = threading.local()
+
+
+def _zstd_compressor() -> 'zstandard.ZstdCompressor':
+    """当前线程的zstd压缩器"""
+    compressor = getattr(_zstd_local, 'compressor', None)
+    if compressor is None:
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=CODEC_LEVEL)
+    return compressor
+
+
+def _zstd_decompressor() -> 'zstandard.ZstdDecompressor':
+    """当前线程的zstd解压器"""
+    decompressor = getattr(_zstd_local, 'decompressor', None)
+    if decompressor is None:
+        decompressor = _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+def encode(data: bytes, threshold: int = CODEC_THRESHOLD, algorithm: str = CODEC_ALGORITHM) -> bytes:
+    """超过阈值且压缩后更小时返回带头部的压缩数据，否则原样返回"""
+    if len(data) <= threshold:
+        return data
+    if algorithm == 'zstd' and ZSTD_AVAILABLE:
+        packed = ZSTD_HEADER + _zstd_compressor().compress(data)
+    else:
+        packed = ZLIB_HEADER + zlib.compress(data, min(max(CODEC_LEVEL, 1), 9))
+    return packed if len(packed) < len(data) else data
+
+
+def decode(data: Union[bytes, str]) -> bytes:
+    """还原 encode() 的输出"""
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if data.startswith(ZLIB_HEADER):
+        return zlib.decompress(data[len(ZLIB_HEADER):])
+    if data.startswith(ZSTD_HEADER):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("收到zstd压缩的数据，但未安装zstandard")
+        # 流式压缩的帧头不一定包含原始长度，使用流式接口解压
+        return _zstd_decompressor().decompressobj().decompress(data[len(ZSTD_HEADER):])
+    return data
+
+
+def dumps(obj: Any, threshold: int = CODEC_THRESHOLD) -> bytes:
+    """序列化为JSON并按阈值压缩"""
+    return encode(json.dumps(obj, ensure_ascii=False).encode('utf-8'), threshold)
+
+
+def loads(data: Union[bytes, str, None]) -> Any:
+    """解压并解析JSON，None原样返回"""
+    if data is None:
+        return None
+    return json.loads(decode(data).decode('utf-8'))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游 chat/completions 调用
+提供 on_token 时以SSE流式请求，逐段回调token增量；上游不支持流式而直接返回JSON时按普通响应解析。
+Worker的默认智能体、基础API和自定义API都通过这里调用上游
+"""
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+
+def extract_message_content(result: Dict[str, Any]) -> str:
+    """从非流式响应中提取回复内容"""
+    if result.get('choices') and result['choices'][0].get('message'):
+        return result['choices'][0]['message']['content']
+    else:
+        raise Exception("API响应格式异常")
+
+
+def post_chat_completion(client: httpx.Client, endpoint: str, headers: Dict[str, str], data: Dict[str, Any],
+                         on_token: Optional[Callable[[str], None]] = None) -> str:
+    """发送chat/completions请求并返回完整的回复内容"""
+    if on_token is None:
+        response = client.post(endpoint, headers=headers, json=data)
+        response.raise_for_status()
+        return extract_message_content(response.json())
+
+    parts = []
+    with client.stream('POST', endpoint, headers=headers, json={**data, 'stream': True}) as response:
+        if response.is_error:
+            response.read()
+        response.raise_for_status()
+
+        if response.headers.get('content-type', '').startswith('application/json'):
+            response.read()
+            return extract_message_content(response.json())
+
+        for line in response.iter_lines():
+            if not line.startswith('data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == '[DONE]':
+                break
+            choices = json.loads(payload).get('choices') or [{}]
+            delta = (choices[0].get('delta') or {}).get('content')
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+
+    if not parts:
+        raise Exception("API响应格式异常")
+    return ''.join(parts)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件差异比较
+- 每一行映射为整数ID (相同内容的行共享ID)，之后只比较整数
+- patience diff：剥离公共前后缀，以两侧各只出现一次的行为锚点 (最长递增子序列)，在锚点之间递归；
+  没有锚点的小区间交给 difflib.SequenceMatcher，过大的区间直接作为整体替换，耗时与行数近似线性
+- 统一格式输出，上下文行数可配置，超过 max_lines 行时截断
+"""
+
+import os
+import bisect
+import difflib
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
+
+# --- 差异比较配置 ---
+DIFF_MAX_OUTPUT_LINES = int(os.getenv('DIFF_MAX_OUTPUT_LINES', '2000'))   # 默认最多输出的差异行数
+DIFF_FALLBACK_CELLS = 1_000_000          # 无锚点区间 (行数乘积) 不超过该值时做精细比较
+
+Block = Tuple[int, int, int]                  # (a起点, b起点, 长度)
+Opcode = Tuple[str, int, int, int, int]       # 与 difflib 的 opcode 相同
+
+
+def intern_lines(a: List[str], b: List[str]) -> Tuple[List[int], List[int]]:
+    """把两侧的行映射为整数ID"""
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in a],
+            [ids.setdefault(line, len(ids)) for line in b])
+
+
+def _unique_anchors(a: List[int], alo: int, ahi: int, b: List[int], blo: int, bhi: int) -> List[Tuple[int, int]]:
+    """两侧各只出现一次的行中，按顺序一致的最长序列 (patience sorting)"""
+    count_a = Counter(a[alo:ahi])
+    count_b = Counter(b[blo:bhi])
+    pos_b = {b[j]: j for j in range(blo, bhi) if count_b[b[j]] == 1}
+    pairs = [(i, pos_b[a[i]]) for i in range(alo, ahi) if count_a[a[i]] == 1 and a[i] in pos_b]
+    if not pairs:
+        return []
+    # 按a顺序排列的pairs中，b下标的最长递增子序列
+    tails: List[int] = []           # 长度为k+1的递增子序列的最小结尾 (b下标)
+    tail_index: List[int] = []      # 对应的pairs下标
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        prev[k] = tail_index[pos - 1] if pos else -1
+    result = []
+    k = tail_index[-1]
+    while k != -1:
+        result.append(pairs[k])
+        k = prev[k]
+    result.reverse()
+    return result
+
+
+def matching_blocks(a: List[int], b: List[int]) -> List[Block]:
+    """两个整数序列的匹配块，按位置排序"""
+    blocks: List[Block] = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # 公共前缀
+        start = 0
+        while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+            start += 1
+        if start:
+            blocks.append((alo, blo, start))
+            alo += start
+            blo += start
+        # 公共后缀
+        end = 0
+        while alo < ahi - end and blo < bhi - end and a[ahi - end - 1] == b[bhi - end - 1]:
+            end += 1
+        if end:
+            blocks.append((ahi - end, bhi - end, end))
+            ahi -= end
+            bhi -= end
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            prev_i, prev_j = alo, blo
+            for i, j in anchors:
+                stack.append((prev_i, i, prev_j, j))
+                blocks.append((i, j, 1))
+                prev_i, prev_j = i + 1, j + 1
+            stack.append((prev_i, ahi, prev_j, bhi))
+        elif (ahi - alo) * (bhi - blo) <= DIFF_FALLBACK_CELLS:
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            blocks.extend((alo + i, blo + j, size) for i, j, size in matcher.get_matching_blocks() if size)
+        # 否则整个区间作为替换
+    blocks.sort()
+    merged: List[Block] = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def opcodes(a: List[int], b: List[int]) -> List[Opcode]:
+    """由匹配块生成 difflib 风格的操作序列"""
+    codes: List[Opcode] = []
+    i = j = 0
+    for ai, bj, size in matching_blocks(a, b) + [(len(a), len(b), 0)]:
+        if i < ai and j < bj:
+            codes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            codes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            codes.append(('insert', i, ai, j, bj))
+        if size:
+            codes.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return codes
+
+
+def grouped_opcodes(codes: List[Opcode], n: int) -> Iterator[List[Opcode]]:
+    """按上下文行数把操作分组为hunk (与 SequenceMatcher.get_grouped_opcodes 相同)"""
+    codes = list(codes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > n + n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    return f"{start if not length else start + 1},{length}"
+
+
+def _line(prefix: str, line: str) -> str:
+    return prefix + line.rstrip('\r\n') + '\n'
+
+
+def unified_diff(a: List[str], b: List[str], fromfile: str, tofile: str, n: int = 3,
+                 max_lines: Optional[int] = None) -> Tuple[str, bool]:
+    """
+    统一格式的差异
+
+    Returns:
+        (差异文本, 是否因max_lines截断)；内容相同时差异文本为空
+    """
+    max_lines = DIFF_MAX_OUTPUT_LINES if max_lines is None else max_lines
+    a_ids, b_ids = intern_lines(a, b)
+    out: List[str] = []
+    for group in grouped_opcodes(opcodes(a_ids, b_ids), n):
+        if not out:
+            out += [f"--- {fromfile}\n", f"+++ {tofile}\n"]
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                out.extend(_line(' ', line) for line in a[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                out.extend(_line('-', line) for line in a[i1:i2])
+            if tag in ('replace', 'insert'):
+                out.extend(_line('+', line) for line in b[j1:j2])
+        if len(out) > max_lines:
+            return ''.join(out[:max_lines]), True
+    return ''.join(out), False
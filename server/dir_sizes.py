@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录大小聚合
+- 每个目录保存自身直接条目的统计 (文件大小之和、文件数、子目录数) 和整个子树的合计；
+  首次查询时用线程池按层并行读取目录 (目录条目来自沙箱索引)，自底向上求合计
+- 本进程的写操作通过 on_change() 通知：只重新统计父目录的直接条目，新出现的子目录整体统计，
+  消失的子目录连同子树丢弃，合计的变化量沿祖先目录向上累加，不需要重新遍历
+- 外部修改：超过 DIR_SIZE_REVALIDATE_SECONDS 未校验的子树在查询时逐个目录校验，
+  只重新统计mtime (沙箱索引的代) 变化的目录，其余目录直接复用统计，只对目录stat
+- 原地修改文件内容不改变目录mtime：目录的文件超过 DIR_SIZE_RESTAT_SECONDS 未重新stat时，
+  在校验中顺带重新stat；查询时指定 refresh=True 则立即重新stat整个子树
+"""
+
+import os
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sandbox_index import SandboxIndex
+
+# --- 目录大小配置 ---
+DIR_SIZE_REVALIDATE_SECONDS = float(os.getenv('DIR_SIZE_REVALIDATE_SECONDS', '2'))   # 合计的校验间隔(秒)
+DIR_SIZE_RESTAT_SECONDS = float(os.getenv('DIR_SIZE_RESTAT_SECONDS', '300'))        # 重新stat文件的间隔(秒)
+DIR_SIZE_WORKERS = int(os.getenv('DIR_SIZE_WORKERS', '8'))                           # 并行读取目录的线程数
+
+
+class DirTotals(NamedTuple):
+    """目录统计"""
+    total_size: int
+    file_count: int
+    folder_count: int
+
+    def __add__(self, other: 'DirTotals') -> 'DirTotals':
+        return DirTotals(self.total_size + other.total_size, self.file_count + other.file_count,
+                         self.folder_count + other.folder_count)
+
+    def __sub__(self, other: 'DirTotals') -> 'DirTotals':
+        return DirTotals(self.total_size - other.total_size, self.file_count - other.file_count,
+                         self.folder_count - other.folder_count)
+
+
+ZERO = DirTotals(0, 0, 0)
+
+# (目录, 条目名, 是否符号链接) -> 是否计入
+AcceptCallback = Callable[[Path, str, bool], bool]
+
+
+class _Node:
+    __slots__ = ('generation', 'own', 'subdirs', 'totals', 'validated_at', 'restated_at')
+
+    def __init__(self, generation, own: DirTotals, subdirs: Tuple[str, ...]):
+        self.generation = generation
+        self.own = own                  # 直接条目的统计
+        self.subdirs = subdirs          # 需要向下统计的子目录 (不含符号链接)
+        self.totals = own               # 整个子树的合计
+        self.validated_at = 0.0
+        self.restated_at = time.monotonic()     # 直接文件的大小最近一次读取的时间
+
+
+def _key(path) -> str:
+    return os.path.abspath(path)
+
+
+def _file_size(path: Path, default: int) -> int:
+    """文件的当前大小 (跟随符号链接，失效的链接取链接本身)；文件已消失时返回default"""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return default
+
+
+class DirSizeIndex:
+    """目录大小聚合索引"""
+
+    def __init__(self, index: SandboxIndex, accept: Optional[AcceptCallback] = None,
+                 workers: Optional[int] = None):
+        self.index = index
+        self.accept = accept
+        self.workers = workers or DIR_SIZE_WORKERS
+        self._lock = threading.RLock()
+        self._nodes: Dict[str, _Node] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # --- 查询 ---
+    def totals(self, path: Path, revalidate_seconds: Optional[float] = None, refresh: bool = False) -> DirTotals:
+        """
+        目录子树的合计 (不含目录自身)；refresh时重新stat子树中的所有文件
+
+        Raises:
+            OSError: 目录不存在或无法读取
+        """
+        revalidate_seconds = DIR_SIZE_REVALIDATE_SECONDS if revalidate_seconds is None else revalidate_seconds
+        key = _key(path)
+        with self._lock:
+            node = self._nodes.get(key)
+            if node is not None and not refresh and time.monotonic() - node.validated_at < revalidate_seconds:
+                return node.totals
+        self.index.listdir(path)    # 目录不存在时抛出OSError
+        old_totals = node.totals if node is not None else None
+        self._refresh_subtree(Path(key), restat=refresh)
+        with self._lock:
+            totals = self._nodes[key].totals
+        if old_totals is not None:
+            # 校验中发现的外部变化同样计入已统计的祖先
+            self._propagate(Path(key), totals - old_totals)
+        return totals
+
+    # --- 增量更新 ---
+    def on_change(self, *paths: Path) -> None:
+        """本进程修改了这些路径 (须在沙箱索引的 invalidate 之后调用)"""
+        # 同一目录下的多个路径 (例如批量操作) 只重新统计一次该目录
+        ancestors: Dict[str, Path] = {}
+        rebuild: Dict[str, Path] = {}
+        with self._lock:
+            if not self._nodes:
+                return
+            for path in paths:
+                path = Path(_key(path))
+                if _key(path) in self._nodes:
+                    rebuild[_key(path)] = path
+                # 最近的已统计祖先：中间目录是新建的时，由它发现新子目录并整体统计
+                ancestor = path.parent
+                while _key(ancestor) not in self._nodes and ancestor.parent != ancestor:
+                    ancestor = ancestor.parent
+                if _key(ancestor) in self._nodes:
+                    ancestors[_key(ancestor)] = ancestor
+        for ancestor in ancestors.values():
+            self._update_dir(ancestor)
+        # 路径本身是已统计的目录 (例如解压到该目录)：其子树可能整体变化
+        for path in rebuild.values():
+            if os.path.isdir(path) and not os.path.islink(path):
+                self._rebuild(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._nodes.clear()
+
+    # --- 内部实现 ---
+    def _scan(self, path: Path, restat: bool = False) -> Optional[_Node]:
+        """统计目录的直接条目；restat时文件大小重新stat而不用沙箱索引中的值；无法读取时返回None"""
+        try:
+            entries = self.index.listdir(path)
+        except OSError:
+            return None
+        generation = self.index.generation(path)
+        size = files = dirs = 0
+        subdirs = []
+        for entry in entries:
+            if self.accept is not None and not self.accept(path, entry.name, entry.is_symlink):
+                continue
+            if entry.is_dir:
+                dirs += 1
+                if not entry.is_symlink:
+                    subdirs.append(entry.name)
+            else:
+                size += _file_size(path / entry.name, entry.size) if restat else entry.size
+                files += 1
+        return _Node(generation, DirTotals(size, files, dirs), tuple(subdirs))
+
+    def _refresh_one(self, path: Path, force: bool = False, restat: bool = False) -> Optional[_Node]:
+        """
+        校验一个目录：代变化时重新统计；代未变化时复用已有统计，
+        除非指定restat或文件超过 DIR_SIZE_RESTAT_SECONDS 未重新stat
+        (沙箱索引按目录mtime缓存的文件大小发现不了原地修改)
+        """
+        key = _key(path)
+        with self._lock:
+            node = self._nodes.get(key)
+        unchanged = False
+        if node is not None and not force:
+            try:
+                self.index.listdir(path)        # 目录mtime变化时沙箱索引重新扫描，代随之改变
+            except OSError:
+                return None
+            unchanged = self.index.generation(path) == node.generation and node.generation is not None
+            if unchanged and not restat and time.monotonic() - node.restated_at < DIR_SIZE_RESTAT_SECONDS:
+                return node
+        fresh = self._scan(path, restat=unchanged)
+        with self._lock:
+            if fresh is None:
+                self._nodes.pop(key, None)
+            else:
+                self._nodes[key] = fresh
+        return fresh
+
+    def _map(self, paths: List[Path], restat: bool) -> List[Optional[_Node]]:
+        if len(paths) == 1:
+            return [self._refresh_one(paths[0], restat=restat)]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dir-sizes')
+            executor = self._executor
+        return list(executor.map(functools.partial(self._refresh_one, restat=restat), paths))
+
+    def _refresh_subtree(self, root: Path, restat: bool = False) -> None:
+        """逐层并行校验子树中的每个目录，再自底向上求合计"""
+        visited: List[Tuple[Path, _Node]] = []
+        frontier = [root]
+        while frontier:
+            next_frontier = []
+            for path, node in zip(frontier, self._map(frontier, restat)):
+                if node is None:
+                    continue
+                visited.append((path, node))
+                next_frontier.extend(path / name for name in node.subdirs)
+            frontier = next_frontier
+        now = time.monotonic()
+        with self._lock:
+            # 按层遍历的逆序：子目录总在父目录之前求和
+            for path, node in reversed(visited):
+                totals = node.own
+                for name in node.subdirs:
+                    child = self._nodes.get(_key(path / name))
+                    if child is not None:
+                        totals = totals + child.totals
+                node.totals = totals
+                node.validated_at = now
+            self._drop_stale(root, {_key(path) for path, _ in visited})
+
+    # 以下两个方法须持有 self._lock
+    def _drop_stale(self, root: Path, keep: set) -> None:
+        prefix = _key(root) + os.sep
+        for key in [k for k in self._nodes if k.startswith(prefix) and k not in keep]:
+            del self._nodes[key]
+
+    def _drop_subtree(self, path: Path) -> None:
+        key = _key(path)
+        prefix = key + os.sep
+        for cached in [k for k in self._nodes if k == key or k.startswith(prefix)]:
+            del self._nodes[cached]
+
+    def _propagate(self, path: Path, delta: DirTotals) -> None:
+        """把合计的变化量累加到path的所有已统计的祖先"""
+        if delta == ZERO:
+            return
+        with self._lock:
+            parent = path.parent
+            while parent != path:
+                node = self._nodes.get(_key(parent))
+                if node is None:
+                    break
+                node.totals = node.totals + delta
+                path, parent = parent, parent.parent
+
+    def _update_dir(self, path: Path) -> None:
+        """目录的直接条目变化：重新统计该目录，处理增删的子目录，向上传播变化量"""
+        key = _key(path)
+        with self._lock:
+            old = self._nodes.get(key)
+        if old is None:
+            return
+        new = self._refresh_one(path, force=True)
+        if new is None:
+            with self._lock:
+                self._drop_subtree(path)
+            self._propagate(path, ZERO - old.totals)
+            return
+        for name in set(old.subdirs) - set(new.subdirs):
+            with self._lock:
+                self._drop_subtree(path / name)
+        for name in set(new.subdirs) - set(old.subdirs):
+            self._refresh_subtree(path / name)
+        with self._lock:
+            totals = new.own
+            for name in new.subdirs:
+                child = self._nodes.get(_key(path / name))
+                if child is not None:
+                    totals = totals + child.totals
+            new.totals = totals
+            new.validated_at = old.validated_at
+        self._propagate(path, new.totals - old.totals)
+
+    def _rebuild(self, path: Path) -> None:
+        """重新统计整个子树并向上传播变化量"""
+        with self._lock:
+            old = self._nodes.get(_key(path))
+            old_totals = old.totals if old is not None else ZERO
+            self._drop_subtree(path)
+        self._refresh_subtree(path)
+        with self._lock:
+            node = self._nodes.get(_key(path))
+            new_totals = node.totals if node is not None else ZERO
+        self._propagate(path, new_totals - old_totals)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天任务分发
+根据路由策略将聊天请求交给Celery Worker处理，或在API进程内执行
+"""
+
+import os
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- 分发配置 ---
+# always: 有Redis时总是交给Worker; never: 总是进程内执行; adaptive: 进程内负载达到上限后交给Worker
+CHAT_DISPATCH_MODE = os.getenv('CHAT_DISPATCH_MODE', 'adaptive').lower()
+CHAT_DISPATCH_LOCAL_LIMIT = int(os.getenv('CHAT_DISPATCH_LOCAL_LIMIT', '4'))
+
+DISPATCH_MODES = ('always', 'never', 'adaptive')
+
+
+class ChatDispatcher:
+    """聊天任务分发器"""
+
+    def __init__(self,
+                 enqueue: Callable[[Dict[str, Any]], Awaitable[str]],
+                 run_local: Callable[[Dict[str, Any]], Awaitable[None]],
+                 broker_available: Callable[[], bool],
+                 mode: str = CHAT_DISPATCH_MODE,
+                 local_limit: int = CHAT_DISPATCH_LOCAL_LIMIT):
+        """
+        Args:
+            enqueue: 提交任务到Celery的协程函数，返回task_id，失败时抛出异常
+            run_local: 进程内处理一次聊天并发送结果的协程函数
+            broker_available: 返回当前Redis/Broker是否可用
+            mode: 路由策略 always / never / adaptive
+            local_limit: adaptive模式下进程内并发上限
+        """
+        if mode not in DISPATCH_MODES:
+            logger.warning(f"未知的分发策略 '{mode}'，使用 adaptive")
+            mode = 'adaptive'
+        self.mode = mode
+        self.local_limit = max(0, local_limit)
+        self._enqueue = enqueue
+        self._run_local = run_local
+        self.broker_available = broker_available
+        self.local_inflight = 0
+
+    def choose_route(self) -> str:
+        """根据策略和当前负载选择路由：worker 或 local"""
+        if self.mode == 'never' or not self.broker_available():
+            return 'local'
+        if self.mode == 'always':
+            return 'worker'
+        return 'worker' if self.local_inflight >= self.local_limit else 'local'
+
+    async def dispatch(self, task_data: Dict[str, Any]) -> Optional[str]:
+        """
+        分发一次聊天请求
+
+        Returns:
+            交给Worker时返回task_id，进程内执行时返回None
+        """
+        if self.choose_route() == 'worker':
+            try:
+                task_id = await self._enqueue(task_data)
+                logger.info(f"聊天任务已提交到Worker: {task_id} (频道 {task_data.get('channel_id')})")
+                return task_id
+            except Exception as e:
+                logger.warning(f"提交Celery任务失败，回退到进程内执行: {e}")
+
+        self.local_inflight += 1
+        try:
+            await self._run_local(task_data)
+        finally:
+            self.local_inflight -= 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """分发器状态"""
+        return {
+            "mode": self.mode,
+            "local_inflight": self.local_inflight,
+            "local_limit": self.local_limit
+        }
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量文件操作：一次请求执行一组有序的 创建目录/写入/移动/删除 操作
+- 执行前先校验全部操作 (字段、路径规范化、沙箱范围)；任何一个无效时整批不执行。
+  不依赖批内其他操作的操作，还会按磁盘的当前状态预先检查 (源存在、目标不存在等)
+- 按路径划分依赖：两个操作的路径相同或互为祖先时，后一个依赖前一个；
+  据此把操作分成若干轮，同一轮内的操作互不相关，用线程池并发执行，轮与轮之间保持列表顺序
+- 每个操作单独报告结果；操作失败时，依赖它的后续操作跳过，其余操作照常执行
+"""
+
+import os
+import shutil
+import posixpath
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# --- 批量操作配置 ---
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '1000'))   # 单次请求的最大操作数
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))                     # 并发执行的线程数
+
+OPS = ('create', 'write', 'move', 'delete')
+WRITE_MODES = ('w', 'a')
+
+# (目标路径) -> (是否有效, 错误信息)，与 PathGuard.validate 的返回值相同
+ValidateCallback = Callable[[Path], Tuple[bool, str]]
+
+
+class BatchValidationError(ValueError):
+    """批量操作中有无效的操作，整批未执行"""
+
+    def __init__(self, errors: List[Tuple[int, str]]):
+        self.errors = errors
+        super().__init__("；".join(f"#{index} {message}" for index, message in errors))
+
+
+class BatchOp(NamedTuple):
+    """一个已校验的操作"""
+    index: int
+    op: str
+    path: str                 # 规范化的相对路径 (/分隔)
+    dest: Optional[str]       # move的目标路径
+    content: str              # write的内容
+    mode: str                 # write的模式
+
+    def keys(self) -> Tuple[Tuple[str, ...], ...]:
+        """操作涉及的路径 (拆分为路径分量)，用于判断依赖"""
+        paths = (self.path, self.dest) if self.dest is not None else (self.path,)
+        return tuple(tuple(p.split('/')) for p in paths)
+
+
+def normalize(path: Any) -> Optional[str]:
+    """规范化相对路径；不是字符串、为空、指向沙箱根目录、绝对路径或以 .. 离开沙箱时返回None"""
+    if not isinstance(path, str):
+        return None
+    path = path.strip().replace('\\', '/')
+    if not path or path.startswith('/') or ':' in path.split('/')[0]:
+        return None
+    path = posixpath.normpath(path)
+    if path in ('.', '..') or path.startswith('../'):
+        return None
+    return path
+
+
+def parse(raw_ops: Iterable[Dict[str, Any]]) -> List[BatchOp]:
+    """
+    校验操作的字段
+
+    Raises:
+        BatchValidationError: 有无效的操作 (包含全部错误)
+    """
+    ops, errors = _parse(raw_ops)
+    if errors:
+        raise BatchValidationError(errors)
+    return ops
+
+
+def _parse(raw_ops: Iterable[Dict[str, Any]]) -> Tuple[List[BatchOp], List[Tuple[int, str]]]:
+    raw_ops = list(raw_ops)
+    if not raw_ops:
+        raise BatchValidationError([(0, "操作列表为空")])
+    if len(raw_ops) > BATCH_MAX_OPERATIONS:
+        raise BatchValidationError([(0, f"操作数 {len(raw_ops)} 超过上限 {BATCH_MAX_OPERATIONS}")])
+    ops, errors = [], []
+    for index, raw in enumerate(raw_ops):
+        if not isinstance(raw, dict):
+            errors.append((index, "操作必须是对象"))
+            continue
+        op = raw.get('op')
+        if op not in OPS:
+            errors.append((index, f"不支持的操作 {op!r}，可用: {', '.join(OPS)}"))
+            continue
+        path = normalize(raw.get('path'))
+        if path is None:
+            errors.append((index, f"无效的路径 {raw.get('path')!r}"))
+            continue
+        dest, content, mode = None, raw.get('content'), raw.get('mode') or 'w'
+        if op == 'move':
+            dest = normalize(raw.get('dest'))
+            if dest is None:
+                errors.append((index, f"无效的目标路径 {raw.get('dest')!r}"))
+                continue
+            if dest == path or dest.startswith(path + '/'):
+                errors.append((index, f"不能把 '{path}' 移动到自身或其子目录 '{dest}'"))
+                continue
+        elif op == 'write':
+            if not isinstance(content, str):
+                errors.append((index, "write 操作缺少字符串 content"))
+                continue
+            if mode not in WRITE_MODES:
+                errors.append((index, f"不支持的写入模式 {mode!r}，请使用 'w' 或 'a'"))
+                continue
+        ops.append(BatchOp(index, op, path, dest, content if op == 'write' else '', mode))
+    return ops, errors
+
+
+class _PathSet:
+    """一组路径到值的映射，支持查询与给定路径相同或互为祖先的路径"""
+
+    def __init__(self):
+        self.exact: Dict[Tuple[str, ...], int] = {}     # 路径 -> 值
+        self.subtree: Dict[Tuple[str, ...], int] = {}   # 路径 -> 该路径及其子路径中的最大值
+
+    def add(self, key: Tuple[str, ...], value: int) -> None:
+        self.exact[key] = max(self.exact.get(key, value), value)
+        for i in range(1, len(key) + 1):
+            prefix = key[:i]
+            self.subtree[prefix] = max(self.subtree.get(prefix, value), value)
+
+    def overlapping(self, key: Tuple[str, ...]) -> Optional[int]:
+        """与key相同、是其祖先或子路径的条目中的最大值；没有时返回None"""
+        found = self.subtree.get(key)
+        for i in range(1, len(key)):
+            value = self.exact.get(key[:i])
+            if value is not None and (found is None or value > found):
+                found = value
+        return found
+
+
+def plan(ops: List[BatchOp]) -> List[List[BatchOp]]:
+    """
+    把操作分成依次执行的若干轮：每个操作排在它依赖的所有操作之后的一轮，
+    同一轮内的操作路径互不重叠 (耗时与 操作数 × 路径深度 相关)
+    """
+    levels = _PathSet()
+    waves: List[List[BatchOp]] = []
+    for op in ops:
+        keys = op.keys()
+        level = max((levels.overlapping(key) or 0 for key in keys), default=0)
+        for key in keys:
+            levels.add(key, level + 1)
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(op)
+    return waves
+
+
+def _precheck(base_dir: Path, op: BatchOp) -> Optional[str]:
+    """按磁盘的当前状态检查不依赖批内其他操作的操作"""
+    target = base_dir / op.path
+    if op.op == 'create' and os.path.lexists(target):
+        return f"路径 '{op.path}' 已存在"
+    if op.op == 'write' and target.is_dir():
+        return f"路径 '{op.path}' 是一个目录，无法写入文件"
+    if op.op in ('move', 'delete') and not os.path.lexists(target):
+        return f"路径 '{op.path}' 不存在"
+    if op.op == 'move' and os.path.lexists(base_dir / op.dest):
+        return f"目标路径 '{op.dest}' 已存在"
+    return None
+
+
+def validate(base_dir: Path, raw_ops: Iterable[Dict[str, Any]],
+             validate_path: ValidateCallback) -> Tuple[List[BatchOp], List[List[BatchOp]]]:
+    """
+    执行前校验全部操作并分轮
+
+    Raises:
+        BatchValidationError: 有无效的操作 (包含全部错误)
+    """
+    ops, errors = _parse(raw_ops)
+    waves = plan(ops)
+    first_wave = {op.index for op in waves[0]} if waves else set()
+    for op in ops:
+        for path in (op.path, op.dest):
+            if path is None:
+                continue
+            ok, msg = validate_path(base_dir / path)
+            if not ok:
+                errors.append((op.index, msg))
+                break
+        else:
+            # 第一轮的操作与之前的操作都不相关，执行时磁盘状态与现在相同
+            problem = _precheck(base_dir, op) if op.index in first_wave else None
+            if problem:
+                errors.append((op.index, problem))
+    if errors:
+        raise BatchValidationError(sorted(errors))
+    return ops, waves
+
+
+def _apply(base_dir: Path, op: BatchOp) -> str:
+    """执行一个操作，返回结果说明；失败时抛出异常"""
+    target = base_dir / op.path
+    if op.op == 'create':
+        target.mkdir(parents=True, exist_ok=False)
+        return f"目录 '{op.path}' 创建成功"
+    if op.op == 'write':
+        if target.is_dir():
+            raise IsADirectoryError(f"路径 '{op.path}' 是一个目录，无法写入文件")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, op.mode, encoding='utf-8') as f:
+            f.write(op.content)
+        return f"向 '{op.path}' 写入 {len(op.content.encode('utf-8'))} 字节"
+    if op.op == 'move':
+        dest = base_dir / op.dest
+        if os.path.lexists(dest):
+            raise FileExistsError(f"目标路径 '{op.dest}' 已存在")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(target, dest)
+        return f"'{op.path}' → '{op.dest}'"
+    if target.is_dir() and not target.is_symlink():
+        shutil.rmtree(target)
+        return f"目录 '{op.path}' 已删除"
+    target.unlink()
+    return f"文件 '{op.path}' 已删除"
+
+
+def _result(op: BatchOp, status: str, message: str) -> Dict[str, Any]:
+    result = {'index': op.index, 'op': op.op, 'path': op.path, 'status': status, 'message': message}
+    if op.dest is not None:
+        result['dest'] = op.dest
+    return result
+
+
+def execute(base_dir: Path, waves: List[List[BatchOp]], validate_path: ValidateCallback,
+            on_change: Optional[Callable[..., None]] = None,
+            on_progress: Optional[Callable[[int, int], None]] = None,
+            workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    按轮执行操作，同一轮内并发
+
+    Args:
+        on_change: 每轮结束后以该轮修改的全部路径调用一次，下一轮的校验能看到这些修改
+        on_progress: (已完成的操作数, 总操作数)，在调用线程中报告
+
+    Returns:
+        按原始顺序排列的每个操作的结果，status 为 'ok' / 'error' / 'skipped'
+    """
+    workers = workers or BATCH_WORKERS
+    total = sum(len(wave) for wave in waves)
+    results: Dict[int, Dict[str, Any]] = {}
+    failed = _PathSet()       # 失败或跳过的操作的路径 -> 操作序号
+
+    def run(op: BatchOp) -> Dict[str, Any]:
+        # 之前几轮的操作可能改变了路径的状态，执行前重新校验沙箱范围
+        for path in (op.path, op.dest):
+            if path is not None:
+                ok, msg = validate_path(base_dir / path)
+                if not ok:
+                    return _result(op, 'error', msg)
+        try:
+            return _result(op, 'ok', _apply(base_dir, op))
+        except Exception as e:
+            return _result(op, 'error', str(e))
+
+    executor = None
+    try:
+        for wave in waves:
+            ready = []
+            for op in wave:
+                blockers = [b for b in map(failed.overlapping, op.keys()) if b is not None]
+                blocker = max(blockers, default=None)
+                if blocker is None:
+                    ready.append(op)
+                else:
+                    results[op.index] = _result(op, 'skipped', f"依赖的操作 #{blocker} 未成功，已跳过")
+            if len(ready) <= 1 or workers <= 1:
+                finished = (run(op) for op in ready)
+            else:
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='file-batch')
+                finished = (future.result() for future in as_completed([executor.submit(run, op) for op in ready]))
+            changed = []
+            for result in finished:
+                results[result['index']] = result
+                if on_progress:
+                    on_progress(len(results), total)
+            for op in wave:
+                status = results[op.index]['status']
+                if status != 'skipped':
+                    # 失败的操作也可能已部分修改 (例如写入中途出错)
+                    changed.extend(base_dir / path for path in (op.path, op.dest) if path is not None)
+                if status != 'ok':
+                    for key in op.keys():
+                        failed.add(key, op.index)
+            if changed and on_change:
+                on_change(*changed)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    return [results[index] for index in sorted(results)]
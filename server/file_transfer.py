@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱文件的HTTP传输
+- 下载由 FileResponse 直接从磁盘流式发送 (支持Range/If-Range；服务器支持pathsend扩展时零拷贝)，
+  这里只补充 If-None-Match / If-Modified-Since 的304判断
+- 上传把请求体分块写入目标目录中的临时文件，写完fsync后原子替换目标文件，
+  中途失败或超出大小上限时删除临时文件，目标文件保持不变
+"""
+
+import os
+import asyncio
+import tempfile
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+# --- 文件传输配置 ---
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_MB', '1024')) * 1024 * 1024   # 单个上传文件的大小上限
+UPLOAD_BUFFER_BYTES = 1024 * 1024                                         # 累积到该大小后写盘一次
+
+
+class UploadTooLarge(ValueError):
+    """上传内容超过大小上限"""
+
+
+def _strip_weak(tag: str) -> str:
+    return tag.strip().removeprefix('W/')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中 (弱比较，支持 * 和逗号分隔的多个值)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return _strip_weak(etag) in {_strip_weak(tag) for tag in if_none_match.split(',')}
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str, mtime: float) -> bool:
+    """条件请求是否可以返回304；同时给出两者时以 If-None-Match 为准 (RFC 9110)"""
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _open_temp(target: Path):
+    fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.upload')
+    return os.fdopen(fd, 'wb'), temp_path
+
+
+def _finish(f, temp_path: str, target: Path) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    if target.exists():
+        # 保留原文件的权限位
+        os.chmod(temp_path, target.stat().st_mode & 0o7777)
+    os.replace(temp_path, target)
+
+
+async def write_stream_atomic(target: Path, chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None) -> int:
+    """
+    把异步分块流原子地写入目标文件 (目标目录必须存在)
+
+    Returns:
+        写入的字节数
+
+    Raises:
+        UploadTooLarge: 内容超过 max_bytes (默认 UPLOAD_MAX_BYTES)
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    f, temp_path = await asyncio.to_thread(_open_temp, target)
+    total = 0
+    buffer = bytearray()
+    try:
+        async for chunk in chunks:
+            total += len(chunk)
+            if total > max_bytes:
+                raise UploadTooLarge(f"上传内容超过大小上限 {max_bytes} 字节")
+            buffer += chunk
+            if len(buffer) >= UPLOAD_BUFFER_BYTES:
+                data = bytes(buffer)
+                buffer.clear()
+                await asyncio.to_thread(f.write, data)
+        if buffer:
+            await asyncio.to_thread(f.write, bytes(buffer))
+        await asyncio.to_thread(_finish, f, temp_path, target)
+        return total
+    except BaseException:
+        f.close()
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
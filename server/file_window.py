@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件的窗口读取
+- 通过mmap读取文件的一个窗口 (字节偏移/长度、行范围、开头/末尾N行)，内存占用只与窗口大小有关
+- 行范围定位使用稀疏的行偏移索引：每隔约 LINE_INDEX_STRIDE 字节记录一个 (字节偏移, 行号) 检查点，
+  按文件 (mtime, 大小) 缓存；定位某一行只需从最近的检查点向后扫描，与文件大小无关
+- head/tail 从文件两端直接扫描，不需要索引
+- 每个窗口最多返回 READ_WINDOW_MAX_BYTES 字节，超出部分截断到完整的行并给出提示
+"""
+
+import os
+import mmap
+import bisect
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+# --- 窗口读取配置 ---
+READ_WINDOW_MAX_BYTES = int(os.getenv('READ_WINDOW_MAX_BYTES', str(256 * 1024)))   # 单次读取返回的最大字节数
+LINE_INDEX_STRIDE = 64 * 1024            # 行索引检查点的间隔(字节)
+LINE_INDEX_CACHE_SIZE = 32               # 缓存行索引的文件数
+
+
+class WindowError(ValueError):
+    """窗口参数无效"""
+
+
+class Window(NamedTuple):
+    """读取到的窗口"""
+    text: str
+    start: int                  # 窗口的字节范围 [start, end)
+    end: int
+    size: int                   # 文件总字节数
+    first_line: Optional[int]   # 窗口首行行号 (从1开始)，未知时为None
+    last_line: Optional[int]
+    truncated: bool             # 因 READ_WINDOW_MAX_BYTES 被截断
+
+
+class LineIndex:
+    """稀疏行偏移索引"""
+
+    def __init__(self, mm, size: int, stride: Optional[int] = None):
+        stride = stride or LINE_INDEX_STRIDE
+        self.offsets: List[int] = [0]     # 检查点的字节偏移 (总在行首)
+        self.lines: List[int] = [1]       # 检查点所在的行号
+        pos, line = 0, 1
+        while pos < size:
+            stop = mm.find(b'\n', min(pos + stride, size) - 1)
+            stop = size if stop == -1 else stop + 1
+            line += mm[pos:stop].count(b'\n')
+            pos = stop
+            if pos < size:
+                self.offsets.append(pos)
+                self.lines.append(line)
+        self.size = size
+        # 末尾没有换行符时最后一行也计入
+        self.total_lines = line - 1 if size == 0 or mm[size - 1:size] == b'\n' else line
+
+    def line_start(self, mm, line: int) -> int:
+        """第line行 (从1开始) 的起始字节偏移，超过总行数时返回文件大小"""
+        if line > self.total_lines:
+            return self.size
+        i = bisect.bisect_right(self.lines, line) - 1
+        pos = self.offsets[i]
+        for _ in range(line - self.lines[i]):
+            pos = mm.find(b'\n', pos) + 1
+        return pos
+
+    def line_of(self, mm, offset: int) -> int:
+        """字节偏移所在的行号"""
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        return self.lines[i] + mm[self.offsets[i]:offset].count(b'\n')
+
+
+_cache: 'OrderedDict[str, Tuple[int, int, LineIndex]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def line_index(path: Path, mm, st: os.stat_result) -> LineIndex:
+    """文件的行索引 (按 mtime 和大小校验缓存)"""
+    key = str(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _cache.move_to_end(key)
+            return cached[2]
+    index = LineIndex(mm, st.st_size)
+    with _cache_lock:
+        _cache[key] = (st.st_mtime_ns, st.st_size, index)
+        _cache.move_to_end(key)
+        while len(_cache) > LINE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def _cached_index(path: Path, st: os.stat_result) -> Optional[LineIndex]:
+    with _cache_lock:
+        cached = _cache.get(str(path))
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    return None
+
+
+def _clip(mm, start: int, end: int, max_bytes: int, from_end: bool = False) -> Tuple[int, int, bool]:
+    """把窗口限制在max_bytes以内，尽量截断在行边界"""
+    if end - start <= max_bytes:
+        return start, end, False
+    if from_end:
+        cut = mm.find(b'\n', end - max_bytes, end)
+        return (cut + 1 if cut != -1 and cut + 1 < end else end - max_bytes), end, True
+    cut = mm.rfind(b'\n', start, start + max_bytes)
+    return start, (cut + 1 if cut != -1 else start + max_bytes), True
+
+
+def read_window(path: Path, offset: Optional[int] = None, length: Optional[int] = None,
+                start_line: Optional[int] = None, end_line: Optional[int] = None,
+                head: Optional[int] = None, tail: Optional[int] = None,
+                max_bytes: Optional[int] = None) -> Window:
+    """
+    读取文件的一个窗口，只能指定一种方式：
+    - offset/length: 字节范围 (length省略时读到上限为止)
+    - start_line/end_line: 行范围 (从1开始，包含end_line；end_line省略时读到上限为止)
+    - head/tail: 开头/末尾N行
+    都未指定时从文件开头读取
+
+    Raises:
+        WindowError: 参数组合或取值无效
+    """
+    modes = [offset is not None or length is not None, start_line is not None or end_line is not None,
+             head is not None, tail is not None]
+    if sum(modes) > 1:
+        raise WindowError("offset/length、start_line/end_line、head、tail 只能指定其中一种")
+    for name, value in (('offset', offset), ('head', head), ('tail', tail)):
+        if value is not None and value < 0:
+            raise WindowError(f"{name} 不能为负数")
+    if length is not None and length < 0:
+        raise WindowError("length 不能为负数")
+    if (start_line is not None and start_line < 1) or (end_line is not None and end_line < 1):
+        raise WindowError("行号从1开始")
+    if start_line is not None and end_line is not None and end_line < start_line:
+        raise WindowError("end_line 不能小于 start_line")
+    max_bytes = READ_WINDOW_MAX_BYTES if max_bytes is None else max_bytes
+
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size == 0:
+            return Window('', 0, 0, 0, None, None, False)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = _cached_index(path, st)
+            first_line: Optional[int] = None
+            from_end = False
+
+            if modes[1]:
+                index = line_index(path, mm, st)
+                first_line = start_line or 1
+                start = index.line_start(mm, first_line)
+                end = size if end_line is None else index.line_start(mm, end_line + 1)
+            elif head is not None:
+                start, end, first_line = 0, 0, 1
+                for _ in range(head):
+                    if end >= size or end > max_bytes:
+                        break
+                    found = mm.find(b'\n', end)
+                    end = size if found == -1 else found + 1
+            elif tail is not None:
+                from_end = True
+                end = start = size
+                # 末尾的换行符不算新的一行
+                scan = size - 1 if mm[size - 1:size] == b'\n' else size
+                for _ in range(tail):
+                    if start == 0 or size - start > max_bytes:
+                        break
+                    found = mm.rfind(b'\n', 0, scan)
+                    start = 0 if found == -1 else found + 1
+                    scan = max(found, 0)
+            else:
+                start = min(offset or 0, size)
+                end = size if length is None else min(start + length, size)
+                if start == 0:
+                    first_line = 1
+
+            start, end, truncated = _clip(mm, start, end, max_bytes, from_end)
+            if index is not None:
+                first_line = index.line_of(mm, start)
+            text = mm[start:end].decode('utf-8', errors='replace')
+
+    last_line = None
+    if first_line is not None and end > start:
+        last_line = first_line + text.count('\n', 0, len(text) - 1 if text.endswith('\n') else len(text))
+    return Window(text, start, end, size, first_line, last_line, truncated)
+
+
+def is_windowed(*params) -> bool:
+    """是否指定了任何窗口参数"""
+    return any(p is not None for p in params)
+
+
+def render(name: str, window: Window) -> str:
+    """工具返回的文本：窗口内容，未覆盖整个文件时附带位置说明"""
+    if window.start == 0 and window.end == window.size:
+        return window.text
+    if window.first_line is not None and window.last_line is not None:
+        where = f"第 {window.first_line}-{window.last_line} 行，"
+    else:
+        where = ""
+    note = f"[文件 '{name}' {where}字节 {window.start}-{window.end}/{window.size}"
+    if window.truncated:
+        note += f"，已截断到 {READ_WINDOW_MAX_BYTES} 字节"
+    note += "；可使用 start_line/end_line、offset/length、head/tail 参数读取其他部分]"
+    return f"{window.text}\n{note}" if window.text else note
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱文件内容指纹缓存
+- 指纹 = 内容哈希 (xxh3_128，未安装xxhash时使用blake2b) + 行数 + 是否二进制，一次顺序读取同时算出
+- 以 (路径, 大小, mtime_ns, inode) 为有效性条件持久化在sqlite中 (默认 server/.cache/fingerprints.sqlite)，
+  文件未变化时相等判断、去重和"自上次以来是否修改"都不需要再读取内容
+- mtime距计算时间过近的记录不可信 (同一时间片内的再次修改不会改变mtime)，下次查询时重新计算
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+# --- 指纹缓存配置 ---
+FINGERPRINT_CACHE_PATH = os.getenv('FINGERPRINT_CACHE_PATH',
+                                   str(Path(__file__).parent / '.cache' / 'fingerprints.sqlite'))
+FINGERPRINT_ALGORITHM = 'xxh3_128' if XXHASH_AVAILABLE else 'blake2b'
+FINGERPRINT_CHUNK = 1 << 20
+FINGERPRINT_SNIFF_BYTES = 8192
+FINGERPRINT_RACY_NS = 2_000_000_000       # mtime距计算时间小于该值时不信任
+
+SCHEMA_VERSION = 1
+
+
+class Fingerprint(NamedTuple):
+    """文件指纹"""
+    digest: str          # "算法:十六进制摘要"
+    size: int
+    mtime_ns: int
+    inode: int
+    lines: int           # 换行符个数，末尾没有换行符的最后一行也计入
+    binary: bool         # 开头 FINGERPRINT_SNIFF_BYTES 字节中含NUL
+
+
+def _new_hasher(algorithm: str):
+    if algorithm == 'xxh3_128':
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def compute(path: Path, st: Optional[os.stat_result] = None, algorithm: str = FINGERPRINT_ALGORITHM) -> Fingerprint:
+    """读取文件计算指纹"""
+    hasher = _new_hasher(algorithm)
+    lines = 0
+    last = b''
+    with open(path, 'rb') as f:
+        st = st or os.fstat(f.fileno())
+        head = f.read(FINGERPRINT_SNIFF_BYTES)
+        chunk = head
+        while chunk:
+            hasher.update(chunk)
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+            chunk = f.read(FINGERPRINT_CHUNK)
+    if last and last != b'\n':
+        lines += 1
+    return Fingerprint(f"{algorithm}:{hasher.hexdigest()}", st.st_size, st.st_mtime_ns, st.st_ino,
+                       lines, b'\x00' in head)
+
+
+class FingerprintCache:
+    """sqlite持久化的指纹缓存"""
+
+    def __init__(self, path: str = FINGERPRINT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(f'''
+                    DROP TABLE IF EXISTS fingerprints;
+                    CREATE TABLE fingerprints (
+                        path TEXT PRIMARY KEY,
+                        digest TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        inode INTEGER NOT NULL,
+                        lines INTEGER NOT NULL,
+                        binary INTEGER NOT NULL,
+                        hashed_ns INTEGER NOT NULL
+                    );
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def peek(self, path: Path, st: Optional[os.stat_result] = None) -> Optional[Fingerprint]:
+        """只查询缓存：记录仍然有效时返回指纹，否则返回None (不读取文件内容)"""
+        key = os.path.abspath(path)
+        st = st or os.stat(key)
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT digest, size, mtime_ns, inode, lines, binary, hashed_ns FROM fingerprints WHERE path = ?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        digest, size, mtime_ns, inode, lines, binary, hashed_ns = row
+        if (size, mtime_ns, inode) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        if hashed_ns - mtime_ns < FINGERPRINT_RACY_NS:
+            return None
+        return Fingerprint(digest, size, mtime_ns, inode, lines, bool(binary))
+
+    def get(self, path: Path) -> Fingerprint:
+        """文件的指纹；缓存无效时读取文件重新计算并保存"""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        cached = self.peek(key, st)
+        if cached is not None:
+            return cached
+        # 计算期间文件被修改时其mtime不早于hashed_ns，这条记录下次查询时不会被信任
+        hashed_ns = time.time_ns()
+        fp = compute(Path(key))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, fp.digest, fp.size, fp.mtime_ns, fp.inode, fp.lines, int(fp.binary), hashed_ns))
+        return fp
+
+    def same_content(self, path1: Path, path2: Path) -> bool:
+        """两个文件内容是否相同 (大小不同时不读取内容)"""
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+        return self.get(path1).digest == self.get(path2).digest
+
+    def invalidate(self, *paths: Any) -> None:
+        """本进程修改了这些路径：删除其 (及目录下全部文件的) 记录"""
+        if self._conn is None and not os.path.exists(self.path):
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for path in paths:
+                    key = os.path.abspath(path)
+                    prefix = key.rstrip(os.sep) + os.sep
+                    conn.execute('DELETE FROM fingerprints WHERE path = ? OR substr(path, 1, ?) = ?',
+                                 (key, len(prefix), prefix))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务提交幂等性
+基于Redis SET NX的幂等键登记表：同一个幂等键只会执行一次 (无论交给Worker还是在API进程内执行)，
+重复提交会挂到原任务上，原任务完成后直接复用其结果
+"""
+
+import os
+import json
+import asyncio
+from typing import Any, Dict, Optional
+
+import codec
+
+# --- 幂等配置 ---
+IDEMPOTENCY_INFLIGHT_TTL = int(os.getenv('IDEMPOTENCY_INFLIGHT_TTL', '600'))   # 进行中记录的过期时间(秒)
+IDEMPOTENCY_RESULT_TTL = int(os.getenv('IDEMPOTENCY_RESULT_TTL', '3600'))      # 已完成记录的过期时间(秒)
+IDEMPOTENCY_POLL_MS = int(os.getenv('IDEMPOTENCY_POLL_MS', '500'))               # HTTP重试等待原任务时的轮询间隔
+
+STATE_PENDING = 'pending'
+STATE_COMPLETED = 'completed'
+
+
+def record_key(key: str) -> str:
+    """幂等记录键"""
+    return f"idem:{key}"
+
+
+def subscribers_key(key: str) -> str:
+    """等待同一结果的其他频道集合"""
+    return f"idem:{key}:subs"
+
+
+# --- API进程侧 (redis.asyncio) ---
+async def lookup(client, key: str) -> Optional[Dict[str, Any]]:
+    """查询幂等键对应的记录"""
+    return codec.loads(await client.get(record_key(key)))
+
+
+class ClaimConflict(RuntimeError):
+    """幂等键反复被占用又释放，既没能登记也没能挂到原任务上"""
+
+
+async def claim(client, key: str, task_id: str, channel_id: str) -> Optional[Dict[str, Any]]:
+    """
+    登记新任务
+
+    Returns:
+        登记成功返回None；幂等键已被占用时返回已有记录，并把channel_id加入等待列表
+        (记录已完成时由调用方推送其中的结果)
+
+    Raises:
+        ClaimConflict: 重试后仍无法登记或挂到原任务上
+    """
+    record = {"task_id": task_id, "state": STATE_PENDING, "channel_id": channel_id}
+    for _ in range(2):
+        if await client.set(record_key(key), json.dumps(record), nx=True, ex=IDEMPOTENCY_INFLIGHT_TTL):
+            return None
+        existing = await lookup(client, key)
+        if existing is not None:
+            existing = await attach(client, key, existing, channel_id)
+            if existing is not None:
+                return existing
+        # 记录恰好在两次操作之间过期或被释放，重试登记
+    raise ClaimConflict("同一轮对话的请求正在重试，请稍后再试")
+
+
+async def attach(client, key: str, record: Dict[str, Any], channel_id: str) -> Optional[Dict[str, Any]]:
+    """
+    把重复提交的频道挂到进行中的原任务上
+
+    Returns:
+        调用方应当据以处理的记录：仍在进行中时为原记录 (结果会在原任务结束时推送)；
+        原任务在挂上之前已完成时为已完成的记录；原任务已失败并释放幂等键时为None
+    """
+    if record.get('state') != STATE_PENDING or channel_id == record.get('channel_id'):
+        return record
+    await client.sadd(subscribers_key(key), channel_id)
+    await client.expire(subscribers_key(key), IDEMPOTENCY_INFLIGHT_TTL)
+
+    # 原任务可能在lookup和sadd之间结束，此时等待列表已被取走，不会再推送给该频道
+    latest = await lookup(client, key)
+    if latest is not None and latest.get('state') == STATE_PENDING and latest.get('task_id') == record.get('task_id'):
+        return record
+    # 频道仍在等待列表中说明结束时没有取到它，由调用方处理最新记录；否则结果已经推送
+    if not await client.srem(subscribers_key(key), channel_id):
+        return record
+    return latest if latest is not None and latest.get('state') == STATE_COMPLETED else None
+
+
+async def finish(client, key: str, task_id: str, result: Optional[Dict[str, Any]]) -> list:
+    """
+    API进程内执行的任务结束：记录结果，result为None时释放幂等键以允许重试
+
+    Returns:
+        需要额外推送结果的频道列表
+    """
+    pipe = client.pipeline()
+    if result is not None:
+        record = {"task_id": task_id, "state": STATE_COMPLETED, "result": result}
+        pipe.set(record_key(key), codec.dumps(record), ex=IDEMPOTENCY_RESULT_TTL)
+        pipe.smembers(subscribers_key(key))
+        pipe.delete(subscribers_key(key))
+    else:
+        pipe.smembers(subscribers_key(key))
+        pipe.delete(record_key(key), subscribers_key(key))
+    subscribers = (await pipe.execute())[-2]
+    return [s.decode('utf-8') if isinstance(s, bytes) else s for s in subscribers]
+
+
+async def wait_completed(client, key: str) -> Optional[Dict[str, Any]]:
+    """
+    轮询等待进行中的原任务 (没有推送频道的调用方，例如HTTP重试)
+
+    Returns:
+        已完成的记录；原任务失败或记录过期时返回None
+    """
+    while True:
+        record = await lookup(client, key)
+        if record is None or record.get('state') == STATE_COMPLETED:
+            return record
+        await asyncio.sleep(IDEMPOTENCY_POLL_MS / 1000.0)
+
+
+# --- Worker侧 (同步redis) ---
+def get_record(client, key: str) -> Optional[Dict[str, Any]]:
+    """查询幂等键对应的记录"""
+    return codec.loads(client.get(record_key(key)))
+
+
+def complete(client, key: str, task_id: str, result: Dict[str, Any]) -> list:
+    """
+    记录任务结果，返回需要额外推送结果的频道列表
+    """
+    record = {"task_id": task_id, "state": STATE_COMPLETED, "result": result}
+    pipe = client.pipeline()
+    # 已完成记录包含完整结果，按阈值压缩存储
+    pipe.set(record_key(key), codec.dumps(record), ex=IDEMPOTENCY_RESULT_TTL)
+    pipe.smembers(subscribers_key(key))
+    pipe.delete(subscribers_key(key))
+    _, subscribers, _ = pipe.execute()
+    return [s.decode('utf-8') if isinstance(s, bytes) else s for s in subscribers]
+
+
+def fail(client, key: str) -> list:
+    """
+    任务失败时释放幂等键以允许客户端重试，返回需要推送错误的频道列表
+    """
+    pipe = client.pipeline()
+    pipe.smembers(subscribers_key(key))
+    pipe.delete(record_key(key), subscribers_key(key))
+    subscribers, _ = pipe.execute()
+    return [s.decode('utf-8') if isinstance(s, bytes) else s for s in subscribers]
@@ -14,11 +14,7 @@ import logging
 from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 import datetime
-import difflib
 import re
-import shutil
-import zipfile
-import tarfile
 import httpx
 import ast
 
@@ -26,10 +22,28 @@ import ast
 from dotenv import load_dotenv
 
 # FastAPI和WebSocket
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
 
+from ws_stream import ChunkedSender
+from dispatch import ChatDispatcher
+import idempotency
+import metrics
+import result_store
+import codec
+import search_engine
+import file_transfer
+import file_batch
+from search_engine import SEARCH_MAX_RESULTS
+import sandbox_tools
+from sandbox_tools import (
+    create_directory, rename_file, delete_folder, get_folder_tree, list_folder_children, get_folder_info,
+    batch_file_operations
+)
+
 # Redis（可选依赖）
 try:
     import redis.asyncio as redis
@@ -89,6 +103,8 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.user_channels: Dict[str, str] = {}  # user_id -> channel_id
+        self.channel_tasks: Dict[str, set] = {}  # channel_id -> 正在处理的后台任务
+        self.chunker = ChunkedSender(self.send_personal_message)
 
     async def connect(self, websocket: WebSocket, user_id: Optional[str] = None) -> str:
         """接受WebSocket连接并返回频道ID"""
@@ -107,6 +123,11 @@ class ConnectionManager:
         if channel_id in self.active_connections:
             del self.active_connections[channel_id]
 
+        # 中止该频道上的分块传输和后台任务
+        self.chunker.drop_channel(channel_id)
+        for task in self.channel_tasks.pop(channel_id, set()):
+            task.cancel()
+
         # 清理用户频道映射
         for user_id, ch_id in list(self.user_channels.items()):
             if ch_id == channel_id:
@@ -125,6 +146,26 @@ class ConnectionManager:
                 logger.error(f"发送消息失败 {channel_id}: {e}")
                 self.disconnect(channel_id)
 
+    async def send_result(self, message: dict, channel_id: str):
+        """发送结果消息，超大响应自动分块并进行流量控制"""
+        data = message.get('data') or {}
+        response = data.get('response')
+        if isinstance(response, str) and self.chunker.should_chunk(response):
+            meta = {k: v for k, v in data.items() if k != 'response'}
+            if message.get('timestamp'):
+                meta['timestamp'] = message['timestamp']
+            await self.chunker.send(channel_id, message.get('type', 'result'), response, meta)
+        else:
+            await self.send_personal_message(message, channel_id)
+
+    def spawn(self, channel_id: str, coro) -> asyncio.Task:
+        """在后台处理频道请求，使接收循环可以继续处理ACK等控制帧"""
+        task = asyncio.create_task(coro)
+        tasks = self.channel_tasks.setdefault(channel_id, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
     async def broadcast(self, message: dict):
         """广播消息到所有连接"""
         disconnected = []
@@ -142,6 +183,25 @@ class ConnectionManager:
 # 全局连接管理器实例
 manager = ConnectionManager()
 
+def _task_result_to_message(result: Dict[str, Any]) -> Dict[str, Any]:
+    """将Worker发布的TaskResult转换为WebSocket结果消息"""
+    return {
+        "type": "result",
+        "data": {
+            "response": result.get('response', ''),
+            "success": result.get('success', False),
+            "error": result.get('error'),
+            "task_id": result.get('task_id')
+        },
+        "timestamp": datetime.datetime.now().isoformat()
+    }
+
+async def _resolve_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """取回单独存储的超大结果正文"""
+    if not result.get('response_ref'):
+        return result
+    return await result_store.resolve_response(redis.Redis(connection_pool=redis_pool), result)
+
 # Redis发布/订阅监听器
 async def redis_listener():
     """监听Redis发布/订阅消息并转发到WebSocket"""
@@ -150,7 +210,8 @@ async def redis_listener():
         logger.info("Redis不可用，跳过Redis监听器")
         return
 
-    pubsub = redis_pool.pubsub()
+    # 连接池本身没有 pubsub()，须经客户端创建
+    pubsub = redis.Redis(connection_pool=redis_pool).pubsub()
 
     try:
         # 订阅所有结果频道
@@ -165,12 +226,19 @@ async def redis_listener():
                     channel_name = message['channel'].decode('utf-8')
                     channel_id = channel_name.replace('result:', '')
 
-                    # 解析消息数据
-                    data = json.loads(message['data'].decode('utf-8'))
+                    # 解析消息数据 (大消息经codec压缩)
+                    data = codec.loads(message['data'])
+                    if 'type' not in data:
+                        data = _task_result_to_message(await _resolve_result(data))
+                    elif data['type'] == 'tool_result':
+                        data['data'] = await _resolve_result(data['data'])
 
                     # 转发到对应的WebSocket连接
-                    await manager.send_personal_message(data, channel_id)
-                    logger.info(f"转发消息到频道 {channel_id}")
+                    await manager.send_result(data, channel_id)
+                    if data.get('type') == 'progress':
+                        logger.debug(f"转发进度到频道 {channel_id}")
+                    else:
+                        logger.info(f"转发消息到频道 {channel_id}")
 
                 except Exception as e:
                     logger.error(f"处理Redis消息失败: {e}")
@@ -178,7 +246,7 @@ async def redis_listener():
     except Exception as e:
         logger.error(f"Redis监听器错误: {e}")
     finally:
-        await pubsub.unsubscribe()
+        await pubsub.punsubscribe()
         await pubsub.close()
 
 # 应用生命周期管理
@@ -233,10 +301,6 @@ async def lifespan(app: FastAPI):
 
         logger.info("服务已关闭")
 
-# 全局基础目录
-base_dir = Path(__file__).parent.resolve() / "test"
-os.makedirs(base_dir, exist_ok=True)
-
 # --- Pydantic 模型定义 ---
 class ProxyAuth(BaseModel):
     """代理认证信息"""
@@ -255,6 +319,7 @@ class ChatRequest(BaseModel):
     """聊天请求模型"""
     message: str
     proxyConfig: Optional[ProxyConfig] = None
+    idempotency_key: Optional[str] = None   # 同一轮对话的重试 (含WebSocket降级) 使用相同的键
 
     class Config:
         json_schema_extra = {
@@ -423,6 +488,25 @@ class FolderRenameRequest(BaseModel):
     old_path: str
     new_name: str
 
+class BatchOperation(BaseModel):
+    """批量文件操作中的一个操作模型"""
+    op: str  # "create" (目录), "write", "move" or "delete"
+    path: str
+    dest: Optional[str] = None
+    content: Optional[str] = None
+    mode: str = "w"
+
+class BatchRequest(BaseModel):
+    """批量文件操作请求模型"""
+    operations: List[BatchOperation]
+
+class FolderChildrenResponse(BaseModel):
+    """文件夹子节点分页响应模型"""
+    node: Dict[str, Any]
+    children: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    total: int
+
 class FolderTreeResponse(BaseModel):
     """文件夹树响应模型"""
     tree: FolderNode
@@ -446,568 +530,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- 工具函数：路径验证 (保持不变) ---
-def _validate_path(target_path: Path, check_existence=False, expect_dir=False, expect_file=False):
-    try:
-        if not base_dir.exists() or not base_dir.is_dir():
-            return False, f"错误：基础目录 '{base_dir}' 不存在或不是目录。"
-        resolved = target_path.resolve()
-        resolved_base_dir = base_dir.resolve()
-        if not (resolved == resolved_base_dir or \
-                str(resolved).startswith(str(resolved_base_dir) + os.sep)):
-            return False, f"错误：路径 '{resolved}' 超出了允许的操作范围 '{base_dir}'。"
-        if check_existence and not resolved.exists():
-            return False, f"错误：路径 '{target_path}' 不存在。"
-        if resolved.exists():
-            if expect_dir and not resolved.is_dir():
-                return False, f"错误：路径 '{target_path}' 不是一个目录。"
-            if expect_file and not resolved.is_file():
-                return False, f"错误：路径 '{target_path}' 不是一个文件。"
-        elif expect_dir or expect_file:
-             pass # 允许路径在检查时不必须存在，如果只是为了后续创建
-        return True, ""
-    except Exception as e:
-        return False, f"路径验证时发生异常：{e}"
-
-# --- 文件操作工具 (保持不变) ---
-def read_file(name: str) -> str:
-    print(f"(read_file '{name}')")
-    p = base_dir / name
-    ok, msg = _validate_path(p, check_existence=True, expect_file=True)
-    if not ok: return msg
-    try: return p.read_text(encoding='utf-8')
-    except Exception as e: return f"读取文件 '{name}' 时发生错误：{e}"
-def list_files(path: str = ".") -> list[str]:
-    print(f"(list_files '{path}')")
-    p = (base_dir / path); ok, msg = _validate_path(p, check_existence=True, expect_dir=True)
-    if not ok: return [msg]
-    resolved_p = p.resolve(); items = []
-    for item in sorted(resolved_p.iterdir(), key=lambda x:(x.is_file(), x.name.lower())):
-        stat = item.stat(); mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-        if item.is_dir(): items.append(f"{item.name}/ (目录, ---, {mtime})")
-        else: items.append(f"{item.name} (文件, {stat.st_size} bytes, {mtime})")
-    return items or [f"目录 '{path}' 为空。"]
-def rename_file(name: str, new_name: str) -> str:
-    print(f"(rename_file '{name}' -> '{new_name}')"); src_path = base_dir / name; dst_path = base_dir / new_name
-    ok_src, msg_src = _validate_path(src_path, check_existence=True)
-    if not ok_src: return msg_src
-    ok_dst, msg_dst = _validate_path(dst_path, check_existence=False) # Destination may not exist
-    if not ok_dst: return msg_dst
-    try: dst_path.parent.mkdir(parents=True, exist_ok=True); os.rename(src_path, dst_path); return f"重命名成功：'{name}' → '{new_name}'"
-    except Exception as e: return f"重命名文件/目录时发生错误：{e}"
-def write_file(name: str, content: str, mode: str = 'w') -> str:
-    print(f"(write_file '{name}' mode='{mode}')"); p = base_dir / name
-    ok, msg = _validate_path(p, check_existence=False)
-    if not ok: return msg
-    if p.exists() and p.is_dir(): return f"错误：路径 '{name}' 是一个目录，无法写入文件。"
-    if mode not in ('w', 'a'): return f"错误：不支持的写入模式 '{mode}'。请使用 'w' 或 'a'。"
-    try:
-        p.parent.mkdir(parents=True, exist_ok=True)
-        with open(p, mode, encoding='utf-8') as f: f.write(content)
-        return f"成功向 '{name}' 写入 {len(content.encode('utf-8'))} 字节。"
-    except Exception as e: return f"写入文件 '{name}' 时发生错误：{e}"
-def create_directory(name: str) -> str:
-    print(f"(create_directory '{name}')"); p = base_dir / name
-    ok, msg = _validate_path(p, check_existence=False)
-    if not ok: return msg
-    if p.exists(): return f"错误：路径 '{name}' 已存在。"
-    try: p.mkdir(parents=True, exist_ok=False); return f"目录 '{name}' 创建成功。" # exist_ok=False to error if exists
-    except FileExistsError: return f"错误：路径 '{name}' 已存在。"
-    except Exception as e: return f"创建目录 '{name}' 失败：{e}"
-def delete_file(name: str) -> str:
-    print(f"(delete_file '{name}')"); p = base_dir / name
-    ok, msg = _validate_path(p, check_existence=True, expect_file=True)
-    if not ok: return msg
-    try: p.unlink(); return f"文件 '{name}' 删除成功。"
-    except Exception as e: return f"删除文件 '{name}' 时发生错误：{e}"
-def pwd() -> str: print("(pwd)"); return f"当前操作目录限制在: './{base_dir.name}/'"
-def diff_files(f1: str, f2: str) -> str:
-    print(f"(diff_files '{f1}' '{f2}')"); path1 = base_dir / f1; path2 = base_dir / f2
-    ok1, msg1 = _validate_path(path1, check_existence=True, expect_file=True)
-    if not ok1: return msg1
-    ok2, msg2 = _validate_path(path2, check_existence=True, expect_file=True)
-    if not ok2: return msg2
-    try:
-        lines1 = path1.read_text(encoding='utf-8').splitlines(keepends=True)
-        lines2 = path2.read_text(encoding='utf-8').splitlines(keepends=True)
-        diff_result = list(difflib.unified_diff(lines1, lines2, fromfile=f1, tofile=f2, lineterm=''))
-        return ''.join(diff_result) or f"文件 '{f1}' 和 '{f2}' 内容完全相同。"
-    except Exception as e: return f"比较文件差异时发生错误: {e}"
-def _gen_tree(dir_path: Path, prefix: str, current_depth: int, max_depth: int) -> list[str]:
-    if max_depth != -1 and current_depth > max_depth: return []
-    lines = [];
-    try: entries = sorted(list(dir_path.iterdir()), key=lambda x: (not x.is_dir(), x.name.lower()))
-    except PermissionError: return [f"{prefix}└── [无法访问]"]
-    except Exception as e: return [f"{prefix}└── [读取错误: {e}]"]
-    for i, entry in enumerate(entries):
-        is_last = (i == len(entries) - 1); connector = "└── " if is_last else "├── "
-        lines.append(f"{prefix}{connector}{entry.name}{'/' if entry.is_dir() else ''}")
-        if entry.is_dir(): new_prefix = prefix + ("    " if is_last else "│   "); lines.extend(_gen_tree(entry, new_prefix, current_depth + 1, max_depth))
-    return lines
-def tree(path: str = ".", depth: int = -1) -> str:
-    print(f"(tree '{path}' depth={depth})"); target_dir_path_relative = Path(path); target_dir_abs_path = (base_dir / target_dir_path_relative)
-    ok, msg = _validate_path(target_dir_abs_path, check_existence=True, expect_dir=True)
-    if not ok: return msg
-    resolved_target_dir = target_dir_abs_path.resolve()
-    if resolved_target_dir == base_dir.resolve(): root_display_name = f"./{base_dir.name}"
-    else:
-        try: root_display_name = str(resolved_target_dir.relative_to(base_dir.resolve()))
-        except ValueError: root_display_name = resolved_target_dir.name # Should not happen due to _validate_path
-    output_lines = [f"{root_display_name}/"]
-    if depth != 0: output_lines.extend(_gen_tree(resolved_target_dir, "", 1, depth))
-    return "\n".join(output_lines)
-def find_files(pattern: str, path: str = ".", search_content_regex: Optional[str] = None, case_sensitive: bool = False, recursive: bool = True) -> str:
-    print(f"(find_files pattern='{pattern}' path='{path}' content_regex='{search_content_regex}')"); search_root_path = (base_dir / path)
-    ok, msg = _validate_path(search_root_path, check_existence=True, expect_dir=True)
-    if not ok: return msg
-    resolved_search_root = search_root_path.resolve(); glob_func = resolved_search_root.rglob if recursive else resolved_search_root.glob
-    try: matched_paths = list(glob_func(pattern))
-    except Exception as e: return f"查找文件时发生错误: {e}"
-    if not matched_paths: return f"在 '{path}' 目录及其子目录（递归={recursive}）中未找到匹配模式 '{pattern}' 的文件或目录。"
-    output_results = []
-    if search_content_regex:
-        try: regex_flags = 0 if case_sensitive else re.IGNORECASE; compiled_regex = re.compile(search_content_regex, regex_flags)
-        except re.error as e: return f"提供的正则表达式 '{search_content_regex}' 无效: {e}"
-        for file_path_obj in matched_paths:
-            if file_path_obj.is_file(): # Only search content in files
-                val_ok, val_msg = _validate_path(file_path_obj, check_existence=True, expect_file=True)
-                if not val_ok:
-                    output_results.append(f"跳过无效路径 {file_path_obj}: {val_msg}")
-                    continue
-                try:
-                    content = file_path_obj.read_text(encoding='utf-8', errors='ignore')
-                    for line_num, line_content in enumerate(content.splitlines()):
-                        if compiled_regex.search(line_content):
-                            relative_file_path_str = str(file_path_obj.relative_to(base_dir))
-                            output_results.append(f"{relative_file_path_str}: 第 {line_num+1} 行: {line_content.strip()}")
-                except Exception as e:
-                    relative_file_path_str = str(file_path_obj.relative_to(base_dir))
-                    output_results.append(f"读取文件 {relative_file_path_str} 内容时出错: {e}")
-        return "\n".join(output_results) or f"在匹配模式 '{pattern}' 的文件中未找到包含 '{search_content_regex}' 的内容。"
-    else: return "\n".join(str(p.relative_to(base_dir)) for p in matched_paths)
-def replace_in_file(name: str, search_regex: str, replace_string: str, count: int = 0) -> str:
-    print(f"(replace_in_file '{name}' regex='{search_regex}' replacement='{replace_string}' count={count})"); file_to_modify = base_dir / name
-    ok, msg = _validate_path(file_to_modify, check_existence=True, expect_file=True)
-    if not ok: return msg
-    try:
-        original_content = file_to_modify.read_text(encoding='utf-8')
-        new_content, num_replacements = re.subn(search_regex, replace_string, original_content, count=count)
-        if num_replacements > 0: file_to_modify.write_text(new_content, encoding='utf-8'); return f"在文件 '{name}' 中成功替换了 {num_replacements} 处匹配。"
-        else: return f"在文件 '{name}' 中未找到与正则表达式 '{search_regex}' 匹配的内容。"
-    except re.error as e: return f"提供的正则表达式 '{search_regex}' 无效: {e}"
-    except Exception as e: return f"在文件 '{name}' 中进行替换操作时发生错误：{e}"
-def archive_files(archive_name: str, items_to_archive: list[str], archive_format: str = "zip") -> str:
-    print(f"(archive_files '{archive_name}' items='{items_to_archive}' format='{archive_format}')"); guessed_format = archive_format.lower()
-    if guessed_format == "tar":
-        if archive_name.lower().endswith((".tar.gz", ".tgz")): guessed_format = "gztar"
-        elif archive_name.lower().endswith((".tar.bz2", ".tbz2")): guessed_format = "bztar"
-
-    final_archive_format = guessed_format; archive_path_full = base_dir / archive_name
-    ok_arc_path, msg_arc_path = _validate_path(archive_path_full, check_existence=False)
-    if not ok_arc_path: return msg_arc_path
-    if archive_path_full.exists(): return f"错误：归档文件 '{archive_name}' 已存在。"
-
-    abs_paths_to_archive = []
-    for item_name_str in items_to_archive:
-        item_path = base_dir / item_name_str; ok_item, msg_item = _validate_path(item_path, check_existence=True)
-        if not ok_item: return f"错误：要归档的项 '{item_name_str}' 无效或不存在：{msg_item}"
-        abs_paths_to_archive.append(item_path)
-    if not abs_paths_to_archive: return "错误：没有指定任何有效的文件或目录进行归档。"
-
-    valid_formats_map = {"zip": None, "tar": "w", "gztar": "w:gz", "bztar": "w:bz2"}
-    if final_archive_format not in valid_formats_map: return f"错误：不支持的归档格式 '{final_archive_format}'。支持的格式: {', '.join(valid_formats_map.keys())}."
-    try:
-        archive_path_full.parent.mkdir(parents=True, exist_ok=True)
-        if final_archive_format == "zip":
-            with zipfile.ZipFile(archive_path_full, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for item_abs_path in abs_paths_to_archive:
-                    arcname_in_zip = item_abs_path.relative_to(base_dir)
-                    if item_abs_path.is_file(): zf.write(item_abs_path, arcname_in_zip)
-                    elif item_abs_path.is_dir():
-                        for root, _, files_in_dir in os.walk(item_abs_path):
-                            root_path_obj = Path(root)
-                            for file_name_in_dir in files_in_dir:
-                                file_to_add_path = root_path_obj / file_name_in_dir
-                                ok_f, msg_f = _validate_path(file_to_add_path, check_existence=True, expect_file=True)
-                                if not ok_f:
-                                    print(f"警告: 跳过归档中的无效文件 {file_to_add_path}: {msg_f}")
-                                    continue
-                                file_arcname_in_zip = file_to_add_path.relative_to(base_dir)
-                                zf.write(file_to_add_path, file_arcname_in_zip)
-        else: # tar based formats
-            tar_mode = valid_formats_map[final_archive_format]
-            with tarfile.open(archive_path_full, tar_mode) as tf:
-                for item_abs_path in abs_paths_to_archive:
-                    arcname_in_tar = item_abs_path.relative_to(base_dir)
-                    tf.add(item_abs_path, arcname=arcname_in_tar)
-        return f"成功创建归档 '{archive_name}' (格式: {final_archive_format})。"
-    except Exception as e:
-        if archive_path_full.exists():
-            try: archive_path_full.unlink()
-            except: pass
-        return f"创建归档 '{archive_name}' 时发生错误：{e}"
-def extract_archive(archive_name: str, destination_path: str = ".", specific_members: Optional[list[str]] = None) -> str:
-    print(f"(extract_archive '{archive_name}' dest='{destination_path}' members='{specific_members}')"); archive_file_to_extract = base_dir / archive_name
-    ok_arc, msg_arc = _validate_path(archive_file_to_extract, check_existence=True, expect_file=True)
-    if not ok_arc: return msg_arc
-
-    extraction_dest_dir_relative = Path(destination_path)
-    extraction_dest_dir_abs = (base_dir / extraction_dest_dir_relative).resolve()
-    
-    ok_dest, msg_dest = _validate_path(extraction_dest_dir_abs, check_existence=False, expect_dir=True if extraction_dest_dir_abs.exists() else False)
-    if not ok_dest: return msg_dest
-
-    try:
-        extraction_dest_dir_abs.mkdir(parents=True, exist_ok=True)
-        extracted_count = 0
-        actual_extracted_members = []
-
-        if archive_file_to_extract.name.lower().endswith(".zip"):
-            with zipfile.ZipFile(archive_file_to_extract, 'r') as zf:
-                members_to_extract_from_zip = zf.namelist()
-                if specific_members:
-                    selected_zip_members = []
-                    normalized_zip_member_map = {m.replace("\\", "/"): m for m in members_to_extract_from_zip}
-                    for sm_query in specific_members:
-                        normalized_sm_query = sm_query.replace("\\", "/")
-                        if normalized_sm_query in normalized_zip_member_map:
-                            selected_zip_members.append(normalized_zip_member_map[normalized_sm_query])
-                        else:
-                            dir_sm_query = normalized_sm_query if normalized_sm_query.endswith("/") else normalized_sm_query + "/"
-                            found_dir_member = False
-                            for zip_m_norm, zip_m_orig in normalized_zip_member_map.items():
-                                if zip_m_norm.startswith(dir_sm_query):
-                                    selected_zip_members.append(zip_m_orig)
-                                    found_dir_member = True
-                            if not found_dir_member:
-                                print(f"警告：在ZIP归档 '{archive_name}' 中未找到成员或以此为前缀的成员 '{sm_query}'。")
-                    members_to_extract_from_zip = list(set(selected_zip_members))
-                
-                if not members_to_extract_from_zip and specific_members:
-                    return f"错误：在ZIP归档中未找到任何指定的成员进行解压。"
-
-                zf.extractall(path=extraction_dest_dir_abs, members=members_to_extract_from_zip if specific_members else None)
-                extracted_count = len(members_to_extract_from_zip if specific_members else zf.namelist())
-                actual_extracted_members = members_to_extract_from_zip if specific_members else zf.namelist()
-
-        elif tarfile.is_tarfile(archive_file_to_extract):
-            with tarfile.open(archive_file_to_extract, 'r:*') as tf:
-                tar_members_to_extract_info = []
-                all_tar_members_info = tf.getmembers()
-
-                if specific_members:
-                    normalized_tar_member_map = {m.name.replace("\\", "/"): m for m in all_tar_members_info}
-                    for sm_name_query in specific_members:
-                        normalized_sm_query = sm_name_query.replace("\\", "/")
-                        if normalized_sm_query in normalized_tar_member_map:
-                            tar_members_to_extract_info.append(normalized_tar_member_map[normalized_sm_query])
-                        else:
-                            dir_sm_query = normalized_sm_query if normalized_sm_query.endswith("/") else normalized_sm_query + "/"
-                            found_dir_member = False
-                            for tar_m_norm, tar_m_info in normalized_tar_member_map.items():
-                                if tar_m_norm.startswith(dir_sm_query):
-                                    tar_members_to_extract_info.append(tar_m_info)
-                                    found_dir_member = True
-                            if not found_dir_member:
-                                print(f"警告：在TAR归档 '{archive_name}' 中未找到成员或以此为前缀的成员 '{sm_name_query}'。")
-                    tar_members_to_extract_info = list(set(tar_members_to_extract_info))
-                else:
-                    tar_members_to_extract_info = all_tar_members_info
-                
-                if not tar_members_to_extract_info and specific_members:
-                     return f"错误：在TAR归档中未找到任何指定的成员进行解压。"
-
-                tf.extractall(path=extraction_dest_dir_abs, members=tar_members_to_extract_info if specific_members else None)
-                extracted_count = len(tar_members_to_extract_info)
-                actual_extracted_members = [m.name for m in tar_members_to_extract_info]
-        else:
-            return f"错误：无法识别的归档文件格式或文件 '{archive_name}' 已损坏。"
-
-        display_destination_path = str(extraction_dest_dir_abs.relative_to(base_dir)) if extraction_dest_dir_abs.is_relative_to(base_dir) else str(extraction_dest_dir_abs)
-
-        result_msg = f"从 '{archive_name}' 成功解压 {extracted_count} 个成员/文件到 './{display_destination_path}'。"
-        if actual_extracted_members:
-            result_msg += f"\n解压的成员列表 (部分): {', '.join(actual_extracted_members[:10])}{'...' if len(actual_extracted_members) > 10 else ''}"
-        return result_msg
-    except Exception as e:
-        return f"解压归档 '{archive_name}' 时发生错误：{e}"
-def backup_file(name: str, backup_dir_name: str = "backups") -> str:
-    print(f"(backup_file '{name}' backup_dir='{backup_dir_name}')"); source_file = base_dir / name
-    ok_src, msg_src = _validate_path(source_file, check_existence=True, expect_file=True)
-    if not ok_src: return msg_src
-
-    backup_target_dir_relative = Path(backup_dir_name)
-    backup_target_dir_abs = (base_dir / backup_target_dir_relative).resolve()
-
-# --- 文件夹管理功能函数 ---
-def get_folder_tree(path: str = ".", max_depth: int = 3) -> Dict[str, Any]:
-    """获取文件夹树状结构"""
-    print(f"(get_folder_tree '{path}' max_depth={max_depth})")
-
-    target_path = base_dir / path
-    ok, msg = _validate_path(target_path, check_existence=True, expect_dir=True)
-    if not ok:
-        return {"error": msg}
-
-    def build_tree_node(current_path: Path, current_depth: int = 0) -> Dict[str, Any]:
-        """递归构建树节点"""
-        try:
-            stat = current_path.stat()
-            relative_path = str(current_path.relative_to(base_dir))
-
-            node = {
-                "name": current_path.name,
-                "path": relative_path if relative_path != "." else "",
-                "type": "folder" if current_path.is_dir() else "file",
-                "modified": datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-                "expanded": False
-            }
-
-            if current_path.is_file():
-                node["size"] = stat.st_size
-            else:
-                node["children"] = []
-                if current_depth < max_depth:
-                    try:
-                        for item in sorted(current_path.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
-                            # 验证子路径安全性
-                            ok_child, _ = _validate_path(item, check_existence=True)
-                            if ok_child:
-                                child_node = build_tree_node(item, current_depth + 1)
-                                node["children"].append(child_node)
-                    except PermissionError:
-                        pass  # 跳过无权限访问的目录
-
-            return node
-        except Exception as e:
-            return {
-                "name": current_path.name,
-                "path": str(current_path.relative_to(base_dir)),
-                "type": "error",
-                "error": str(e)
-            }
-
-    try:
-        tree = build_tree_node(target_path.resolve())
-
-        # 统计文件和文件夹数量
-        def count_items(node: Dict[str, Any]) -> tuple[int, int]:
-            files, folders = 0, 0
-            if node.get("type") == "file":
-                files = 1
-            elif node.get("type") == "folder":
-                folders = 1
-                for child in node.get("children", []):
-                    child_files, child_folders = count_items(child)
-                    files += child_files
-                    folders += child_folders
-            return files, folders
-
-        total_files, total_folders = count_items(tree)
-
-        return {
-            "tree": tree,
-            "total_files": total_files,
-            "total_folders": total_folders - 1  # 减去根目录
-        }
-    except Exception as e:
-        return {"error": f"构建文件夹树失败: {e}"}
-
-def delete_folder(path: str) -> str:
-    """删除文件夹（递归删除）"""
-    print(f"(delete_folder '{path}')")
-
-    target_path = base_dir / path
-    ok, msg = _validate_path(target_path, check_existence=True, expect_dir=True)
-    if not ok:
-        return msg
-
-    try:
-        import shutil
-        shutil.rmtree(target_path)
-        return f"文件夹 '{path}' 及其所有内容已删除成功。"
-    except Exception as e:
-        return f"删除文件夹 '{path}' 时发生错误：{e}"
-
-def get_folder_info(path: str) -> Dict[str, Any]:
-    """获取文件夹详细信息"""
-    print(f"(get_folder_info '{path}')")
-
-    target_path = base_dir / path
-    ok, msg = _validate_path(target_path, check_existence=True)
-    if not ok:
-        return {"error": msg}
-
-    try:
-        stat = target_path.stat()
-
-        info = {
-            "name": target_path.name,
-            "path": str(target_path.relative_to(base_dir)),
-            "type": "folder" if target_path.is_dir() else "file",
-            "modified": datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-            "created": datetime.datetime.fromtimestamp(stat.st_ctime).strftime('%Y-%m-%d %H:%M:%S'),
-        }
-
-        if target_path.is_file():
-            info["size"] = stat.st_size
-        else:
-            # 计算文件夹大小和文件数量
-            total_size = 0
-            file_count = 0
-            folder_count = 0
-
-            for item in target_path.rglob("*"):
-                ok_item, _ = _validate_path(item, check_existence=True)
-                if ok_item:
-                    if item.is_file():
-                        try:
-                            total_size += item.stat().st_size
-                            file_count += 1
-                        except:
-                            pass
-                    elif item.is_dir():
-                        folder_count += 1
-
-            info.update({
-                "total_size": total_size,
-                "file_count": file_count,
-                "folder_count": folder_count
-            })
-
-        return info
-    except Exception as e:
-        return {"error": f"获取文件夹信息失败: {e}"}
-    
-    ok_dest_dir, msg_dest_dir = _validate_path(backup_target_dir_abs, check_existence=False)
-    if not ok_dest_dir: return msg_dest_dir
-
-    try: backup_target_dir_abs.mkdir(parents=True, exist_ok=True)
-    except Exception as e: return f"创建备份目录 '{backup_dir_name}' 失败: {e}"
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    backup_filename = f"{source_file.stem}.{timestamp}{source_file.suffix}.bak"
-    destination_backup_file_path = backup_target_dir_abs / backup_filename
-
-    ok_dest_file, msg_dest_file = _validate_path(destination_backup_file_path, check_existence=False)
-    if not ok_dest_file: return msg_dest_file
-    if destination_backup_file_path.exists(): return f"错误：备份目标文件 '{destination_backup_file_path.name}' 已在 '{backup_dir_name}' 中存在。"
-
-    try:
-        shutil.copy2(source_file, destination_backup_file_path)
-        relative_backup_path_str = str(destination_backup_file_path.relative_to(base_dir))
-        return f"文件 '{name}' 已成功备份到：'{relative_backup_path_str}'"
-    except Exception as e: return f"备份文件 '{name}' 时发生错误：{e}"
-
-def get_system_info() -> str:
-    print("(get_system_info)")
-    import platform
-    import socket
-    import psutil
-    info = {
-        "操作系统": platform.system() + " " + platform.release(),
-        "主机名": socket.gethostname(),
-        "CPU核心数": psutil.cpu_count(),
-        "总内存(GB)": round(psutil.virtual_memory().total / (1024**3), 2),
-        "当前用户": psutil.Process().username()
-    }
-    return json.dumps(info, ensure_ascii=False, indent=2)
-
-def tavily_search_tool(query: str) -> str:
-    """网络搜索工具，使用Tavily API进行实时搜索，包含重试机制"""
-    print(f"(tavily_search_tool '{query}')")
-    if not tavily_api_key:
-        return "错误：未配置TAVILY_API_KEY，无法进行网络搜索。"
-
-    endpoint = "https://api.tavily.com/search"
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {tavily_api_key}'}
-    data = {'query': query, 'search_depth': 'basic', 'include_answer': True, 'max_results': 5}
-
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # 每次重试都创建新的客户端实例
-            client = create_sync_http_client_with_proxy(None)
-
-            with client:
-                response = client.post(endpoint, headers=headers, json=data)
-                response.raise_for_status()
-                result = response.json()
-
-                if result.get('results'):
-                    formatted_results = f"🔍 搜索查询: {query}\n\n"
-                    if result.get('answer'):
-                        formatted_results += f"📝 答案摘要:\n{result['answer']}\n\n"
-                    formatted_results += "🌐 相关链接:\n"
-                    for i, item in enumerate(result['results'][:5], 1):
-                        title = item.get('title', '无标题')
-                        url = item.get('url', '')
-                        content = item.get('content', '')[:200] + '...' if len(item.get('content', '')) > 200 else item.get('content', '')
-                        formatted_results += f"{i}. **{title}**\n   🔗 {url}\n   📄 {content}\n\n"
-                    return formatted_results
-                return f"未找到关于 '{query}' 的搜索结果。"
-
-        except httpx.ConnectError as e:
-            if "SSL" in str(e) or "EOF" in str(e):
-                logger.warning(f"Tavily搜索SSL连接错误 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2 ** attempt)  # 指数退避
-                    continue
-                else:
-                    return f"网络搜索失败：SSL连接错误。建议检查网络连接。"
-            else:
-                return f"网络搜索失败：连接错误 - {str(e)}"
-
-        except httpx.TimeoutException as e:
-            logger.warning(f"Tavily搜索超时 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(1)
-                continue
-            else:
-                return f"网络搜索失败：请求超时。"
-
-        except httpx.HTTPStatusError as e:
-            return f"网络搜索失败：HTTP错误 {e.response.status_code}"
-
-        except Exception as e:
-            logger.error(f"Tavily搜索发生未知错误: {e}")
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(1)
-                continue
-            else:
-                return f"网络搜索失败：{str(e)}"
-
-    return "网络搜索失败：超过最大重试次数"
-
 # --- 系统提示 (修改后) ---
 BASE_SYSTEM_PROMPT = f"""你是 ShellAI，一个经验丰富的程序员助手，使用中文与用户交流。
 你的主要任务是协助用户进行文件和目录操作，以及在需要时进行网络搜索。
-当前工作目录严格限制在 './{base_dir.name}/'，所有文件操作都将在这个沙箱目录内进行。
+当前工作目录严格限制在 './{sandbox_tools.base_dir.name}/'，所有文件操作都将在这个沙箱目录内进行。
 
 可用工具:
-- 文件/目录操作 (所有路径参数均相对于 './{base_dir.name}/'):
-  `read_file(name: str)`: 读取文件内容。
+- 文件/目录操作 (所有路径参数均相对于 './{sandbox_tools.base_dir.name}/'):
+  `read_file(name: str, start_line: int = None, end_line: int = None, offset: int = None, length: int = None, head: int = None, tail: int = None)`: 读取文件内容。大文件每次最多返回256KB，可按行范围 (从1开始)、字节偏移/长度或开头/末尾N行读取一部分，四种方式只能选一种。
   `list_files(path: str = ".")`: 列出目录内容。
   `rename_file(name: str, new_name: str)`: 重命名文件或目录。
   `write_file(name: str, content: str, mode: str = 'w')`: 写入文件 (w覆盖, a追加)。
   `create_directory(name: str)`: 创建目录。
   `delete_file(name: str)`: 删除文件 (不能删除目录)。
+  `batch_files(operations: list[dict])`: 一次执行多个文件操作，适合批量整理。每个操作是 {{"op": "create", "path": 目录}}、{{"op": "write", "path": 文件, "content": 内容, "mode": "w"或"a"}}、{{"op": "move", "path": 源, "dest": 目标}} 或 {{"op": "delete", "path": 文件或目录}}；按列表顺序生效，先校验全部操作，有无效操作时整批不执行，互不相关的操作并发执行。
   `pwd()`: 显示当前AI操作的基础目录。
-  `diff_files(f1: str, f2: str)`: 比较两个文件的差异。
+  `diff_files(f1: str, f2: str, context: int = 3, max_lines: int = 2000)`: 比较两个文件的差异 (统一格式，context为上下文行数，超过max_lines行时截断)。
   `tree(path: str = ".", depth: int = -1)`: 树状显示目录结构。
-  `find_files(pattern: str, path: str = ".", search_content_regex: str = None, case_sensitive: bool = False, recursive: bool = True)`: 查找文件，可选内容搜索。
+  `find_files(pattern: str, path: str = ".", search_content_regex: str = None, case_sensitive: bool = False, recursive: bool = True, max_results: int = 1000)`: 查找文件，可选内容搜索 (最多返回max_results条匹配)。
   `replace_in_file(name: str, search_regex: str, replace_string: str, count: int = 0)`: 文件内正则替换。
-  `archive_files(archive_name: str, items_to_archive: list[str], archive_format: str = "zip")`: 归档文件或目录 (支持 zip, tar, tar.gz/tgz, tar.bz2/tbz2)。
-  `extract_archive(archive_name: str, destination_path: str = ".", specific_members: list[str] = None)`: 解压归档文件。
-  `backup_file(name: str, backup_dir_name: str = "backups")`: 备份文件。
+  `replace_in_files(pattern: str, search_regex: str, replace_string: str, path: str = ".", count: int = 0, recursive: bool = True)`: 在匹配glob模式的所有文件中并行正则替换，报告每个文件的替换次数 (count为每个文件的上限)。
+  `archive_files(archive_name: str, items_to_archive: list[str], archive_format: str = "zip")`: 归档文件或目录 (支持 zip, tar, tar.gz/tgz, tar.bz2/tbz2, tar.zst/tzst；zip和tar.zst使用多核并行压缩)。
+  `extract_archive(archive_name: str, destination_path: str = ".", specific_members: list[str] = None)`: 解压归档文件 (specific_members可以是成员名或目录前缀)。
+  `list_archive(archive_name: str, prefix: str = "", limit: int = 200)`: 列出归档中的成员及大小而不解压，可按目录前缀过滤。
+  `backup_file(name: str, backup_dir_name: str = "backups")`: 备份文件 (自上次备份以来未修改时不重复备份)。
+  `file_fingerprint(name: str)`: 获取文件的内容哈希、大小、行数和是否二进制 (结果缓存，文件未变化时不重新读取)，用于判断文件是否相同或自上次以来是否修改。
   `get_system_info()`: 获取本机系统信息。
 - 文件夹管理 (增强功能):
   `get_folder_tree(path: str = ".", max_depth: int = 3)`: 获取文件夹树状结构，包含文件和文件夹的详细信息。
   `delete_folder(path: str)`: 递归删除文件夹及其所有内容 (谨慎使用)。
-  `get_folder_info(path: str)`: 获取文件夹详细信息，包括大小、文件数量等统计信息。
+  `get_folder_info(path: str, refresh: bool = False)`: 获取文件夹详细信息，包括大小、文件数量等统计信息。文件可能被其他程序修改过时传入 refresh=True 重新统计。
 - 网络搜索:
   `tavily_search_tool(query: str)`: 当你需要查找当前知识库之外的信息、实时信息或进行广泛的网络搜索时使用此工具。
 
@@ -1025,32 +577,15 @@ BASE_SYSTEM_PROMPT = f"""你是 ShellAI，一个经验丰富的程序员助手
 - **操作后报告**: 在工具执行后，你会收到结果。请根据该结果向用户报告操作的成功与否。如果失败，请解释原因。
 """
 
-def create_intelligent_agent(proxy_config: Optional[Dict] = None):
-    """创建智能体实例"""
+def create_intelligent_agent(proxy_config: Optional[Dict] = None, channel_id: Optional[str] = None):
+    """创建智能体实例；消息代理可用时，重型工具提交到files/search队列执行，进度发布到channel_id"""
+    tools = dict(sandbox_tools.TOOLS)
+    if REDIS_AVAILABLE and redis_pool is not None:
+        from tasks import queued_tools
+        tools = queued_tools(tools, channel_id)
     return {
         'proxy_config': proxy_config,
-        'tools': {
-            'read_file': read_file,
-            'list_files': list_files,
-            'write_file': write_file,
-            'create_directory': create_directory,
-            'delete_file': delete_file,
-            'pwd': pwd,
-            'get_system_info': get_system_info,
-            'tavily_search_tool': tavily_search_tool,
-            'rename_file': rename_file,
-            'diff_files': diff_files,
-            'tree': tree,
-            'find_files': find_files,
-            'replace_in_file': replace_in_file,
-            'archive_files': archive_files,
-            'extract_archive': extract_archive,
-            'backup_file': backup_file,
-            # 新增文件夹管理工具
-            'get_folder_tree': lambda path=".", max_depth=3: get_folder_tree(path, max_depth),
-            'delete_folder': delete_folder,
-            'get_folder_info': get_folder_info
-        },
+        'tools': tools,
         'system_prompt': BASE_SYSTEM_PROMPT
     }
 
@@ -1239,9 +774,26 @@ async def health_check():
             "network_search": "enabled" if tavily_api_key else "disabled",
             "ai_api": "enabled" if deepseek_api_key else "disabled"
         },
+        "dispatch": chat_dispatcher.stats(),
         "websocket_connections": len(manager.active_connections)
     }
 
+# 扩缩容策略 (AUTOSCALE_POLICY=module:attr)
+autoscale_policy = metrics.load_policy()
+
+@app.get("/metrics")
+async def queue_metrics():
+    """Celery队列积压深度、等待/执行时间、Worker利用率，以及扩缩容策略给出的目标容量"""
+    if not (REDIS_AVAILABLE and redis_pool):
+        raise HTTPException(status_code=503, detail="Redis不可用，无法获取队列指标")
+    try:
+        snapshot = await metrics.acollect(redis.Redis(connection_pool=redis_pool), metrics.METRICS_QUEUES)
+        snapshot["autoscale"] = autoscale_policy.recommend(snapshot)
+        return snapshot
+    except Exception as e:
+        logger.error(f"获取队列指标失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取队列指标失败: {str(e)}")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket端点，处理实时通信"""
@@ -1261,7 +813,9 @@ async def websocket_endpoint(websocket: WebSocket):
 
             message_type = data.get('type')
             if message_type == 'chat':
-                await handle_chat_message(data, channel_id)
+                manager.spawn(channel_id, handle_chat_message(data, channel_id))
+            elif message_type == 'ack':
+                manager.chunker.handle_ack(channel_id, data.get('data') or {})
             elif message_type == 'ping':
                 await manager.send_personal_message({"type": "pong"}, channel_id)
             else:
@@ -1288,22 +842,113 @@ async def handle_chat_message(data: dict, channel_id: str):
 
         task_data = {
             "message": message,
+            "channel_id": channel_id,
+            "user_id": chat_data.get('user_id'),
             "proxy_config": chat_data.get('proxy_config'),
+            "api_config": chat_data.get('api_config'),
+            "idempotency_key": chat_data.get('idempotency_key'),
         }
 
-        agent = create_intelligent_agent(task_data.get('proxy_config'))
-        response = run_agent_with_tools(agent, message)
-
-        await manager.send_personal_message({
-            "type": "result",
-            "data": {"response": response, "success": True},
-            "timestamp": datetime.datetime.now().isoformat()
-        }, channel_id)
-
+        # 幂等键在分发之前登记：无论交给Worker还是进程内执行，客户端重试的同一轮对话都只执行一次
+        key = task_data['idempotency_key']
+        if key and chat_dispatcher.broker_available():
+            task_id = str(uuid.uuid4())
+            try:
+                existing = await idempotency.claim(redis.Redis(connection_pool=redis_pool), key, task_id, channel_id)
+            except idempotency.ClaimConflict as e:
+                await manager.send_personal_message({"type": "error", "data": {"message": str(e)}}, channel_id)
+                return
+            if existing is not None:
+                await _deliver_idempotent_record(existing, channel_id)
+                await manager.send_personal_message({"type": "status", "data": {"status": "queued", "task_id": existing['task_id'], "duplicate": True}}, channel_id)
+                return
+            task_data['task_id'] = task_id
+
+        task_id = await chat_dispatcher.dispatch(task_data)
+        if task_id:
+            # 结果将由Worker发布到 result:{channel_id}，经redis_listener转发
+            await manager.send_personal_message({"type": "status", "data": {"status": "queued", "task_id": task_id}}, channel_id)
+
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"处理聊天消息失败: {e}", exc_info=True)
         await manager.send_personal_message({"type": "error", "data": {"message": f"处理失败: {str(e)}"}}, channel_id)
 
+async def _run_agent_once(task_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    在API进程内执行一次聊天，返回TaskResult格式的结果
+
+    幂等键已登记 (task_data带task_id) 时记录结果或释放幂等键，并把结果推送给重复提交而等待的频道
+    """
+    task_id = task_data.get('task_id')
+    key = task_data.get('idempotency_key') if task_id else None
+    try:
+        agent = create_intelligent_agent(task_data.get('proxy_config'), task_data.get('channel_id'))
+        response = await asyncio.to_thread(run_agent_with_tools, agent, task_data['message'])
+    except Exception as e:
+        if key:
+            waiting = await idempotency.finish(redis.Redis(connection_pool=redis_pool), key, task_id, None)
+            for channel_id in waiting:
+                await manager.send_result(_task_result_to_message({"success": False, "error": str(e), "task_id": task_id}), channel_id)
+        raise
+
+    result = {"success": True, "response": response, "task_id": task_id, "channel_id": task_data.get('channel_id')}
+    if key:
+        waiting = await idempotency.finish(redis.Redis(connection_pool=redis_pool), key, task_id, result)
+        for channel_id in waiting:
+            await manager.send_result(_task_result_to_message(result), channel_id)
+    return result
+
+async def _run_chat_locally(task_data: Dict[str, Any]):
+    """在API进程内处理聊天请求并发送结果"""
+    result = await _run_agent_once(task_data)
+    await manager.send_result(_task_result_to_message(result), task_data['channel_id'])
+
+async def _enqueue_chat_task(task_data: Dict[str, Any]) -> str:
+    """提交聊天任务到Celery Worker；幂等键已由调用方登记时沿用登记的任务ID"""
+    from tasks import process_ai_message
+
+    # 提交失败时分发器回退到进程内执行，仍由同一条登记记录保证只执行一次
+    task_id = task_data.get('task_id') or str(uuid.uuid4())
+    await asyncio.to_thread(process_ai_message.apply_async, args=[task_data], task_id=task_id)
+    return task_id
+
+async def _deliver_idempotent_record(record: Dict[str, Any], channel_id: str):
+    """原任务已完成时直接把保存的结果发给当前频道；进行中时结果会在原任务结束时推送"""
+    logger.info(f"重复提交，复用任务 {record['task_id']} (状态: {record.get('state')})")
+    if record.get('state') == idempotency.STATE_COMPLETED:
+        result = await _resolve_result(record['result'])
+        await manager.send_result(_task_result_to_message(result), channel_id)
+
+async def _chat_http_idempotent(task_data: Dict[str, Any]) -> str:
+    """HTTP聊天：同一幂等键已在执行时等待原任务的结果，否则登记后在进程内执行"""
+    redis_client = redis.Redis(connection_pool=redis_pool)
+    key, task_id = task_data['idempotency_key'], str(uuid.uuid4())
+    for _ in range(2):
+        try:
+            existing = await idempotency.claim(redis_client, key, task_id, f"http:{task_id}")
+        except idempotency.ClaimConflict:
+            continue
+        if existing is None:
+            task_data['task_id'] = task_id
+            return (await _run_agent_once(task_data))['response']
+        # HTTP请求没有推送频道，轮询等待原任务；原任务失败时重新登记
+        record = existing if existing.get('state') == idempotency.STATE_COMPLETED else await idempotency.wait_completed(redis_client, key)
+        if record is not None:
+            logger.info(f"HTTP重复提交，复用任务 {record['task_id']} 的结果")
+            result = await _resolve_result(record['result'])
+            if not result.get('success'):
+                raise Exception(result.get('error') or "处理失败")
+            return result.get('response', '')
+    raise Exception("同一轮对话的请求正在重试，请稍后再试")
+
+chat_dispatcher = ChatDispatcher(
+    enqueue=_enqueue_chat_task,
+    run_local=_run_chat_locally,
+    broker_available=lambda: REDIS_AVAILABLE and redis_pool is not None
+)
+
 @app.post("/chat", response_model=ChatResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
 async def chat(request: ChatRequest) -> ChatResponse:
     """聊天API端点 (兼容性接口)"""
@@ -1320,9 +965,17 @@ async def chat(request: ChatRequest) -> ChatResponse:
 
     try:
         logger.info(f"HTTP聊天请求: {user_message}")
-        proxy_config_dict = proxy_config.model_dump() if proxy_config else None
-        agent = create_intelligent_agent(proxy_config_dict)
-        response = run_agent_with_tools(agent, user_message)
+        task_data = {
+            "message": user_message,
+            "proxy_config": proxy_config.model_dump() if proxy_config else None,
+            "idempotency_key": request.idempotency_key,
+        }
+        # WebSocket失败后降级到HTTP的同一轮对话携带相同的幂等键，不会再执行一次
+        if request.idempotency_key and chat_dispatcher.broker_available():
+            response = await _chat_http_idempotent(task_data)
+        else:
+            # 工具可能等待队列中的任务，不阻塞事件循环
+            response = (await _run_agent_once(task_data))['response']
         return ChatResponse(response=response)
     except Exception as e:
         logger.error(f"HTTP聊天处理失败: {e}", exc_info=True)
@@ -1352,6 +1005,113 @@ async def get_folder_tree_endpoint(path: str = ".", max_depth: int = 3):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取文件夹树失败: {str(e)}")
 
+@app.get("/api/folders/children", response_model=FolderChildrenResponse)
+async def get_folder_children_endpoint(path: str = ".", cursor: Optional[str] = None, limit: int = 200):
+    """懒加载文件夹树：返回一层子节点，支持游标分页"""
+    try:
+        result = await asyncio.to_thread(list_folder_children, path, cursor, limit)
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取子节点失败: {str(e)}")
+
+@app.get("/api/files/search")
+async def search_files_endpoint(regex: str, pattern: str = "*", path: str = ".", case_sensitive: bool = False,
+                                recursive: bool = True, max_results: int = SEARCH_MAX_RESULTS):
+    """
+    并行内容搜索，以NDJSON流式返回：每行一个匹配 {"path", "line", "text"} 或读取错误 {"path", "error"}，
+    最后一行为 {"done": true, "count", "truncated"}
+    """
+    search_root = sandbox_tools.base_dir / path
+    ok, msg = sandbox_tools.validate_path(search_root, check_existence=True, expect_dir=True)
+    if not ok:
+        raise HTTPException(status_code=400, detail=msg)
+    try:
+        re.compile(regex, sandbox_tools.search_flags(case_sensitive))
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"提供的正则表达式 '{regex}' 无效: {e}")
+    max_results = max(1, max_results)
+    root = search_root.resolve()
+
+    def stream():
+        count = 0
+        flags = sandbox_tools.search_flags(case_sensitive)
+        events = None
+        try:
+            files = sandbox_tools.narrow_search_files(sandbox_tools.iter_search_files(root, pattern, recursive), regex, flags)
+            events = search_engine.search(files, regex, flags, max_results=max_results)
+            for event in events:
+                relative = str(Path(event.path).relative_to(sandbox_tools.base_dir))
+                if isinstance(event, search_engine.SearchError):
+                    record = {"path": relative, "error": event.error}
+                else:
+                    count += 1
+                    record = {"path": relative, "line": event.line_no, "text": event.line}
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"搜索失败: {e}"}, ensure_ascii=False) + "\n"
+        finally:
+            if events is not None:
+                events.close()
+        yield json.dumps({"done": True, "count": count, "truncated": count >= max_results}) + "\n"
+
+    # 同步生成器由Starlette在线程池中迭代；客户端断开时生成器被关闭，未开始的扫描批次随之取消
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- 文件传输API端点 ---
+@app.get("/api/files")
+@app.head("/api/files")
+async def download_file_endpoint(request: Request, path: str, download: bool = False):
+    """从沙箱流式下载文件，支持 Range、If-Range、ETag 和 If-Modified-Since"""
+    target_path = sandbox_tools.base_dir / path
+    ok, msg = sandbox_tools.validate_path(target_path, check_existence=True, expect_file=True)
+    if not ok:
+        raise HTTPException(status_code=404 if "不存在" in msg else 400, detail=msg)
+    resolved = target_path.resolve()
+    try:
+        stat_result = await asyncio.to_thread(os.stat, resolved)
+    except OSError as e:
+        raise HTTPException(status_code=404, detail=f"读取文件 '{path}' 失败: {e}")
+
+    response = FileResponse(resolved, stat_result=stat_result, filename=resolved.name,
+                            content_disposition_type="attachment" if download else "inline")
+    etag = response.headers["etag"]
+    if file_transfer.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since"),
+                                  etag, stat_result.st_mtime):
+        return Response(status_code=304, headers={"etag": etag, "last-modified": response.headers["last-modified"]})
+    return response
+
+@app.put("/api/files")
+async def upload_file_endpoint(request: Request, path: str, overwrite: bool = True):
+    """把请求体流式写入沙箱文件：先写临时文件，完成后原子替换"""
+    target_path = sandbox_tools.base_dir / path
+    ok, msg = sandbox_tools.validate_path(target_path, check_existence=False)
+    if not ok:
+        raise HTTPException(status_code=400, detail=msg)
+    resolved = Path(os.path.realpath(target_path))
+    if resolved.is_dir():
+        raise HTTPException(status_code=400, detail=f"错误：路径 '{path}' 是一个目录，无法写入文件。")
+    existed = resolved.exists()
+    if existed and not overwrite:
+        raise HTTPException(status_code=409, detail=f"错误：文件 '{path}' 已存在。")
+
+    try:
+        await asyncio.to_thread(resolved.parent.mkdir, parents=True, exist_ok=True)
+        size = await file_transfer.write_stream_atomic(resolved, request.stream())
+    except file_transfer.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="上传中断，文件未修改")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"写入文件 '{path}' 失败: {str(e)}")
+    finally:
+        sandbox_tools.on_sandbox_change(resolved)
+
+    return {"success": True, "path": path, "size": size, "created": not existed}
+
 @app.post("/api/folders/create")
 async def create_folder_endpoint(request: FolderCreateRequest):
     """创建文件夹"""
@@ -1396,11 +1156,26 @@ async def rename_folder_endpoint(request: FolderRenameRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"重命名文件夹失败: {str(e)}")
 
+@app.post("/api/files/batch")
+async def batch_files_endpoint(request: BatchRequest):
+    """批量文件操作：先校验全部操作，互不相关的操作并发执行，返回每个操作的结果"""
+    try:
+        operations = [operation.model_dump(exclude_none=True) for operation in request.operations]
+        results = await asyncio.to_thread(batch_file_operations, operations)
+        return {"success": all(r["status"] == "ok" for r in results), "results": results}
+    except file_batch.BatchValidationError as e:
+        raise HTTPException(status_code=400, detail={
+            "message": "批量操作未执行：存在无效的操作",
+            "errors": [{"index": index, "message": message} for index, message in e.errors]
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量操作失败: {str(e)}")
+
 @app.get("/api/folders/info")
-async def get_folder_info_endpoint(path: str):
-    """获取文件夹详细信息"""
+async def get_folder_info_endpoint(path: str, refresh: bool = False):
+    """获取文件夹详细信息；refresh=true 时重新统计文件大小"""
     try:
-        result = get_folder_info(path)
+        result = get_folder_info(path, refresh)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
@@ -1412,7 +1187,7 @@ async def get_folder_info_endpoint(path: str):
 def main():
     """主函数 - 启动FastAPI服务"""
     logger.info("Chrome Plus V2.0 后端服务启动中...")
-    os.makedirs(base_dir, exist_ok=True)
+    os.makedirs(sandbox_tools.base_dir, exist_ok=True)
     
     import uvicorn
     from config import settings
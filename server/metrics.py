@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+队列与Worker负载指标
+Worker在任务开始/结束时把等待时间、执行时间和占用槽位写入Redis，
+API进程汇总为每个队列的积压深度、延迟分布和Worker利用率，
+并交给可替换的扩缩容策略计算目标并发数/副本数
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import importlib
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- 指标配置 ---
+METRICS_SAMPLE_SIZE = int(os.getenv('METRICS_SAMPLE_SIZE', '500'))        # 每个队列保留的最近样本数
+METRICS_WORKER_TTL = int(os.getenv('METRICS_WORKER_TTL', '60'))           # Worker心跳超过该秒数视为离线
+METRICS_QUEUES = os.getenv('METRICS_QUEUES', 'chat,search,files').split(',')
+AUTOSCALE_POLICY = os.getenv('AUTOSCALE_POLICY', 'metrics:BacklogPolicy')  # module:attr
+AUTOSCALE_TARGET_WAIT = float(os.getenv('AUTOSCALE_TARGET_WAIT', '2'))    # 期望的排队等待时间(秒)
+AUTOSCALE_MIN_CONCURRENCY = int(os.getenv('AUTOSCALE_MIN_CONCURRENCY', '1'))
+AUTOSCALE_MAX_CONCURRENCY = int(os.getenv('AUTOSCALE_MAX_CONCURRENCY', '1000'))
+
+WORKERS_KEY = 'metrics:workers'
+ACTIVE_KEY = 'metrics:active'
+
+# 任务发布时写入消息头的时间戳字段
+SENT_AT_HEADER = 'sent_at'
+
+
+def priority_queue_keys(queue: str, steps: Iterable[int] = range(10), sep: str = ':') -> List[str]:
+    """Redis broker按优先级拆分后的列表键: queue, queue:1 ... queue:9"""
+    return [queue if step == 0 else f"{queue}{sep}{step}" for step in steps]
+
+
+def _samples_key(queue: str, kind: str) -> str:
+    return f"metrics:{queue}:{kind}"
+
+
+def _active_field(hostname: str, queue: str) -> str:
+    return f"{hostname}|{queue}"
+
+
+# --- Worker侧 (同步redis) ---
+def stamp_sent_at(headers: Dict[str, Any], now: Optional[float] = None) -> None:
+    """任务发布时记录入队时间"""
+    headers.setdefault(SENT_AT_HEADER, time.time() if now is None else now)
+
+
+def register_worker(client, hostname: str, concurrency: int, queues: List[str]) -> None:
+    """登记Worker的并发数和消费的队列，同时作为心跳"""
+    client.hset(WORKERS_KEY, hostname, json.dumps({
+        "concurrency": concurrency, "queues": queues, "ts": time.time()
+    }))
+
+
+def task_started(client, hostname: str, queue: str, sent_at: Optional[float],
+                 now: Optional[float] = None) -> None:
+    """任务开始执行：占用一个槽位并记录排队等待时间"""
+    now = time.time() if now is None else now
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(ACTIVE_KEY, _active_field(hostname, queue), 1)
+    if sent_at is not None:
+        pipe.lpush(_samples_key(queue, 'wait'), round(max(0.0, now - float(sent_at)), 4))
+        pipe.ltrim(_samples_key(queue, 'wait'), 0, METRICS_SAMPLE_SIZE - 1)
+    pipe.execute()
+
+
+def task_finished(client, hostname: str, queue: str, runtime: Optional[float]) -> None:
+    """任务结束：释放槽位并记录执行时间"""
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(ACTIVE_KEY, _active_field(hostname, queue), -1)
+    if runtime is not None:
+        pipe.lpush(_samples_key(queue, 'exec'), round(runtime, 4))
+        pipe.ltrim(_samples_key(queue, 'exec'), 0, METRICS_SAMPLE_SIZE - 1)
+    pipe.execute()
+
+
+def queue_consumers(client, queue: str, now: Optional[float] = None) -> List[str]:
+    """心跳未过期、正在消费该队列的Worker主机名"""
+    now = time.time() if now is None else now
+    consumers = []
+    for hostname, info in client.hgetall(WORKERS_KEY).items():
+        info = json.loads(_decode(info))
+        if now - info.get('ts', 0) <= METRICS_WORKER_TTL and queue in info.get('queues', []):
+            consumers.append(_decode(hostname))
+    return consumers
+
+
+def reset_worker(client, hostname: str) -> None:
+    """Worker退出时清除其登记信息和槽位计数"""
+    fields = [f for f in client.hkeys(ACTIVE_KEY) if _decode(f).startswith(f"{hostname}|")]
+    pipe = client.pipeline(transaction=False)
+    pipe.hdel(WORKERS_KEY, hostname)
+    if fields:
+        pipe.hdel(ACTIVE_KEY, *fields)
+    pipe.execute()
+
+
+# --- 汇总 ---
+def _decode(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _distribution(samples: List[Any]) -> Dict[str, Any]:
+    values = sorted(float(_decode(v)) for v in samples)
+    if not values:
+        return {"count": 0, "avg": None, "p50": None, "p95": None}
+    return {
+        "count": len(values),
+        "avg": round(sum(values) / len(values), 4),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)],
+    }
+
+
+def _queue_commands(pipe, queues: List[str]) -> None:
+    for queue in queues:
+        for key in priority_queue_keys(queue):
+            pipe.llen(key)
+        pipe.lrange(_samples_key(queue, 'wait'), 0, -1)
+        pipe.lrange(_samples_key(queue, 'exec'), 0, -1)
+    pipe.hgetall(WORKERS_KEY)
+    pipe.hgetall(ACTIVE_KEY)
+
+
+def _build_snapshot(raw: List[Any], queues: List[str], now: float) -> Dict[str, Any]:
+    workers_raw, active_raw = raw[-2], raw[-1]
+    workers = {}
+    for hostname, info in workers_raw.items():
+        info = json.loads(_decode(info))
+        if now - info.get('ts', 0) <= METRICS_WORKER_TTL:
+            workers[_decode(hostname)] = info
+    active: Dict[str, int] = {}
+    for field, count in active_raw.items():
+        hostname, _, queue = _decode(field).partition('|')
+        if hostname in workers:
+            active[queue] = active.get(queue, 0) + max(0, int(count))
+
+    snapshot: Dict[str, Any] = {"timestamp": now, "workers": len(workers), "queues": {}}
+    steps = len(priority_queue_keys(''))
+    pos = 0
+    for queue in queues:
+        depth = sum(int(n) for n in raw[pos:pos + steps])
+        wait_samples, exec_samples = raw[pos + steps], raw[pos + steps + 1]
+        pos += steps + 2
+        queue_workers = [w for w in workers.values() if queue in w.get('queues', [])]
+        concurrency = sum(int(w.get('concurrency', 0)) for w in queue_workers)
+        busy = active.get(queue, 0)
+        snapshot["queues"][queue] = {
+            "depth": depth,
+            "wait_time": _distribution(wait_samples),
+            "exec_time": _distribution(exec_samples),
+            "workers": len(queue_workers),
+            "concurrency": concurrency,
+            "active": busy,
+            "utilization": round(busy / concurrency, 4) if concurrency else None,
+        }
+    return snapshot
+
+
+def collect(client, queues: List[str]) -> Dict[str, Any]:
+    """同步汇总各队列指标"""
+    pipe = client.pipeline(transaction=False)
+    _queue_commands(pipe, queues)
+    return _build_snapshot(pipe.execute(), queues, time.time())
+
+
+async def acollect(client, queues: List[str]) -> Dict[str, Any]:
+    """异步汇总各队列指标 (redis.asyncio)"""
+    pipe = client.pipeline(transaction=False)
+    _queue_commands(pipe, queues)
+    return _build_snapshot(await pipe.execute(), queues, time.time())
+
+
+# --- 扩缩容策略 ---
+class AutoscalePolicy(ABC):
+    """
+    扩缩容策略接口
+
+    recommend() 接收 collect() 的快照，返回每个队列的建议:
+      {"queue": {"concurrency": 目标并发槽位数, "replicas": 目标Worker数}}
+    子类未实现 recommend() 时在实例化 (load_policy) 时失败，而不是在首次查询指标时
+    """
+
+    @abstractmethod
+    def recommend(self, snapshot: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        """计算每个队列的建议并发数和副本数"""
+
+
+class FunctionPolicy(AutoscalePolicy):
+    """把 snapshot -> dict 的函数包装为策略"""
+
+    def __init__(self, func: Callable[[Dict[str, Any]], Dict[str, Dict[str, int]]]):
+        self.func = func
+
+    def recommend(self, snapshot: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        return self.func(snapshot)
+
+
+class BacklogPolicy(AutoscalePolicy):
+    """
+    按积压量估算容量: 在 target_wait 秒内消化当前积压所需的槽位数，
+    加上正在执行的任务数；没有执行时间样本时按每任务1秒估算
+    """
+
+    def __init__(self, target_wait: float = AUTOSCALE_TARGET_WAIT,
+                 min_concurrency: int = AUTOSCALE_MIN_CONCURRENCY,
+                 max_concurrency: int = AUTOSCALE_MAX_CONCURRENCY):
+        self.target_wait = max(target_wait, 0.001)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+
+    def recommend(self, snapshot: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        result = {}
+        for queue, stats in snapshot.get("queues", {}).items():
+            exec_avg = stats["exec_time"]["avg"] or 1.0
+            needed = stats["active"] + math.ceil(stats["depth"] * exec_avg / self.target_wait)
+            target = max(self.min_concurrency, min(self.max_concurrency, needed))
+            per_worker = stats["concurrency"] // stats["workers"] if stats["workers"] else 0
+            replicas = math.ceil(target / per_worker) if per_worker else 1
+            result[queue] = {"concurrency": target, "replicas": max(1, replicas)}
+        return result
+
+
+def load_policy(spec: str = AUTOSCALE_POLICY) -> AutoscalePolicy:
+    """
+    按 "module:attr" 加载策略；attr可以是策略类、策略实例或 snapshot -> dict 的函数
+    """
+    module_name, _, attr = spec.partition(':')
+    target = getattr(importlib.import_module(module_name), attr or 'BacklogPolicy')
+    if isinstance(target, type):
+        if not issubclass(target, AutoscalePolicy):
+            raise TypeError(f"扩缩容策略 {spec} 必须继承 AutoscalePolicy")
+        return target()     # 未实现 recommend() 的子类在这里抛出TypeError
+    if isinstance(target, AutoscalePolicy):
+        return target
+    if callable(target):
+        return FunctionPolicy(target)
+    raise TypeError(f"无效的扩缩容策略: {spec}")
+
+
+# --- Celery autoscaler ---
+try:
+    from celery.worker.autoscale import Autoscaler
+except ImportError:  # pragma: no cover - API进程不需要celery
+    Autoscaler = object
+
+
+class MetricsAutoscaler(Autoscaler):
+    """
+    按扩缩容策略调整prefork Worker进程数
+    通过 worker_autoscaler 配置启用，仅在以 --autoscale=max,min 启动时生效；
+    取不到指标时回退到Celery默认的按预取任务数扩缩
+    """
+
+    client = None
+    queue: Optional[str] = None
+    policy: Optional[AutoscalePolicy] = None
+
+    def _maybe_scale(self, req=None):
+        target = self._policy_target()
+        if target is None:
+            return super()._maybe_scale(req)
+        procs = self.processes
+        target = max(self.min_concurrency, min(self.max_concurrency, target))
+        if target > procs:
+            self.scale_up(target - procs)
+            return True
+        if target < procs:
+            self.scale_down(procs - target)
+            return True
+
+    def _policy_target(self) -> Optional[int]:
+        if self.client is None or self.queue is None:
+            return None
+        try:
+            if self.policy is None:
+                type(self).policy = load_policy()
+            snapshot = collect(self.client, [self.queue])
+            recommendation = self.policy.recommend(snapshot).get(self.queue)
+        except Exception as e:
+            logger.warning(f"扩缩容策略计算失败: {e}")
+            return None
+        if not recommendation:
+            return None
+        # 策略给出的是整个队列的目标并发，平摊到当前在线的Worker
+        workers = max(1, snapshot["queues"][self.queue]["workers"])
+        return math.ceil(recommendation["concurrency"] / workers)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱路径校验
+- 沙箱根目录只解析一次
+- 单个路径的校验只做一次 realpath 和一次 stat
+- 已校验目录下的子条目：非符号链接的条目必然仍在沙箱内，无需任何系统调用；
+  只有符号链接需要解析，且每次都重新解析 (目标链可能在沙箱的其他位置被修改)
+"""
+
+import os
+import stat
+from pathlib import Path
+
+
+class PathGuard:
+    """沙箱路径校验器"""
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        self.base = os.path.realpath(self.base_dir)
+        self._prefix = self.base.rstrip(os.sep) + os.sep
+
+    def contains(self, resolved: str) -> bool:
+        """已解析的绝对路径是否位于沙箱内"""
+        return resolved == self.base or resolved.startswith(self._prefix)
+
+    def validate(self, target_path: Path, check_existence=False, expect_dir=False, expect_file=False):
+        """与原 _validate_path 语义一致，返回 (是否通过, 错误信息)"""
+        try:
+            if not os.path.isdir(self.base_dir):
+                return False, f"错误：基础目录 '{self.base_dir}' 不存在或不是目录。"
+            resolved = os.path.realpath(target_path)
+            if not self.contains(resolved):
+                return False, f"错误：路径 '{resolved}' 超出了允许的操作范围 '{self.base_dir}'。"
+            try:
+                mode = os.stat(resolved).st_mode
+            except FileNotFoundError:
+                mode = None
+            if check_existence and mode is None:
+                return False, f"错误：路径 '{target_path}' 不存在。"
+            if mode is not None:
+                if expect_dir and not stat.S_ISDIR(mode):
+                    return False, f"错误：路径 '{target_path}' 不是一个目录。"
+                if expect_file and not stat.S_ISREG(mode):
+                    return False, f"错误：路径 '{target_path}' 不是一个文件。"
+            return True, ""
+        except Exception as e:
+            return False, f"路径验证时发生异常：{e}"
+
+    def child_ok(self, dir_path: Path, name: str, is_symlink: bool) -> bool:
+        """
+        已校验目录下的子条目是否允许访问
+
+        Args:
+            dir_path: 已通过校验的目录
+            name: 子条目名称
+            is_symlink: 子条目是否为符号链接 (来自DirEntry或索引，无需额外stat)
+        """
+        if not is_symlink:
+            return True
+        # 链接目标链上的任何目录都可能在别处被修改，结论不能按所在目录缓存，每次重新解析
+        resolved = os.path.realpath(os.path.join(dir_path, name))
+        return self.contains(resolved) and os.path.exists(resolved)
+
+    def path_ok(self, path: Path) -> bool:
+        """父目录已通过校验的路径是否允许访问 (只需一次lstat判断是否为符号链接)"""
+        path = Path(path)
+        return self.child_ok(path.parent, path.name, os.path.islink(path))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务进度发布
+合并Celery任务执行过程中的增量事件 (token增量、工具开始/结束)，按时间间隔批量发布
+(之后没有新事件时由定时器发布，事件最多等待一个间隔)，并对结果后端的状态写入进行同样的节流；
+长时间运行的工具通过 report_tool_progress 报告进度，由执行工具的任务用 tool_progress 订阅
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# --- 进度发布配置 ---
+PROGRESS_FLUSH_MS = int(os.getenv('PROGRESS_FLUSH_MS', '100'))        # 事件批量发布间隔
+PROGRESS_STATE_MS = int(os.getenv('PROGRESS_STATE_MS', '1000'))       # update_state 最小间隔
+
+
+class ProgressPublisher:
+    """
+    进度事件合并发布器
+
+    发布的消息格式:
+      {"type": "progress", "data": {"task_id": ..., "events": [...]}}
+    事件:
+      {"event": "token", "text": ...}            连续的token增量合并为一个事件
+      {"event": "tool_started", "tool": ...}
+      {"event": "tool_finished", "tool": ..., "success": ...}
+      {"event": "tool_progress", "tool": ..., ...}   同一工具连续的进度只保留最新一次
+      {"event": "status", "status": ...}
+    """
+
+    def __init__(self, task_id: str,
+                 publish: Callable[[Dict[str, Any]], None],
+                 update_state: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 flush_interval_ms: int = PROGRESS_FLUSH_MS,
+                 state_interval_ms: int = PROGRESS_STATE_MS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.task_id = task_id
+        self._publish = publish
+        self._update_state = update_state
+        self._flush_interval = flush_interval_ms / 1000.0
+        self._state_interval = state_interval_ms / 1000.0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._last_flush = clock()
+        self._last_state = float('-inf')
+        self._pending_state: Optional[Dict[str, Any]] = None
+        self._timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.Lock()     # 定时器线程与调用线程的发布按顺序进行
+        self._closed = False
+        self.token_chars = 0
+
+    def token(self, text: str) -> None:
+        """记录一段token增量"""
+        if not text:
+            return
+        with self._lock:
+            self.token_chars += len(text)
+            if self._pending and self._pending[-1]['event'] == 'token':
+                self._pending[-1]['text'] += text
+            else:
+                self._pending.append({'event': 'token', 'text': text})
+        self._maybe_flush()
+        self.state('正在生成回复...', chars=self.token_chars)
+
+    def event(self, event: str, **fields: Any) -> None:
+        """记录工具开始/结束等离散事件，并立即发布当前批次"""
+        with self._lock:
+            self._pending.append({'event': event, **fields})
+        self.flush()
+
+    def tool_progress(self, tool: str, **fields: Any) -> None:
+        """记录工具的执行进度，按发布间隔合并"""
+        event = {'event': 'tool_progress', 'tool': tool, **fields}
+        with self._lock:
+            if self._pending and self._pending[-1]['event'] == 'tool_progress' and self._pending[-1]['tool'] == tool:
+                self._pending[-1] = event
+            else:
+                self._pending.append(event)
+        self._maybe_flush()
+
+    def state(self, status: str, progress: Optional[int] = None, **fields: Any) -> None:
+        """节流写入结果后端的任务状态"""
+        if self._update_state is None:
+            return
+        meta = {'status': status, **fields}
+        if progress is not None:
+            meta['progress'] = progress
+        now = self._clock()
+        with self._lock:
+            if now - self._last_state < self._state_interval:
+                self._pending_state = meta
+                return
+            self._last_state = now
+            self._pending_state = None
+        self._update_state(meta)
+
+    def _maybe_flush(self) -> None:
+        wait = self._flush_interval - (self._clock() - self._last_flush)
+        if wait <= 0:
+            self.flush()
+            return
+        # 间隔未到：启动定时器，保证之后没有新事件时这批事件也在间隔内发出
+        with self._lock:
+            if self._timer is not None or self._closed or not self._pending:
+                return
+            self._timer = threading.Timer(wait, self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self) -> None:
+        """立即发布所有待发送事件"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+                self._last_flush = self._clock()
+                timer, self._timer = self._timer, None
+            if timer is not None:
+                timer.cancel()
+            if events:
+                self._publish({'type': 'progress', 'data': {'task_id': self.task_id, 'events': events}})
+
+    def close(self) -> None:
+        """发布剩余事件，并写入被节流的最后一次状态；之后不再由定时器发布"""
+        with self._lock:
+            self._closed = True
+        self.flush()
+        with self._lock:
+            meta, self._pending_state = self._pending_state, None
+        if meta is not None and self._update_state is not None:
+            self._update_state(meta)
+
+
+# 当前线程 (上下文) 中正在执行的工具的进度订阅者
+_tool_progress: ContextVar[Optional[Callable[..., None]]] = ContextVar('tool_progress', default=None)
+
+
+def report_tool_progress(**fields: Any) -> None:
+    """工具报告执行进度；没有订阅者时忽略"""
+    callback = _tool_progress.get()
+    if callback is not None:
+        callback(**fields)
+
+
+@contextmanager
+def tool_progress(callback: Optional[Callable[..., None]]) -> Iterator[None]:
+    """在with块内把工具进度转交给callback"""
+    token = _tool_progress.set(callback)
+    try:
+        yield
+    finally:
+        _tool_progress.reset(token)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis批量发布
+把发往结果频道的消息在很短的时间窗口内合并，通过一次pipeline往返发送，
+代替每条消息一次 PUBLISH 往返。同步版本用于prefork/gevent Worker，
+异步版本用于运行在事件循环中的执行模式
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# --- 批量发布配置 ---
+PUBLISH_FLUSH_MS = int(os.getenv('PUBLISH_FLUSH_MS', '10'))          # 消息最长等待时间
+PUBLISH_MAX_BATCH = int(os.getenv('PUBLISH_MAX_BATCH', '256'))       # 单次pipeline最多消息数
+
+Message = Union[str, bytes, Dict[str, Any]]
+
+
+def _encode(message: Message) -> Union[str, bytes]:
+    if isinstance(message, (str, bytes)):
+        return message
+    return json.dumps(message)
+
+
+class RedisPublisher:
+    """
+    同步批量发布器
+
+    publish() 只把消息放入缓冲区并立即返回；后台线程 (gevent下为greenlet)
+    在收到第一条消息后最多等待 flush_interval_ms，再把缓冲区通过一个pipeline发出。
+    urgent=True 的消息 (最终结果等) 会立即唤醒后台线程。消息按提交顺序发送。
+    """
+
+    def __init__(self, client,
+                 flush_interval_ms: int = PUBLISH_FLUSH_MS,
+                 max_batch: int = PUBLISH_MAX_BATCH):
+        self._client = client
+        self._flush_interval = flush_interval_ms / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, Union[str, bytes]]] = []
+        self._urgent = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._queued = 0
+        self._sent = 0
+        self.batches = 0
+        self.errors = 0
+
+    def publish(self, channel: str, message: Message, urgent: bool = False) -> None:
+        """把消息加入发送缓冲区"""
+        item = (channel, _encode(message))
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._pending.append(item)
+                self._queued += 1
+                if urgent or len(self._pending) >= self._max_batch:
+                    self._urgent = True
+                    self._cond.notify_all()
+                self._ensure_thread()
+        if closed:
+            self._send([item])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """立即发送缓冲区并等待发送完成，超时返回False"""
+        with self._cond:
+            target = self._queued
+            if self._sent >= target:
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._sent >= target, timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """发送剩余消息并停止后台线程，之后的消息直接同步发送"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+        else:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._send(batch)
+
+    def _ensure_thread(self) -> None:
+        # prefork下父进程里创建的线程不会被子进程继承，按进程重新启动
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='redis-publisher', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._urgent and not self._closed:
+                    # 合并窗口：等待更多消息，期间收到urgent或close会提前结束
+                    self._cond.wait_for(lambda: self._urgent or self._closed, self._flush_interval)
+                batch = self._pending[:self._max_batch]
+                del self._pending[:len(batch)]
+                if not self._pending:
+                    self._urgent = False
+                closed = self._closed and not self._pending
+
+            if batch:
+                self._send(batch)
+            with self._cond:
+                self._sent += len(batch)
+                self._cond.notify_all()
+            if closed:
+                return
+
+    def _send(self, batch: List[Tuple[str, Union[str, bytes]]]) -> None:
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for channel, data in batch:
+                pipe.publish(channel, data)
+            pipe.execute()
+            self.batches += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"批量发布 {len(batch)} 条消息失败: {e}")
+
+
+class AsyncRedisPublisher:
+    """
+    异步批量发布器 (redis.asyncio)
+
+    行为与 RedisPublisher 相同，后台发送由事件循环中的任务完成；
+    publish() 必须在事件循环线程中调用。
+    """
+
+    def __init__(self, client,
+                 flush_interval_ms: int = PUBLISH_FLUSH_MS,
+                 max_batch: int = PUBLISH_MAX_BATCH):
+        self._client = client
+        self._flush_interval = flush_interval_ms / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, Union[str, bytes]]] = []
+        self._has_data = asyncio.Event()
+        self._urgent = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self._queued = 0
+        self._sent = 0
+        self.batches = 0
+        self.errors = 0
+
+    def publish(self, channel: str, message: Message, urgent: bool = False) -> None:
+        """把消息加入发送缓冲区"""
+        if self._closed:
+            raise RuntimeError("发布器已关闭")
+        self._pending.append((channel, _encode(message)))
+        self._queued += 1
+        if urgent or len(self._pending) >= self._max_batch:
+            self._urgent.set()
+        self._has_data.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def flush(self) -> None:
+        """立即发送缓冲区并等待发送完成"""
+        target = self._queued
+        if self._sent < target:
+            self._urgent.set()
+        while self._sent < target:
+            self._progress.clear()
+            await self._progress.wait()
+
+    async def aclose(self) -> None:
+        """发送剩余消息并停止后台任务"""
+        self._closed = True
+        if self._task is not None:
+            self._has_data.set()
+            self._urgent.set()
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending and not self._closed:
+                self._has_data.clear()
+                await self._has_data.wait()
+            if not self._urgent.is_set() and not self._closed:
+                # 合并窗口：等待更多消息，期间收到urgent或close会提前结束
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[:self._max_batch]
+            del self._pending[:len(batch)]
+            if not self._pending:
+                self._urgent.clear()
+            closed = self._closed and not self._pending
+
+            if batch:
+                await self._send(batch)
+            self._sent += len(batch)
+            self._progress.set()
+            if closed:
+                return
+
+    async def _send(self, batch: List[Tuple[str, Union[str, bytes]]]) -> None:
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for channel, data in batch:
+                    pipe.publish(channel, data)
+                await pipe.execute()
+            self.batches += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"批量发布 {len(batch)} 条消息失败: {e}")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式正则替换
+- 文件按块读取，替换结果写入同目录下的临时文件，完成后fsync并原子替换原文件；
+  没有匹配或中途出错时原文件保持不变
+- 跨块边界的匹配：每轮只提交起点距缓冲区末尾超过 REPLACE_MAX_MATCH 个字符的匹配，
+  其余文本留到下一轮与新读入的块一起扫描；已输出的文本保留 REPLACE_MAX_MATCH 个字符作为
+  后顾上下文，使 ^、\\b 和后顾断言在块边界处与整体替换 (re.subn) 的结果一致。
+  单个匹配 (含前后断言所需的上下文) 不超过 REPLACE_MAX_MATCH 个字符时结果与整体替换完全相同
+- 行尾符按原样保留 (不做换行符转换)
+- 多文件模式把文件分发到共享的扫描池 (见 search_engine) 并行替换，逐个文件报告替换次数
+"""
+
+import os
+import re
+import tempfile
+from concurrent.futures import Executor, as_completed
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import search_engine
+
+# --- 流式替换配置 ---
+REPLACE_CHUNK_CHARS = 1 << 20                                                      # 每次读取的字符数
+REPLACE_MAX_MATCH = int(os.getenv('REPLACE_MAX_MATCH', str(64 * 1024)))          # 单个匹配的最大字符数
+REPLACE_SNIFF_BYTES = 8192                                                         # 多文件模式的二进制嗅探字节数
+
+
+class FileReplaceResult(NamedTuple):
+    """多文件模式中单个文件的结果"""
+    path: str
+    count: int
+    error: Optional[str]
+
+
+def replace_stream(src, dst, regex: 're.Pattern', repl: str, count: int = 0,
+                   chunk_chars: Optional[int] = None, window: Optional[int] = None) -> int:
+    """
+    从文本流src读取、把替换结果写入dst，语义同 regex.subn(repl, text, count)
+
+    Returns:
+        替换次数
+    """
+    chunk_chars = chunk_chars or REPLACE_CHUNK_CHARS
+    window = window or REPLACE_MAX_MATCH
+    buf = ''            # 后顾上下文 + 未扫描的文本
+    scan_from = 0       # buf中未扫描文本的起点
+    total = 0
+    while True:
+        data = src.read(chunk_chars)
+        eof = not data
+        buf += data
+        limit = len(buf) if eof else len(buf) - window
+        if limit <= scan_from and not eof:
+            continue
+
+        cursor = scan_from
+        resume = limit
+        exhausted = False
+        for m in regex.finditer(buf, scan_from):
+            if m.start() >= limit and not eof:
+                break
+            if count and total >= count:
+                exhausted = True
+                break
+            dst.write(buf[cursor:m.start()])
+            dst.write(m.expand(repl))
+            cursor = m.end()
+            resume = max(resume, cursor)
+            total += 1
+        if count and total >= count:
+            exhausted = True
+
+        if exhausted or eof:
+            # 达到替换次数后其余内容原样复制
+            dst.write(buf[cursor:])
+            if not eof:
+                while True:
+                    data = src.read(chunk_chars)
+                    if not data:
+                        break
+                    dst.write(data)
+            return total
+
+        dst.write(buf[cursor:resume])
+        keep_from = max(0, resume - window)
+        buf = buf[keep_from:]
+        scan_from = resume - keep_from
+
+
+def replace_file(path: str, pattern: str, repl: str, flags: int = 0, count: int = 0) -> int:
+    """
+    流式替换单个文件 (UTF-8)，有匹配时原子替换原文件
+
+    Returns:
+        替换次数
+
+    Raises:
+        re.error: 正则表达式无效
+        UnicodeDecodeError / OSError: 读写失败，原文件保持不变
+    """
+    regex = re.compile(pattern, flags)
+    # 符号链接替换其指向的文件，而不是把链接本身换成普通文件
+    target = Path(os.path.realpath(path))
+    fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.replace')
+    try:
+        with open(target, 'r', encoding='utf-8', newline='') as src, \
+                os.fdopen(fd, 'w', encoding='utf-8', newline='') as dst:
+            total = replace_stream(src, dst, regex, repl, count)
+            dst.flush()
+            if total:
+                os.fsync(dst.fileno())
+        if total:
+            os.chmod(temp_path, target.stat().st_mode & 0o7777)
+            os.replace(temp_path, target)
+        else:
+            os.unlink(temp_path)
+        return total
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _replace_one(path: str, pattern: str, repl: str, flags: int, count: int) -> FileReplaceResult:
+    """扫描池中的任务入口 (参数和返回值均可pickle)；二进制文件跳过"""
+    try:
+        with open(path, 'rb') as f:
+            if b'\x00' in f.read(REPLACE_SNIFF_BYTES):
+                return FileReplaceResult(path, 0, None)
+        return FileReplaceResult(path, replace_file(path, pattern, repl, flags, count), None)
+    except Exception as e:
+        return FileReplaceResult(path, 0, str(e))
+
+
+def replace_files(paths: Iterable[str], pattern: str, repl: str, flags: int = 0, count: int = 0,
+                  executor: Optional[Executor] = None) -> Iterator[FileReplaceResult]:
+    """
+    在多个文件中并行替换，按完成顺序产出每个文件的结果；count是每个文件的替换次数上限
+
+    Raises:
+        re.error: 正则表达式无效 (在提交任何文件之前)
+    """
+    re.compile(pattern, flags)
+    executor = executor or search_engine.get_executor()
+    futures = [executor.submit(_replace_one, str(path), pattern, repl, flags, count) for path in paths]
+    for future in as_completed(futures):
+        yield future.result()
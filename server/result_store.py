@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑的任务结果存储
+- 结果后端使用 compact-json 序列化：超过阈值的结果经codec压缩，带头部标记，旧的纯JSON结果仍可读取
+- 超大的回复正文只按内容哈希在Redis中保存一份，结果后端条目和发布/订阅消息中只携带引用ID
+"""
+
+import os
+import hashlib
+from typing import Any, Dict, Optional
+
+import codec
+
+# --- 结果存储配置 ---
+RESULT_EXPIRES = int(os.getenv('RESULT_EXPIRES', '3600'))                        # 结果后端条目和正文的过期时间(秒)
+RESULT_COMPRESS_THRESHOLD = int(os.getenv('RESULT_COMPRESS_THRESHOLD', '4096'))  # 超过该字节数压缩
+RESULT_INLINE_LIMIT = int(os.getenv('RESULT_INLINE_LIMIT', '65536'))            # 超过该字节数的正文单独存储
+
+SERIALIZER_NAME = 'compact-json'
+SERIALIZER_CONTENT_TYPE = 'application/x-compact-json'
+
+
+def dumps(obj: Any) -> bytes:
+    """compact-json 序列化"""
+    return codec.dumps(obj, RESULT_COMPRESS_THRESHOLD)
+
+
+def loads(data) -> Any:
+    """compact-json 反序列化"""
+    return codec.loads(data)
+
+
+def register_serializer() -> None:
+    """向kombu注册 compact-json 序列化器"""
+    from kombu.serialization import register
+    register(SERIALIZER_NAME, dumps, loads,
+             content_type=SERIALIZER_CONTENT_TYPE, content_encoding='binary')
+
+
+# --- 超大正文的单独存储 ---
+def content_key(content_id: str) -> str:
+    """正文存储键"""
+    return f"content:{content_id}"
+
+
+def offload_response(client, result: Dict[str, Any], limit: int = RESULT_INLINE_LIMIT) -> Dict[str, Any]:
+    """
+    正文超过limit时按内容哈希单独存储一份 (同步redis)
+
+    Returns:
+        response清空并带有 response_ref 引用ID的结果副本；无需拆分时返回原结果
+    """
+    response = result.get('response') or ''
+    body = response.encode('utf-8')
+    if len(body) <= limit:
+        return result
+    content_id = hashlib.sha256(body).hexdigest()
+    client.set(content_key(content_id), codec.encode(body), ex=RESULT_EXPIRES)
+    return {**result, 'response': '', 'response_ref': content_id, 'response_size': len(body)}
+
+
+async def resolve_response(client, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    取回 response_ref 引用的正文 (redis.asyncio)，正文已过期时返回失败结果
+    """
+    content_id: Optional[str] = result.get('response_ref')
+    if not content_id:
+        return result
+    return _with_content(result, await client.get(content_key(content_id)))
+
+
+def resolve_response_sync(client, result: Dict[str, Any]) -> Dict[str, Any]:
+    """resolve_response 的同步版本 (redis.Redis)，供Worker和工具线程使用"""
+    content_id: Optional[str] = result.get('response_ref')
+    if not content_id:
+        return result
+    return _with_content(result, client.get(content_key(content_id)))
+
+
+def _with_content(result: Dict[str, Any], raw: Optional[bytes]) -> Dict[str, Any]:
+    resolved = {k: v for k, v in result.items() if k not in ('response_ref', 'response_size')}
+    if raw is None:
+        resolved.update(success=False, error="结果内容已过期")
+        return resolved
+    resolved['response'] = codec.decode(raw).decode('utf-8')
+    return resolved
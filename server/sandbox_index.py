@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱目录索引
+在内存中缓存沙箱内每个目录的条目和stat信息：
+- 读取时只对目录本身做一次stat，目录mtime未变化就直接使用缓存的条目
+- 本进程的写操作 (写文件、重命名、删除等) 通过 invalidate() 增量更新受影响的条目
+- 刚修改过的目录 (mtime距扫描时间过近) 不信任mtime，下次读取时重新扫描，
+  避免同一时间片内的第二次修改被漏掉；外部对文件内容的修改不会改变目录mtime，
+  因此缓存条目最长保留 SANDBOX_INDEX_MAX_AGE 秒
+"""
+
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# --- 索引配置 ---
+SANDBOX_INDEX_MAX_AGE = float(os.getenv('SANDBOX_INDEX_MAX_AGE', '30'))   # 目录条目最长缓存时间(秒)
+SANDBOX_INDEX_RACY_NS = 2_000_000_000                                     # mtime距扫描时间小于该值时不信任
+
+
+class Entry(NamedTuple):
+    """目录条目"""
+    name: str
+    is_dir: bool          # 跟随符号链接
+    is_symlink: bool
+    size: int
+    mtime: float
+    ctime: float
+
+
+class _Listing:
+    __slots__ = ('mtime_ns', 'scanned_ns', 'scanned_at', 'entries', 'ordered', 'trusted')
+
+    def __init__(self, mtime_ns: int, scanned_ns: int, entries: Dict[str, Entry]):
+        self.mtime_ns = mtime_ns
+        self.scanned_ns = scanned_ns
+        self.scanned_at = time.monotonic()
+        self.entries = entries
+        self.ordered: Optional[List[Entry]] = None
+        self.trusted = False
+
+
+def sort_key(entry: Entry) -> Tuple[bool, str, str]:
+    """listdir() 的排序键：目录在前，名称不区分大小写，大小写不同的同名条目按原名排序"""
+    return (not entry.is_dir, entry.name.lower(), entry.name)
+
+
+def _normalize(path) -> Path:
+    # 缓存键使用规范化的绝对路径 (不解析符号链接)，'a/../b' 与 'b' 命中同一条目
+    return Path(os.path.abspath(path))
+
+
+def _entry_from_dirent(item: os.DirEntry) -> Entry:
+    try:
+        st = item.stat()
+        is_dir = item.is_dir()
+    except OSError:
+        # 失效的符号链接
+        st = item.stat(follow_symlinks=False)
+        is_dir = False
+    return Entry(item.name, is_dir, item.is_symlink(), 0 if is_dir else st.st_size, st.st_mtime, st.st_ctime)
+
+
+def _entry_from_path(path: Path) -> Optional[Entry]:
+    try:
+        lst = os.lstat(path)
+    except OSError:
+        return None
+    is_symlink = os.path.islink(path)
+    try:
+        st = os.stat(path) if is_symlink else lst
+    except OSError:
+        st = lst
+    is_dir = os.path.isdir(path)
+    return Entry(path.name, is_dir, is_symlink, 0 if is_dir else st.st_size, st.st_mtime, st.st_ctime)
+
+
+class SandboxIndex:
+    """沙箱目录索引"""
+
+    def __init__(self, root: Path, max_age: float = SANDBOX_INDEX_MAX_AGE):
+        self.root = _normalize(root)
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._listings: Dict[str, _Listing] = {}
+        self.scans = 0
+
+    # --- 查询 ---
+    def listdir(self, path: Path) -> List[Entry]:
+        """目录条目，目录在前，按名称(不区分大小写)排序；目录不存在时抛出OSError"""
+        listing = self._listing(_normalize(path))
+        with self._lock:
+            if listing.ordered is None:
+                listing.ordered = sorted(listing.entries.values(), key=sort_key)
+            return listing.ordered
+
+    def entry(self, path: Path) -> Optional[Entry]:
+        """从父目录的条目中取得路径的stat信息，不存在时返回None"""
+        path = _normalize(path)
+        if path == self.root:
+            return _entry_from_path(path)
+        try:
+            listing = self._listing(path.parent)
+        except OSError:
+            return None
+        return listing.entries.get(path.name)
+
+    def has_children(self, path: Path) -> bool:
+        """目录是否非空；未缓存时只读取第一个条目"""
+        path = _normalize(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with self._lock:
+                listing = self._listings.get(str(path))
+                if listing is not None and self._fresh(listing, mtime_ns):
+                    return bool(listing.entries)
+            with os.scandir(path) as it:
+                return next(it, None) is not None
+        except OSError:
+            return False
+
+    def generation(self, path: Path) -> Optional[Tuple[int, int]]:
+        """目录缓存条目的代：目录内容变化 (重新扫描或增量更新) 后改变；未缓存时返回None"""
+        with self._lock:
+            listing = self._listings.get(str(_normalize(path)))
+            if listing is None:
+                return None
+            return (id(listing), listing.mtime_ns)
+
+    def walk(self, path: Path) -> Iterator[Tuple[Path, List[Entry]]]:
+        """自顶向下遍历目录树，不进入符号链接指向的目录；无法读取的子目录被跳过"""
+        stack = [_normalize(path)]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = self.listdir(current)
+            except OSError:
+                continue
+            yield current, entries
+            stack.extend(current / e.name for e in reversed(entries) if e.is_dir and not e.is_symlink)
+
+    # --- 增量更新 ---
+    def invalidate(self, *paths: Path) -> None:
+        """
+        本进程修改了这些路径 (创建、写入、删除、重命名的源和目标)：
+        更新父目录中对应的条目，路径本身是目录时丢弃其子树的缓存
+        """
+        with self._lock:
+            for path in paths:
+                path = _normalize(path)
+                self._drop_subtree(path)
+                parent = self._listings.get(str(path.parent))
+                if parent is None:
+                    continue
+                entry = _entry_from_path(path)
+                if entry is None:
+                    parent.entries.pop(path.name, None)
+                else:
+                    parent.entries[path.name] = entry
+                parent.ordered = None
+                # 父目录的mtime已因本次修改变化，记录新值以免下次读取时整目录重扫
+                try:
+                    parent.mtime_ns = os.stat(path.parent).st_mtime_ns
+                    parent.trusted = True
+                except OSError:
+                    self._listings.pop(str(path.parent), None)
+
+    def clear(self) -> None:
+        """丢弃全部缓存"""
+        with self._lock:
+            self._listings.clear()
+
+    # --- 内部实现 ---
+    def _drop_subtree(self, path: Path) -> None:
+        key = str(path)
+        prefix = key + os.sep
+        for cached in [k for k in self._listings if k == key or k.startswith(prefix)]:
+            del self._listings[cached]
+
+    def _listing(self, path: Path) -> _Listing:
+        key = str(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None and self._fresh(listing, mtime_ns):
+                return listing
+
+        scanned_ns = time.time_ns()
+        with os.scandir(path) as it:
+            entries = {item.name: _entry_from_dirent(item) for item in it}
+        listing = _Listing(mtime_ns, scanned_ns, entries)
+        with self._lock:
+            self._listings[key] = listing
+            self.scans += 1
+        return listing
+
+    def _fresh(self, listing: _Listing, mtime_ns: int) -> bool:
+        if listing.mtime_ns != mtime_ns:
+            return False
+        if not listing.trusted and listing.scanned_ns - mtime_ns < SANDBOX_INDEX_RACY_NS:
+            return False
+        return time.monotonic() - listing.scanned_at < self.max_age
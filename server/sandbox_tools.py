@@ -0,0 +1,745 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱文件工具和工具注册表
+- 智能体调用的文件/目录工具、文件夹管理函数和网络搜索工具，以及它们共享的沙箱状态
+  (路径校验、目录索引、内容指纹、目录大小合计)
+- 不依赖FastAPI应用：API进程和执行重型工具任务的Worker都直接导入本模块
+"""
+
+from pathlib import Path
+import os
+import json
+import logging
+from typing import Optional, Dict, Any, List, Iterator
+import datetime
+import re
+import fnmatch
+import shutil
+import bisect
+import httpx
+from dotenv import load_dotenv
+
+from sandbox_index import SandboxIndex, sort_key
+from path_guard import PathGuard
+import search_engine
+from trigram_index import TrigramIndex, TRIGRAM_INDEX_ENABLED
+import file_window
+import replace_engine
+import diff_engine
+import archive_engine
+import archive_reader
+import file_batch
+from progress import report_tool_progress
+from fingerprint import FingerprintCache
+from dir_sizes import DirSizeIndex
+from diff_engine import DIFF_MAX_OUTPUT_LINES
+from search_engine import SEARCH_MAX_RESULTS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+tavily_api_key = os.getenv('TAVILY_API_KEY')
+
+# 全局基础目录
+base_dir = Path(__file__).parent.resolve() / "test"
+os.makedirs(base_dir, exist_ok=True)
+
+# --- 工具函数：路径验证 ---
+# 沙箱根目录只解析一次；遍历中的子条目用 path_guard.child_ok 只校验符号链接
+path_guard = PathGuard(base_dir)
+
+def validate_path(target_path: Path, check_existence=False, expect_dir=False, expect_file=False):
+    return path_guard.validate(target_path, check_existence, expect_dir, expect_file)
+
+# --- 沙箱目录索引 ---
+# 读工具从索引取目录条目和stat信息；本进程的写操作完成后调用 on_sandbox_change 增量更新
+sandbox_index = SandboxIndex(base_dir)
+# 内容搜索的三元组索引 (可选)：按正则中的字面量预先过滤候选文件
+trigram_index = TrigramIndex() if TRIGRAM_INDEX_ENABLED else None
+# 内容指纹缓存：文件未变化时相等判断和去重不需要重新读取内容
+fingerprints = FingerprintCache()
+# 目录大小合计：首次查询时并行统计，之后随本进程的写操作增量更新
+dir_sizes = DirSizeIndex(sandbox_index, accept=lambda dir_path, name, is_symlink: path_guard.child_ok(dir_path, name, is_symlink))
+
+def on_sandbox_change(*paths: Path) -> None:
+    """通知沙箱缓存：这些路径被创建、修改、删除或重命名"""
+    sandbox_index.invalidate(*paths)
+    if trigram_index is not None:
+        trigram_index.invalidate(*paths)
+    fingerprints.invalidate(*paths)
+    dir_sizes.on_change(*paths)
+
+def _format_mtime(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+# --- 文件操作工具 (保持不变) ---
+def read_file(name: str, start_line: Optional[int] = None, end_line: Optional[int] = None, offset: Optional[int] = None, length: Optional[int] = None, head: Optional[int] = None, tail: Optional[int] = None) -> str:
+    print(f"(read_file '{name}' lines={start_line}-{end_line} offset={offset} length={length} head={head} tail={tail})")
+    p = base_dir / name
+    ok, msg = validate_path(p, check_existence=True, expect_file=True)
+    if not ok: return msg
+    try:
+        # 小文件的整体读取保持原样；大文件或指定了窗口时通过mmap只读取一个窗口
+        if file_window.is_windowed(start_line, end_line, offset, length, head, tail) or p.stat().st_size > file_window.READ_WINDOW_MAX_BYTES:
+            return file_window.render(name, file_window.read_window(p.resolve(), offset, length, start_line, end_line, head, tail))
+        return p.read_text(encoding='utf-8')
+    except file_window.WindowError as e: return f"错误：{e}"
+    except Exception as e: return f"读取文件 '{name}' 时发生错误：{e}"
+def list_files(path: str = ".") -> list[str]:
+    print(f"(list_files '{path}')")
+    p = (base_dir / path); ok, msg = validate_path(p, check_existence=True, expect_dir=True)
+    if not ok: return [msg]
+    resolved_p = p.resolve(); items = []
+    for entry in sandbox_index.listdir(resolved_p):
+        mtime = _format_mtime(entry.mtime)
+        if entry.is_dir: items.append(f"{entry.name}/ (目录, ---, {mtime})")
+        else: items.append(f"{entry.name} (文件, {entry.size} bytes, {mtime})")
+    return items or [f"目录 '{path}' 为空。"]
+def rename_file(name: str, new_name: str) -> str:
+    print(f"(rename_file '{name}' -> '{new_name}')"); src_path = base_dir / name; dst_path = base_dir / new_name
+    ok_src, msg_src = validate_path(src_path, check_existence=True)
+    if not ok_src: return msg_src
+    ok_dst, msg_dst = validate_path(dst_path, check_existence=False) # Destination may not exist
+    if not ok_dst: return msg_dst
+    try:
+        dst_path.parent.mkdir(parents=True, exist_ok=True); os.rename(src_path, dst_path)
+        on_sandbox_change(src_path, dst_path)
+        return f"重命名成功：'{name}' → '{new_name}'"
+    except Exception as e: return f"重命名文件/目录时发生错误：{e}"
+def write_file(name: str, content: str, mode: str = 'w') -> str:
+    print(f"(write_file '{name}' mode='{mode}')"); p = base_dir / name
+    ok, msg = validate_path(p, check_existence=False)
+    if not ok: return msg
+    if p.exists() and p.is_dir(): return f"错误：路径 '{name}' 是一个目录，无法写入文件。"
+    if mode not in ('w', 'a'): return f"错误：不支持的写入模式 '{mode}'。请使用 'w' 或 'a'。"
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with open(p, mode, encoding='utf-8') as f: f.write(content)
+        on_sandbox_change(p)
+        return f"成功向 '{name}' 写入 {len(content.encode('utf-8'))} 字节。"
+    except Exception as e: return f"写入文件 '{name}' 时发生错误：{e}"
+def create_directory(name: str) -> str:
+    print(f"(create_directory '{name}')"); p = base_dir / name
+    ok, msg = validate_path(p, check_existence=False)
+    if not ok: return msg
+    if p.exists(): return f"错误：路径 '{name}' 已存在。"
+    try: p.mkdir(parents=True, exist_ok=False); on_sandbox_change(p); return f"目录 '{name}' 创建成功。" # exist_ok=False to error if exists
+    except FileExistsError: return f"错误：路径 '{name}' 已存在。"
+    except Exception as e: return f"创建目录 '{name}' 失败：{e}"
+def delete_file(name: str) -> str:
+    print(f"(delete_file '{name}')"); p = base_dir / name
+    ok, msg = validate_path(p, check_existence=True, expect_file=True)
+    if not ok: return msg
+    try: p.unlink(); on_sandbox_change(p); return f"文件 '{name}' 删除成功。"
+    except Exception as e: return f"删除文件 '{name}' 时发生错误：{e}"
+def pwd() -> str: print("(pwd)"); return f"当前操作目录限制在: './{base_dir.name}/'"
+def diff_files(f1: str, f2: str, context: int = 3, max_lines: int = DIFF_MAX_OUTPUT_LINES) -> str:
+    print(f"(diff_files '{f1}' '{f2}' context={context} max_lines={max_lines})"); path1 = base_dir / f1; path2 = base_dir / f2
+    ok1, msg1 = validate_path(path1, check_existence=True, expect_file=True)
+    if not ok1: return msg1
+    ok2, msg2 = validate_path(path2, check_existence=True, expect_file=True)
+    if not ok2: return msg2
+    try:
+        if fingerprints.same_content(path1, path2): return f"文件 '{f1}' 和 '{f2}' 内容完全相同。"
+        lines1 = path1.read_text(encoding='utf-8').splitlines(keepends=True)
+        lines2 = path2.read_text(encoding='utf-8').splitlines(keepends=True)
+        diff_result, truncated = diff_engine.unified_diff(lines1, lines2, f1, f2, n=max(0, context), max_lines=max(1, max_lines))
+        if truncated: diff_result += f"(差异输出已截断，仅显示前 {max_lines} 行；可增大 max_lines 或减小 context)\n"
+        return diff_result or f"文件 '{f1}' 和 '{f2}' 内容完全相同。"
+    except Exception as e: return f"比较文件差异时发生错误: {e}"
+def _gen_tree(dir_path: Path, prefix: str, current_depth: int, max_depth: int) -> list[str]:
+    if max_depth != -1 and current_depth > max_depth: return []
+    lines = [];
+    try: entries = sandbox_index.listdir(dir_path)
+    except PermissionError: return [f"{prefix}└── [无法访问]"]
+    except Exception as e: return [f"{prefix}└── [读取错误: {e}]"]
+    for i, entry in enumerate(entries):
+        is_last = (i == len(entries) - 1); connector = "└── " if is_last else "├── "
+        lines.append(f"{prefix}{connector}{entry.name}{'/' if entry.is_dir else ''}")
+        # 不进入符号链接指向的目录，避免列出沙箱外的内容或陷入链接循环
+        if entry.is_dir and not entry.is_symlink: new_prefix = prefix + ("    " if is_last else "│   "); lines.extend(_gen_tree(dir_path / entry.name, new_prefix, current_depth + 1, max_depth))
+    return lines
+def tree(path: str = ".", depth: int = -1) -> str:
+    print(f"(tree '{path}' depth={depth})"); target_dir_path_relative = Path(path); target_dir_abs_path = (base_dir / target_dir_path_relative)
+    ok, msg = validate_path(target_dir_abs_path, check_existence=True, expect_dir=True)
+    if not ok: return msg
+    resolved_target_dir = target_dir_abs_path.resolve()
+    if resolved_target_dir == base_dir.resolve(): root_display_name = f"./{base_dir.name}"
+    else:
+        try: root_display_name = str(resolved_target_dir.relative_to(base_dir.resolve()))
+        except ValueError: root_display_name = resolved_target_dir.name # Should not happen due to validate_path
+    output_lines = [f"{root_display_name}/"]
+    if depth != 0: output_lines.extend(_gen_tree(resolved_target_dir, "", 1, depth))
+    return "\n".join(output_lines)
+def _index_glob_supported(pattern: str, recursive: bool) -> bool:
+    if not pattern or '**' in pattern or pattern.startswith(('/', os.sep)): return False
+    return recursive or ('/' not in pattern and os.sep not in pattern)
+def _iter_index_glob(root: Path, pattern: str, recursive: bool) -> Iterator[tuple]:
+    """用沙箱索引边遍历边匹配glob模式 (与 Path.rglob/glob 语义一致)，产出 (所在目录, 条目)"""
+    single = '/' not in pattern and os.sep not in pattern
+    walker = sandbox_index.walk(root) if recursive else [(root, sandbox_index.listdir(root))]
+    for dir_path, entries in walker:
+        for e in entries:
+            if single:
+                if fnmatch.fnmatchcase(e.name, pattern): yield dir_path, e
+            elif (dir_path / e.name).relative_to(root).match(pattern):
+                yield dir_path, e
+def _index_glob(root: Path, pattern: str, recursive: bool) -> Optional[list[Path]]:
+    """用沙箱索引匹配glob模式，索引无法处理的模式返回None"""
+    if not _index_glob_supported(pattern, recursive): return None
+    return [dir_path / e.name for dir_path, e in _iter_index_glob(root, pattern, recursive)]
+def iter_search_files(root: Path, pattern: str, recursive: bool) -> Iterator[tuple]:
+    """内容搜索的候选文件 (路径, mtime, 大小)：边遍历边产出，跳过目录和指向沙箱外的符号链接"""
+    if _index_glob_supported(pattern, recursive):
+        for dir_path, e in _iter_index_glob(root, pattern, recursive):
+            # 遍历不进入符号链接目录，只有条目本身可能是指向沙箱外的链接
+            if not e.is_dir and path_guard.child_ok(dir_path, e.name, e.is_symlink):
+                yield str(dir_path / e.name), e.mtime, e.size
+        return
+    for p in (root.rglob(pattern) if recursive else root.glob(pattern)):
+        if p.is_file() and path_guard.path_ok(p):
+            st = p.stat(); yield str(p), st.st_mtime, st.st_size
+def narrow_search_files(files: Iterator[tuple], regex: str, flags: int) -> Iterator[str]:
+    """启用三元组索引时只保留包含正则中全部字面量的文件；否则原样惰性产出"""
+    if trigram_index is None: return (path for path, _, _ in files)
+    return iter(trigram_index.candidates(files, regex, flags))
+def search_flags(case_sensitive: bool) -> int:
+    return 0 if case_sensitive else re.IGNORECASE
+def find_files(pattern: str, path: str = ".", search_content_regex: Optional[str] = None, case_sensitive: bool = False, recursive: bool = True, max_results: int = SEARCH_MAX_RESULTS) -> str:
+    print(f"(find_files pattern='{pattern}' path='{path}' content_regex='{search_content_regex}')"); search_root_path = (base_dir / path)
+    ok, msg = validate_path(search_root_path, check_existence=True, expect_dir=True)
+    if not ok: return msg
+    resolved_search_root = search_root_path.resolve(); glob_func = resolved_search_root.rglob if recursive else resolved_search_root.glob
+    if search_content_regex:
+        try: re.compile(search_content_regex, search_flags(case_sensitive))
+        except re.error as e: return f"提供的正则表达式 '{search_content_regex}' 无效: {e}"
+        output_results = []; match_count = 0; any_file = False
+        def candidates():
+            nonlocal any_file
+            for file_info in iter_search_files(resolved_search_root, pattern, recursive):
+                any_file = True; yield file_info
+        try:
+            for event in search_engine.search(narrow_search_files(candidates(), search_content_regex, search_flags(case_sensitive)), search_content_regex, search_flags(case_sensitive), max_results=max_results):
+                relative_file_path_str = str(Path(event.path).relative_to(base_dir))
+                if isinstance(event, search_engine.SearchError):
+                    output_results.append(f"读取文件 {relative_file_path_str} 内容时出错: {event.error}"); continue
+                match_count += 1
+                output_results.append(f"{relative_file_path_str}: 第 {event.line_no} 行: {event.line.strip()}")
+        except Exception as e: return f"查找文件时发生错误: {e}"
+        if not any_file: return f"在 '{path}' 目录及其子目录（递归={recursive}）中未找到匹配模式 '{pattern}' 的文件或目录。"
+        if match_count >= max_results: output_results.append(f"(结果已截断，仅显示前 {max_results} 条匹配)")
+        return "\n".join(output_results) or f"在匹配模式 '{pattern}' 的文件中未找到包含 '{search_content_regex}' 的内容。"
+    try:
+        matched_paths = _index_glob(resolved_search_root, pattern, recursive)
+        if matched_paths is None: matched_paths = list(glob_func(pattern))
+    except Exception as e: return f"查找文件时发生错误: {e}"
+    if not matched_paths: return f"在 '{path}' 目录及其子目录（递归={recursive}）中未找到匹配模式 '{pattern}' 的文件或目录。"
+    return "\n".join(str(p.relative_to(base_dir)) for p in matched_paths)
+def replace_in_file(name: str, search_regex: str, replace_string: str, count: int = 0) -> str:
+    print(f"(replace_in_file '{name}' regex='{search_regex}' replacement='{replace_string}' count={count})"); file_to_modify = base_dir / name
+    ok, msg = validate_path(file_to_modify, check_existence=True, expect_file=True)
+    if not ok: return msg
+    try:
+        # 流式替换：结果写入临时文件后原子替换，没有匹配时原文件不变
+        num_replacements = replace_engine.replace_file(str(file_to_modify), search_regex, replace_string, count=count)
+        if num_replacements > 0: on_sandbox_change(file_to_modify); return f"在文件 '{name}' 中成功替换了 {num_replacements} 处匹配。"
+        else: return f"在文件 '{name}' 中未找到与正则表达式 '{search_regex}' 匹配的内容。"
+    except re.error as e: return f"提供的正则表达式 '{search_regex}' 无效: {e}"
+    except Exception as e: return f"在文件 '{name}' 中进行替换操作时发生错误：{e}"
+def replace_in_files(pattern: str, search_regex: str, replace_string: str, path: str = ".", count: int = 0, recursive: bool = True) -> str:
+    print(f"(replace_in_files pattern='{pattern}' path='{path}' regex='{search_regex}' replacement='{replace_string}' count={count})"); search_root_path = base_dir / path
+    ok, msg = validate_path(search_root_path, check_existence=True, expect_dir=True)
+    if not ok: return msg
+    try: re.compile(search_regex)
+    except re.error as e: return f"提供的正则表达式 '{search_regex}' 无效: {e}"
+    try:
+        files = list(iter_search_files(search_root_path.resolve(), pattern, recursive))
+        if not files: return f"在 '{path}' 目录及其子目录（递归={recursive}）中未找到匹配模式 '{pattern}' 的文件。"
+        results = sorted(replace_engine.replace_files(narrow_search_files(iter(files), search_regex, 0), search_regex, replace_string, count=count), key=lambda r: r.path)
+    except Exception as e: return f"批量替换时发生错误: {e}"
+    changed = [r for r in results if r.count > 0]
+    if changed: on_sandbox_change(*(Path(r.path) for r in changed))
+    lines = [f"在 {len(changed)}/{len(files)} 个文件中共替换了 {sum(r.count for r in changed)} 处匹配。"]
+    lines += [f"{Path(r.path).relative_to(base_dir)}: {r.count} 处" for r in changed]
+    lines += [f"{Path(r.path).relative_to(base_dir)}: 失败 - {r.error}" for r in results if r.error]
+    return "\n".join(lines)
+ARCHIVE_FORMAT_ALIASES = {"tar.gz": "gztar", "tgz": "gztar", "tar.bz2": "bztar", "tbz2": "bztar", "tar.zst": "zstdtar", "tzst": "zstdtar"}
+def archive_files(archive_name: str, items_to_archive: list[str], archive_format: str = "zip") -> str:
+    print(f"(archive_files '{archive_name}' items='{items_to_archive}' format='{archive_format}')"); guessed_format = archive_format.lower()
+    guessed_format = ARCHIVE_FORMAT_ALIASES.get(guessed_format, guessed_format)
+    if guessed_format == "tar":
+        if archive_name.lower().endswith((".tar.gz", ".tgz")): guessed_format = "gztar"
+        elif archive_name.lower().endswith((".tar.bz2", ".tbz2")): guessed_format = "bztar"
+        elif archive_name.lower().endswith((".tar.zst", ".tzst")): guessed_format = "zstdtar"
+
+    final_archive_format = guessed_format; archive_path_full = base_dir / archive_name
+    ok_arc_path, msg_arc_path = validate_path(archive_path_full, check_existence=False)
+    if not ok_arc_path: return msg_arc_path
+    if archive_path_full.exists(): return f"错误：归档文件 '{archive_name}' 已存在。"
+
+    abs_paths_to_archive = []
+    for item_name_str in items_to_archive:
+        item_path = base_dir / item_name_str; ok_item, msg_item = validate_path(item_path, check_existence=True)
+        if not ok_item: return f"错误：要归档的项 '{item_name_str}' 无效或不存在：{msg_item}"
+        abs_paths_to_archive.append(item_path)
+    if not abs_paths_to_archive: return "错误：没有指定任何有效的文件或目录进行归档。"
+
+    if final_archive_format not in archive_engine.FORMATS: return f"错误：不支持的归档格式 '{final_archive_format}'。支持的格式: {', '.join(archive_engine.FORMATS)}."
+    if final_archive_format == "zstdtar" and not archive_engine.ZSTD_AVAILABLE: return "错误：tar.zst 格式需要安装 zstandard。"
+    try:
+        # 成员列表来自沙箱索引；目录下的条目只需校验符号链接
+        members = []
+        archive_real_path = archive_path_full.resolve()
+        for item_abs_path in abs_paths_to_archive:
+            members.append(archive_engine.Member(item_abs_path, item_abs_path.relative_to(base_dir).as_posix(), item_abs_path.is_dir()))
+            if not item_abs_path.is_dir(): continue
+            for root_path_obj, entries_in_dir in sandbox_index.walk(item_abs_path):
+                for entry_in_dir in entries_in_dir:
+                    file_to_add_path = root_path_obj / entry_in_dir.name
+                    if not path_guard.child_ok(root_path_obj, entry_in_dir.name, entry_in_dir.is_symlink):
+                        print(f"警告: 跳过归档中的无效文件 {file_to_add_path}")
+                        continue
+                    if file_to_add_path == archive_real_path: continue
+                    members.append(archive_engine.Member(file_to_add_path, file_to_add_path.relative_to(base_dir).as_posix(), entry_in_dir.is_dir))
+
+        archive_path_full.parent.mkdir(parents=True, exist_ok=True)
+        archive_engine.write_archive(archive_path_full, members, final_archive_format, on_progress=lambda p: report_tool_progress(**p._asdict()))
+        on_sandbox_change(archive_path_full)
+        return f"成功创建归档 '{archive_name}' (格式: {final_archive_format}，{sum(1 for m in members if not m.is_dir)} 个文件)。"
+    except Exception as e:
+        if archive_path_full.exists():
+            try: archive_path_full.unlink()
+            except: pass
+        on_sandbox_change(archive_path_full)
+        return f"创建归档 '{archive_name}' 时发生错误：{e}"
+def extract_archive(archive_name: str, destination_path: str = ".", specific_members: Optional[list[str]] = None) -> str:
+    print(f"(extract_archive '{archive_name}' dest='{destination_path}' members='{specific_members}')"); archive_file_to_extract = base_dir / archive_name
+    ok_arc, msg_arc = validate_path(archive_file_to_extract, check_existence=True, expect_file=True)
+    if not ok_arc: return msg_arc
+
+    extraction_dest_dir_relative = Path(destination_path)
+    extraction_dest_dir_abs = (base_dir / extraction_dest_dir_relative).resolve()
+    
+    ok_dest, msg_dest = validate_path(extraction_dest_dir_abs, check_existence=False, expect_dir=True if extraction_dest_dir_abs.exists() else False)
+    if not ok_dest: return msg_dest
+
+    try:
+        index = archive_reader.member_index(archive_file_to_extract)
+        if specific_members:
+            members_to_extract, missing_members = index.select(specific_members)
+            for sm_query in missing_members: print(f"警告：在归档 '{archive_name}' 中未找到成员或以此为前缀的成员 '{sm_query}'。")
+            if not members_to_extract: return "错误：在归档中未找到任何指定的成员进行解压。"
+        else:
+            members_to_extract = index.members
+
+        extraction_dest_dir_abs.mkdir(parents=True, exist_ok=True)
+        on_progress = lambda p: report_tool_progress(**p._asdict())
+        if index.kind == 'zip':
+            actual_extracted_members, skipped_members = archive_reader.extract_zip(archive_file_to_extract, extraction_dest_dir_abs, members_to_extract, on_progress)
+        else:
+            actual_extracted_members, skipped_members = archive_reader.extract_tar(archive_file_to_extract, index.kind, extraction_dest_dir_abs, members_to_extract if specific_members else None, on_progress)
+        extracted_count = len(actual_extracted_members)
+        for skipped in skipped_members: print(f"警告：跳过路径不安全的成员 '{skipped}'。")
+
+        on_sandbox_change(extraction_dest_dir_abs)
+        display_destination_path = str(extraction_dest_dir_abs.relative_to(base_dir)) if extraction_dest_dir_abs.is_relative_to(base_dir) else str(extraction_dest_dir_abs)
+
+        result_msg = f"从 '{archive_name}' 成功解压 {extracted_count} 个成员/文件到 './{display_destination_path}'。"
+        if actual_extracted_members:
+            result_msg += f"\n解压的成员列表 (部分): {', '.join(actual_extracted_members[:10])}{'...' if len(actual_extracted_members) > 10 else ''}"
+        if skipped_members:
+            result_msg += f"\n跳过 {len(skipped_members)} 个路径不安全的成员: {', '.join(skipped_members[:10])}{'...' if len(skipped_members) > 10 else ''}"
+        return result_msg
+    except archive_reader.ArchiveFormatError as e:
+        return f"错误：{e}。"
+    except Exception as e:
+        return f"解压归档 '{archive_name}' 时发生错误：{e}"
+LIST_ARCHIVE_MAX_LIMIT = 1000
+def list_archive(archive_name: str, prefix: str = "", limit: int = 200) -> str:
+    print(f"(list_archive '{archive_name}' prefix='{prefix}' limit={limit})"); archive_path = base_dir / archive_name
+    ok, msg = validate_path(archive_path, check_existence=True, expect_file=True)
+    if not ok: return msg
+    try:
+        # 只读取zip中央目录或tar成员头，结果按归档的mtime缓存
+        members = archive_reader.member_index(archive_path).under(prefix)
+        if not members: return f"归档 '{archive_name}' 中没有{f'以 {prefix!r} 为前缀的' if prefix else '任何'}成员。"
+        limit = max(1, min(limit, LIST_ARCHIVE_MAX_LIMIT)); file_members = [m for m in members if not m.is_dir]
+        lines = [f"归档 '{archive_name}' 中{f'以 {prefix!r} 为前缀的' if prefix else '共有'} {len(members)} 个成员 ({len(file_members)} 个文件，解压后共 {sum(m.size for m in file_members)} 字节):"]
+        lines += [f"  {m.name}/" if m.is_dir else f"  {m.name} ({m.size} 字节)" for m in members[:limit]]
+        if len(members) > limit: lines.append(f"  ... 还有 {len(members) - limit} 个成员未显示 (可使用 prefix 或增大 limit)")
+        return "\n".join(lines)
+    except archive_reader.ArchiveFormatError as e:
+        return f"错误：{e}。"
+    except Exception as e: return f"读取归档 '{archive_name}' 时发生错误：{e}"
+def batch_file_operations(operations: list[dict]) -> List[Dict[str, Any]]:
+    """
+    批量执行文件操作 (先校验全部操作，互不相关的操作并发执行)
+
+    Raises:
+        file_batch.BatchValidationError: 有无效的操作，整批未执行
+    """
+    print(f"(batch_file_operations {len(operations)} ops)")
+    _, waves = file_batch.validate(base_dir, operations, lambda p: validate_path(p, check_existence=False))
+    return file_batch.execute(base_dir, waves, lambda p: validate_path(p, check_existence=False), on_change=on_sandbox_change,
+                              on_progress=lambda done, total: report_tool_progress(operations_done=done, operations_total=total))
+def batch_files(operations: list[dict]) -> str:
+    try: results = batch_file_operations(operations)
+    except file_batch.BatchValidationError as e: return "错误：批量操作未执行，以下操作无效：\n" + "\n".join(f"  #{i} {msg}" for i, msg in e.errors)
+    except Exception as e: return f"批量操作时发生错误：{e}"
+    counts = {status: sum(r['status'] == status for r in results) for status in ('ok', 'error', 'skipped')}
+    lines = [f"批量操作完成：{len(results)} 个操作，成功 {counts['ok']}，失败 {counts['error']}，跳过 {counts['skipped']}。"]
+    lines += [f"  #{r['index']} {r['op']} '{r['path']}'：{'失败' if r['status'] == 'error' else '跳过'} ({r['message']})" for r in results if r['status'] != 'ok']
+    return "\n".join(lines)
+def _latest_backup(backup_dir: Path, source_file: Path) -> Optional[Path]:
+    """备份目录中该文件最近一次的备份 (文件名中的时间戳最大者)"""
+    backup_name = re.compile(re.escape(source_file.stem) + r'\.\d{14}' + re.escape(source_file.suffix) + r'\.bak')
+    try: names = [e.name for e in sandbox_index.listdir(backup_dir) if not e.is_dir and not e.is_symlink and backup_name.fullmatch(e.name)]
+    except OSError: return None
+    return backup_dir / max(names) if names else None
+def file_fingerprint(name: str) -> str:
+    print(f"(file_fingerprint '{name}')"); p = base_dir / name
+    ok, msg = validate_path(p, check_existence=True, expect_file=True)
+    if not ok: return msg
+    try:
+        fp = fingerprints.get(p)
+        return f"文件 '{name}': 内容哈希 {fp.digest}，大小 {fp.size} 字节，{'二进制文件' if fp.binary else f'{fp.lines} 行文本'}，修改时间 {_format_mtime(fp.mtime_ns / 1e9)}"
+    except Exception as e: return f"计算文件 '{name}' 的指纹时发生错误：{e}"
+def backup_file(name: str, backup_dir_name: str = "backups") -> str:
+    print(f"(backup_file '{name}' backup_dir='{backup_dir_name}')"); source_file = base_dir / name
+    ok_src, msg_src = validate_path(source_file, check_existence=True, expect_file=True)
+    if not ok_src: return msg_src
+
+    backup_target_dir_relative = Path(backup_dir_name)
+    backup_target_dir_abs = (base_dir / backup_target_dir_relative).resolve()
+
+    ok_dest_dir, msg_dest_dir = validate_path(backup_target_dir_abs, check_existence=False)
+    if not ok_dest_dir: return msg_dest_dir
+
+    try: backup_target_dir_abs.mkdir(parents=True, exist_ok=True)
+    except Exception as e: return f"创建备份目录 '{backup_dir_name}' 失败: {e}"
+
+    # 源文件自最近一次备份以来未修改时不重复备份 (比较内容指纹，缓存命中时不读取文件)
+    latest_backup = _latest_backup(backup_target_dir_abs, source_file)
+    try:
+        if latest_backup is not None and fingerprints.same_content(source_file, latest_backup):
+            return f"文件 '{name}' 自上次备份以来未修改，已有备份：'{latest_backup.relative_to(base_dir)}'"
+    except OSError: pass
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    backup_filename = f"{source_file.stem}.{timestamp}{source_file.suffix}.bak"
+    destination_backup_file_path = backup_target_dir_abs / backup_filename
+
+    ok_dest_file, msg_dest_file = validate_path(destination_backup_file_path, check_existence=False)
+    if not ok_dest_file: return msg_dest_file
+    if destination_backup_file_path.exists(): return f"错误：备份目标文件 '{destination_backup_file_path.name}' 已在 '{backup_dir_name}' 中存在。"
+
+    try:
+        shutil.copy2(source_file, destination_backup_file_path); on_sandbox_change(destination_backup_file_path)
+        relative_backup_path_str = str(destination_backup_file_path.relative_to(base_dir))
+        return f"文件 '{name}' 已成功备份到：'{relative_backup_path_str}'"
+    except Exception as e: return f"备份文件 '{name}' 时发生错误：{e}"
+
+# --- 文件夹管理功能函数 ---
+def get_folder_tree(path: str = ".", max_depth: int = 3) -> Dict[str, Any]:
+    """获取文件夹树状结构"""
+    print(f"(get_folder_tree '{path}' max_depth={max_depth})")
+
+    target_path = base_dir / path
+    ok, msg = validate_path(target_path, check_existence=True, expect_dir=True)
+    if not ok:
+        return {"error": msg}
+
+    def build_tree_node(current_path: Path, entry, current_depth: int = 0) -> Dict[str, Any]:
+        """递归构建树节点，条目和stat信息来自沙箱索引"""
+        try:
+            relative_path = str(current_path.relative_to(base_dir))
+
+            node = {
+                "name": current_path.name,
+                "path": relative_path if relative_path != "." else "",
+                "type": "folder" if entry.is_dir else "file",
+                "modified": _format_mtime(entry.mtime),
+                "expanded": False
+            }
+
+            if not entry.is_dir:
+                node["size"] = entry.size
+            else:
+                node["children"] = []
+                if current_depth < max_depth:
+                    try:
+                        children = sandbox_index.listdir(current_path)
+                        for child in children:
+                            # 已验证目录下的普通条目必然在沙箱内，只需验证符号链接
+                            if not path_guard.child_ok(current_path, child.name, child.is_symlink):
+                                continue
+                            node["children"].append(build_tree_node(current_path / child.name, child, current_depth + 1))
+                    except PermissionError:
+                        pass  # 跳过无权限访问的目录
+
+            return node
+        except Exception as e:
+            return {
+                "name": current_path.name,
+                "path": str(current_path.relative_to(base_dir)),
+                "type": "error",
+                "error": str(e)
+            }
+
+    try:
+        root_path = target_path.resolve()
+        tree = build_tree_node(root_path, sandbox_index.entry(root_path))
+
+        # 统计文件和文件夹数量
+        def count_items(node: Dict[str, Any]) -> tuple[int, int]:
+            files, folders = 0, 0
+            if node.get("type") == "file":
+                files = 1
+            elif node.get("type") == "folder":
+                folders = 1
+                for child in node.get("children", []):
+                    child_files, child_folders = count_items(child)
+                    files += child_files
+                    folders += child_folders
+            return files, folders
+
+        total_files, total_folders = count_items(tree)
+
+        return {
+            "tree": tree,
+            "total_files": total_files,
+            "total_folders": total_folders - 1  # 减去根目录
+        }
+    except Exception as e:
+        return {"error": f"构建文件夹树失败: {e}"}
+
+FOLDER_CHILDREN_MAX_LIMIT = 1000
+
+def _folder_node(path: Path, entry) -> Dict[str, Any]:
+    """懒加载树的单个节点，文件夹只给出 has_children 提示而不展开"""
+    relative_path = str(path.relative_to(base_dir))
+    node = {
+        "name": path.name,
+        "path": relative_path if relative_path != "." else "",
+        "type": "folder" if entry.is_dir else "file",
+        "modified": _format_mtime(entry.mtime),
+        "expanded": False
+    }
+    if entry.is_dir:
+        node["has_children"] = sandbox_index.has_children(path)
+    else:
+        node["size"] = entry.size
+    return node
+
+def _encode_children_cursor(entry) -> str:
+    return f"{'f' if not entry.is_dir else 'd'}:{entry.name}"
+
+def list_folder_children(path: str = ".", cursor: Optional[str] = None, limit: int = 200) -> Dict[str, Any]:
+    """
+    获取文件夹的一层子节点 (分页)
+
+    cursor 是上一页最后一个条目的位置标记；目录在两次请求之间变化时，
+    按排序键继续而不是按偏移量，因此不会重复或跳过未变化的条目
+    """
+    print(f"(list_folder_children '{path}' cursor={cursor!r} limit={limit})")
+
+    target_path = base_dir / path
+    ok, msg = validate_path(target_path, check_existence=True, expect_dir=True)
+    if not ok:
+        return {"error": msg}
+    limit = max(1, min(limit, FOLDER_CHILDREN_MAX_LIMIT))
+
+    try:
+        folder_path = target_path.resolve()
+        entries = sandbox_index.listdir(folder_path)
+        start = 0
+        if cursor:
+            kind, _, name = cursor.partition(":")
+            if kind not in ("d", "f") or not name:
+                return {"error": f"错误：无效的分页游标 '{cursor}'。"}
+            cursor_key = (kind == "f", name.lower(), name)
+            start = bisect.bisect_right([sort_key(e) for e in entries], cursor_key)
+
+        children = []
+        position = start
+        while position < len(entries) and len(children) < limit:
+            entry = entries[position]
+            position += 1
+            # 已验证目录下的普通条目必然在沙箱内，只需验证符号链接
+            if not path_guard.child_ok(folder_path, entry.name, entry.is_symlink):
+                continue
+            children.append(_folder_node(folder_path / entry.name, entry))
+
+        next_cursor = _encode_children_cursor(entries[position - 1]) if position < len(entries) else None
+        folder_entry = sandbox_index.entry(folder_path)
+        node = _folder_node(folder_path, folder_entry)
+        node["has_children"] = bool(entries)
+        return {"node": node, "children": children, "next_cursor": next_cursor, "total": len(entries)}
+    except PermissionError:
+        return {"error": f"错误：无权访问目录 '{path}'。"}
+    except Exception as e:
+        return {"error": f"获取子节点失败: {e}"}
+
+def delete_folder(path: str) -> str:
+    """删除文件夹（递归删除）"""
+    print(f"(delete_folder '{path}')")
+
+    target_path = base_dir / path
+    ok, msg = validate_path(target_path, check_existence=True, expect_dir=True)
+    if not ok:
+        return msg
+
+    try:
+        import shutil
+        shutil.rmtree(target_path)
+        on_sandbox_change(target_path)
+        return f"文件夹 '{path}' 及其所有内容已删除成功。"
+    except Exception as e:
+        return f"删除文件夹 '{path}' 时发生错误：{e}"
+
+def get_folder_info(path: str, refresh: bool = False) -> Dict[str, Any]:
+    """获取文件夹详细信息；refresh时重新stat子树中的文件 (发现其他进程对文件的原地修改)"""
+    print(f"(get_folder_info '{path}')")
+
+    target_path = base_dir / path
+    ok, msg = validate_path(target_path, check_existence=True)
+    if not ok:
+        return {"error": msg}
+
+    try:
+        target_path = target_path.resolve()
+        entry = sandbox_index.entry(target_path)
+        if entry is None:
+            return {"error": f"错误：路径 '{path}' 不存在。"}
+
+        info = {
+            "name": target_path.name,
+            "path": str(target_path.relative_to(base_dir)),
+            "type": "folder" if entry.is_dir else "file",
+            "modified": _format_mtime(entry.mtime),
+            "created": _format_mtime(entry.ctime),
+        }
+
+        if not entry.is_dir:
+            info["size"] = entry.size
+        else:
+            # 文件夹大小和文件数量来自增量维护的目录合计
+            info.update(dir_sizes.totals(target_path, refresh=refresh)._asdict())
+
+        return info
+    except Exception as e:
+        return {"error": f"获取文件夹信息失败: {e}"}
+
+def get_system_info() -> str:
+    print("(get_system_info)")
+    import platform
+    import socket
+    import psutil
+    info = {
+        "操作系统": platform.system() + " " + platform.release(),
+        "主机名": socket.gethostname(),
+        "CPU核心数": psutil.cpu_count(),
+        "总内存(GB)": round(psutil.virtual_memory().total / (1024**3), 2),
+        "当前用户": psutil.Process().username()
+    }
+    return json.dumps(info, ensure_ascii=False, indent=2)
+
+def tavily_search_tool(query: str) -> str:
+    """网络搜索工具，使用Tavily API进行实时搜索，包含重试机制"""
+    print(f"(tavily_search_tool '{query}')")
+    if not tavily_api_key:
+        return "错误：未配置TAVILY_API_KEY，无法进行网络搜索。"
+
+    endpoint = "https://api.tavily.com/search"
+    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {tavily_api_key}'}
+    data = {'query': query, 'search_depth': 'basic', 'include_answer': True, 'max_results': 5}
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            # 每次重试都创建新的客户端实例
+            client = httpx.Client(timeout=httpx.Timeout(30.0, connect=10.0), follow_redirects=True)
+
+            with client:
+                response = client.post(endpoint, headers=headers, json=data)
+                response.raise_for_status()
+                result = response.json()
+
+                if result.get('results'):
+                    formatted_results = f"🔍 搜索查询: {query}\n\n"
+                    if result.get('answer'):
+                        formatted_results += f"📝 答案摘要:\n{result['answer']}\n\n"
+                    formatted_results += "🌐 相关链接:\n"
+                    for i, item in enumerate(result['results'][:5], 1):
+                        title = item.get('title', '无标题')
+                        url = item.get('url', '')
+                        content = item.get('content', '')[:200] + '...' if len(item.get('content', '')) > 200 else item.get('content', '')
+                        formatted_results += f"{i}. **{title}**\n   🔗 {url}\n   📄 {content}\n\n"
+                    return formatted_results
+                return f"未找到关于 '{query}' 的搜索结果。"
+
+        except httpx.ConnectError as e:
+            if "SSL" in str(e) or "EOF" in str(e):
+                logger.warning(f"Tavily搜索SSL连接错误 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    import time
+                    time.sleep(2 ** attempt)  # 指数退避
+                    continue
+                else:
+                    return f"网络搜索失败：SSL连接错误。建议检查网络连接。"
+            else:
+                return f"网络搜索失败：连接错误 - {str(e)}"
+
+        except httpx.TimeoutException as e:
+            logger.warning(f"Tavily搜索超时 (尝试 {attempt + 1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                import time
+                time.sleep(1)
+                continue
+            else:
+                return f"网络搜索失败：请求超时。"
+
+        except httpx.HTTPStatusError as e:
+            return f"网络搜索失败：HTTP错误 {e.response.status_code}"
+
+        except Exception as e:
+            logger.error(f"Tavily搜索发生未知错误: {e}")
+            if attempt < max_retries - 1:
+                import time
+                time.sleep(1)
+                continue
+            else:
+                return f"网络搜索失败：{str(e)}"
+
+    return "网络搜索失败：超过最大重试次数"
+
+# --- 工具注册表 ---
+# 智能体可调用的工具；重型工具由 tasks.py 的 files/search 队列按名称执行
+TOOLS = {
+    'read_file': read_file,
+    'list_files': list_files,
+    'write_file': write_file,
+    'create_directory': create_directory,
+    'delete_file': delete_file,
+    'pwd': pwd,
+    'get_system_info': get_system_info,
+    'tavily_search_tool': tavily_search_tool,
+    'rename_file': rename_file,
+    'diff_files': diff_files,
+    'tree': tree,
+    'find_files': find_files,
+    'replace_in_file': replace_in_file,
+    'replace_in_files': replace_in_files,
+    'archive_files': archive_files,
+    'extract_archive': extract_archive,
+    'list_archive': list_archive,
+    'backup_file': backup_file,
+    'file_fingerprint': file_fingerprint,
+    'batch_files': batch_files,
+    # 新增文件夹管理工具
+    'get_folder_tree': lambda path=".", max_depth=3: get_folder_tree(path, max_depth),
+    'delete_folder': delete_folder,
+    'get_folder_info': get_folder_info
+}
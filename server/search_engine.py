@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行流式内容搜索
+- 调用方边遍历边提交候选文件，文件按批分发到进程池 (或线程池) 中扫描
+- 先嗅探文件头部，含NUL字节的二进制文件直接跳过
+- 大文件通过mmap按块读取，内存占用与文件大小无关
+- 整块文本 (\r\n 统一为 \n) 用多行模式的正则定位候选位置，只对命中的行按单行语义复核，
+  未命中的行不逐行调用正则；含 \A、\Z 的模式在整块中语义不同，退回逐行匹配
+- 匹配结果按完成顺序立即产出；达到 max_results 后取消尚未开始的批次
+"""
+
+import os
+import re
+import mmap
+import atexit
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+import multiprocessing
+
+# --- 内容搜索配置 ---
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', str(os.cpu_count() or 1)))     # 扫描进程/线程数
+SEARCH_EXECUTOR = os.getenv('SEARCH_EXECUTOR', 'process')                        # process 或 thread
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '1000'))               # 默认最多返回的匹配行数
+SEARCH_BATCH_FILES = 32                  # 每批提交的文件数
+SEARCH_SNIFF_BYTES = 8192                # 二进制嗅探读取的字节数
+SEARCH_MMAP_THRESHOLD = 1 << 20          # 超过该大小的文件使用mmap
+SEARCH_CHUNK_BYTES = 4 << 20             # mmap按块解码的大小
+SEARCH_MAX_LINE_CHARS = 1000             # 结果中单行最多保留的字符数
+
+_STRING_ANCHORS = re.compile(r'\\[AZ]')   # 只在整个字符串首尾匹配的锚点
+
+
+class SearchMatch(NamedTuple):
+    """一处匹配"""
+    path: str
+    line_no: int         # 从1开始
+    line: str
+
+
+class SearchError(NamedTuple):
+    """读取文件失败"""
+    path: str
+    error: str
+
+
+SearchEvent = Union[SearchMatch, SearchError]
+
+
+# --- 扫描 (在工作进程中执行) ---
+def _is_binary(head: bytes) -> bool:
+    return b'\x00' in head
+
+
+def _scan_lines(text: str, regex: 're.Pattern', first_line: int,
+                limit: int, out: List[Tuple[int, str]]) -> None:
+    """逐行匹配 (模式无法在整块文本中定位时使用)"""
+    lines = text.split('\n')
+    if text.endswith('\n'):
+        lines.pop()
+    for line_no, line in enumerate(lines, first_line):
+        if regex.search(line):
+            out.append((line_no, line[:SEARCH_MAX_LINE_CHARS]))
+            if len(out) >= limit:
+                return
+
+
+def _scan_text(text: str, regex: 're.Pattern', block: Optional['re.Pattern'], first_line: int,
+               limit: int, out: List[Tuple[int, str]]) -> None:
+    """在一块完整行组成、以 \n 分行的文本中查找匹配行"""
+    if block is None:
+        _scan_lines(text, regex, first_line, limit, out)
+        return
+    pos = 0
+    line_no = first_line
+    counted = 0          # line_no 已计算到的偏移
+    end = len(text)
+    while pos < end and len(out) < limit:
+        found = block.search(text, pos)
+        if found is None:
+            return
+        start = text.rfind('\n', 0, found.start()) + 1
+        if start >= end:
+            return       # 末尾换行符之后不是新的一行
+        line_no += text.count('\n', counted, start)
+        counted = start
+        stop = text.find('\n', start)
+        if stop == -1:
+            stop = end
+        line = text[start:stop]
+        # 按单行语义复核 (跨行的候选不算匹配)
+        if regex.search(line):
+            out.append((line_no, line[:SEARCH_MAX_LINE_CHARS]))
+        pos = stop + 1
+
+
+def _chunks(f, size: int) -> Iterator[bytes]:
+    """按行边界切分的文件内容块"""
+    if size < SEARCH_MMAP_THRESHOLD:
+        yield f.read()
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = 0
+        while offset < size:
+            stop = min(offset + SEARCH_CHUNK_BYTES, size)
+            if stop < size:
+                newline = mm.rfind(b'\n', offset, stop)
+                if newline != -1:
+                    stop = newline + 1
+            yield mm[offset:stop]
+            offset = stop
+
+
+def scan_file(path: str, regex: 're.Pattern', block: Optional['re.Pattern'], limit: int) -> List[Tuple[int, str]]:
+    """扫描单个文件，返回最多limit个 (行号, 行内容)；二进制文件返回空列表"""
+    matches: List[Tuple[int, str]] = []
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or _is_binary(f.read(SEARCH_SNIFF_BYTES)):
+            return matches
+        f.seek(0)
+        line_no = 1
+        for chunk in _chunks(f, size):
+            # 多行模式的 $ 只在 \n 前匹配，统一换行符后CRLF文件的行尾锚点才能命中
+            text = chunk.decode('utf-8', errors='ignore').replace('\r\n', '\n')
+            _scan_text(text, regex, block, line_no, limit, matches)
+            if len(matches) >= limit:
+                break
+            line_no += text.count('\n')
+    return matches
+
+
+def scan_batch(paths: List[str], pattern: str, flags: int, limit: int) -> List[SearchEvent]:
+    """扫描一批文件 (工作进程入口，参数和返回值均可pickle)"""
+    regex = re.compile(pattern, flags)
+    block = None if _STRING_ANCHORS.search(pattern) else re.compile(pattern, flags | re.MULTILINE)
+    events: List[SearchEvent] = []
+    for path in paths:
+        if limit <= 0:
+            break
+        try:
+            found = scan_file(path, regex, block, limit)
+        except Exception as e:
+            events.append(SearchError(path, str(e)))
+            continue
+        events.extend(SearchMatch(path, line_no, line) for line_no, line in found)
+        limit -= len(found)
+    return events
+
+
+# --- 工作池 ---
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """进程内共享的扫描池，首次使用时创建"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, SEARCH_WORKERS)
+            if SEARCH_EXECUTOR == 'thread':
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+            else:
+                # spawn: 不继承调用方 (uvicorn、gevent Worker) 的线程和事件循环状态
+                _executor = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def shutdown() -> None:
+    """关闭扫描池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+def _batches(paths: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for path in paths:
+        batch.append(str(path))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def search(paths: Iterable[str], pattern: str, flags: int = 0,
+           max_results: int = SEARCH_MAX_RESULTS, executor: Optional[Executor] = None,
+           batch_size: int = SEARCH_BATCH_FILES) -> Iterator[SearchEvent]:
+    """
+    在文件中并行搜索正则表达式，按完成顺序产出 SearchMatch / SearchError
+
+    paths可以是惰性的迭代器：遍历与扫描同时进行。正则表达式无效时在产出任何结果前抛出re.error。
+    生成器被提前关闭 (调用方停止迭代或客户端断开) 时取消尚未开始的批次。
+    """
+    re.compile(pattern, flags)
+    executor = executor or get_executor()
+    in_flight_limit = max(2, 2 * SEARCH_WORKERS)
+    batches = _batches(paths, batch_size)
+    pending: Set[Future] = set()
+    remaining = max_results
+    try:
+        exhausted = False
+        while remaining > 0:
+            while not exhausted and len(pending) < in_flight_limit:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(scan_batch, batch, pattern, flags, remaining))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for event in future.result():
+                    if isinstance(event, SearchMatch):
+                        if remaining <= 0:
+                            break
+                        remaining -= 1
+                    yield event
+    finally:
+        for future in pending:
+            future.cancel()
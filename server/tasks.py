@@ -5,14 +5,30 @@ Celery任务定义文件
 
 import os
 import json
+import time
 import asyncio
-from typing import Dict, Any, Optional
+import threading
+import functools
+from typing import Dict, Any, Optional, Tuple
 from celery import Celery
+from celery.signals import (
+    worker_process_init, worker_process_shutdown, worker_shutdown, worker_init, worker_ready,
+    heartbeat_sent, before_task_publish, task_prerun, task_postrun
+)
 from celery.utils.log import get_task_logger
+from kombu import Queue
 import redis
 import httpx
 from pydantic import BaseModel
 
+from progress import ProgressPublisher, tool_progress
+from publisher import RedisPublisher
+from completion import post_chat_completion
+import idempotency
+import metrics
+import result_store
+import codec
+
 # 配置日志
 logger = get_task_logger(__name__)
 
@@ -21,6 +37,9 @@ REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', REDIS_URL)
 
+# 结果后端使用的紧凑序列化器需要在创建应用前注册
+result_store.register_serializer()
+
 # 创建Celery应用
 celery_app = Celery(
     'chrome_plus_tasks',
@@ -29,11 +48,43 @@ celery_app = Celery(
     include=['tasks']
 )
 
+# --- 队列与优先级 ---
+# chat: 交互式聊天 (低延迟)；search: 检索类任务；files: 归档/解压等重型文件操作
+CHAT_QUEUE = 'chat'
+SEARCH_QUEUE = 'search'
+FILES_QUEUE = 'files'
+
+# Redis broker的优先级数值越小越优先 (0最高)
+CHAT_TASK_PRIORITY = int(os.getenv('CHAT_TASK_PRIORITY', '0'))
+SEARCH_TASK_PRIORITY = int(os.getenv('SEARCH_TASK_PRIORITY', '3'))
+FILE_TASK_PRIORITY = int(os.getenv('FILE_TASK_PRIORITY', '6'))
+
 # Celery配置
 celery_app.conf.update(
+    task_queues=(
+        Queue(CHAT_QUEUE),
+        Queue(SEARCH_QUEUE),
+        Queue(FILES_QUEUE),
+    ),
+    task_default_queue=CHAT_QUEUE,
+    task_routes={
+        'process_ai_message': {'queue': CHAT_QUEUE},
+        'health_check': {'queue': CHAT_QUEUE},
+        'run_search_tool': {'queue': SEARCH_QUEUE},
+        'run_file_tool': {'queue': FILES_QUEUE},
+    },
+    task_default_priority=5,
+    # 每个队列按优先级拆分为 queue, queue:1 ... queue:9；同一Worker消费多个队列时按声明顺序优先取chat
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
     task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    accept_content=['json', result_store.SERIALIZER_NAME],
+    # 结果后端：超过阈值的结果压缩存储，并按配置过期
+    result_serializer=result_store.SERIALIZER_NAME,
+    result_expires=result_store.RESULT_EXPIRES,
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
@@ -41,10 +92,156 @@ celery_app.conf.update(
     task_soft_time_limit=240,  # 4分钟软超时
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    # 以 --autoscale=max,min 启动时按扩缩容策略调整进程数 (prefork)
+    worker_autoscaler='metrics:MetricsAutoscaler',
 )
 
-# Redis客户端用于发布/订阅
-redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# Redis客户端用于发布/订阅和幂等记录；负载可能经codec压缩，因此按字节读写
+redis_client = redis.Redis.from_url(REDIS_URL)
+
+# 结果频道消息经批量发布器合并后，通过连接池中的一个连接以pipeline发送
+result_publisher = RedisPublisher(redis_client)
+
+# 上游HTTP连接池配置
+# I/O模式 (gevent池) 下一个Worker进程内的数百个任务共享同一组连接
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', '200'))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', '50'))
+
+# 默认DeepSeek API地址 (可指向兼容OpenAI的代理或基准测试用的模拟服务)
+DEEPSEEK_API_BASE = os.getenv('DEEPSEEK_API_BASE', 'https://api.deepseek.com')
+
+# --- Worker进程级共享资源 ---
+# 每个Worker进程在 worker_process_init 时初始化，进程退出时关闭；
+# 非prefork池 (gevent/solo) 不会触发该信号，首次使用时惰性初始化
+_http_clients: Dict[Tuple[str, Optional[str]], httpx.Client] = {}
+_resources_lock = threading.Lock()
+_agent_template: Optional[Dict[str, Any]] = None
+_agent_runner = None
+
+def _endpoint_origin(endpoint: str) -> str:
+    """提取端点的 scheme://host:port 作为连接池键"""
+    url = httpx.URL(endpoint)
+    return f"{url.scheme}://{url.host}:{url.port or (443 if url.scheme == 'https' else 80)}"
+
+def _get_http_client(endpoint: str, proxy_url: Optional[str] = None) -> httpx.Client:
+    """获取共享的HTTP客户端，按 端点+代理 区分连接池"""
+    key = (_endpoint_origin(endpoint), proxy_url)
+    client = _http_clients.get(key)
+    if client is None:
+        with _resources_lock:
+            client = _http_clients.get(key)
+            if client is None:
+                client = httpx.Client(
+                    proxy=proxy_url,
+                    timeout=HTTP_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE
+                    )
+                )
+                _http_clients[key] = client
+    return client
+
+def _load_agent() -> Tuple[Optional[Dict[str, Any]], Any]:
+    """获取预构建的智能体模板和执行函数，模块不可用时返回 (None, None)"""
+    global _agent_template, _agent_runner
+    if _agent_template is None:
+        with _resources_lock:
+            if _agent_template is None:
+                try:
+                    from agent_tools import create_intelligent_agent, run_agent_with_tools
+                except ImportError as e:
+                    logger.warning(f"智能体模块导入失败: {e}")
+                    return None, None
+                _agent_runner = run_agent_with_tools
+                _agent_template = create_intelligent_agent(None)
+    return _agent_template, _agent_runner
+
+@worker_process_init.connect
+def _init_worker_resources(**kwargs):
+    """Worker进程启动时预构建工具注册表和默认上游连接池"""
+    _load_agent()
+    _get_http_client(DEEPSEEK_API_BASE)
+    logger.info(f"Worker进程 {os.getpid()} 共享资源初始化完成")
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _close_worker_resources(**kwargs):
+    """Worker进程退出时发送剩余消息并关闭所有连接池"""
+    result_publisher.close()
+    with _resources_lock:
+        clients = list(_http_clients.values())
+        _http_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"关闭HTTP客户端失败: {e}")
+
+# --- 队列与Worker指标 ---
+# 入队时间写入消息头，Worker在任务开始/结束时上报等待时间、执行时间和占用槽位
+_worker_info: Dict[str, Any] = {}
+_task_started_at: Dict[str, float] = {}
+
+@before_task_publish.connect
+def _stamp_task_sent_at(headers=None, **kwargs):
+    """记录任务入队时间"""
+    if headers is not None:
+        metrics.stamp_sent_at(headers)
+
+@worker_init.connect
+def _capture_worker_info(sender=None, **kwargs):
+    """记录Worker主机名、并发数和消费的队列"""
+    queues = sorted(sender.app.amqp.queues.consume_from or sender.app.amqp.queues)
+    _worker_info.update(hostname=sender.hostname, concurrency=sender.concurrency, queues=queues)
+    metrics.MetricsAutoscaler.client = redis_client
+    metrics.MetricsAutoscaler.queue = queues[0] if queues else CHAT_QUEUE
+
+@worker_ready.connect
+@heartbeat_sent.connect
+def _register_worker(**kwargs):
+    """登记Worker并刷新心跳"""
+    if not _worker_info:
+        return
+    try:
+        metrics.register_worker(redis_client, _worker_info['hostname'],
+                                _worker_info['concurrency'], _worker_info['queues'])
+    except Exception as e:
+        logger.warning(f"登记Worker指标失败: {e}")
+
+@worker_shutdown.connect
+def _unregister_worker(**kwargs):
+    """Worker退出时清除其指标"""
+    if not _worker_info:
+        return
+    try:
+        metrics.reset_worker(redis_client, _worker_info['hostname'])
+    except Exception as e:
+        logger.warning(f"清除Worker指标失败: {e}")
+
+def _task_queue(task) -> str:
+    return (task.request.delivery_info or {}).get('routing_key') or CHAT_QUEUE
+
+@task_prerun.connect
+def _record_task_start(task_id=None, task=None, **kwargs):
+    """任务开始：记录排队等待时间"""
+    _task_started_at[task_id] = time.monotonic()
+    try:
+        metrics.task_started(redis_client, task.request.hostname, _task_queue(task),
+                             getattr(task.request, metrics.SENT_AT_HEADER, None))
+    except Exception as e:
+        logger.warning(f"记录任务开始指标失败: {e}")
+
+@task_postrun.connect
+def _record_task_finish(task_id=None, task=None, **kwargs):
+    """任务结束：记录执行时间"""
+    started = _task_started_at.pop(task_id, None)
+    runtime = time.monotonic() - started if started is not None else None
+    try:
+        metrics.task_finished(redis_client, task.request.hostname, _task_queue(task), runtime)
+    except Exception as e:
+        logger.warning(f"记录任务结束指标失败: {e}")
 
 class TaskRequest(BaseModel):
     """任务请求模型"""
@@ -53,6 +250,7 @@ class TaskRequest(BaseModel):
     user_id: Optional[str] = None
     proxy_config: Optional[Dict[str, Any]] = None
     api_config: Optional[Dict[str, Any]] = None
+    idempotency_key: Optional[str] = None
 
 class TaskResult(BaseModel):
     """任务结果模型"""
@@ -61,8 +259,10 @@ class TaskResult(BaseModel):
     error: Optional[str] = None
     task_id: str
     channel_id: str
+    response_ref: Optional[str] = None   # 超大正文单独存储时的内容ID
+    response_size: Optional[int] = None
 
-@celery_app.task(bind=True, name='process_ai_message')
+@celery_app.task(bind=True, name='process_ai_message', priority=CHAT_TASK_PRIORITY)
 def process_ai_message(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     处理AI消息的异步任务
@@ -73,45 +273,57 @@ def process_ai_message(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         处理结果字典
     """
+    progress = None
     try:
         # 解析任务数据
         request = TaskRequest(**task_data)
         task_id = self.request.id
         
         logger.info(f"开始处理任务 {task_id}, 频道: {request.channel_id}")
-        
-        # 更新任务状态
-        self.update_state(
-            state='PROGRESS',
-            meta={'status': '正在处理AI请求...', 'progress': 10}
+
+        # 幂等键已有完成结果 (例如任务被重复投递)，直接复用
+        cached = _completed_result(request.idempotency_key)
+        if cached is not None:
+            logger.info(f"任务 {task_id} 命中幂等键 {request.idempotency_key}，复用任务 {cached['task_id']} 的结果")
+            _publish_result(request.channel_id, cached)
+            return cached
+
+        # 增量进度：事件按批发布到结果频道，状态写入按间隔节流
+        progress = ProgressPublisher(
+            task_id,
+            publish=lambda message: _publish_result(request.channel_id, message, urgent=False),
+            update_state=lambda meta: self.update_state(state='PROGRESS', meta=meta)
         )
+        progress.state('正在处理AI请求...', progress=10)
         
         # 调用AI API
-        response = _call_ai_api(request.message, request.api_config, request.proxy_config)
+        response = _call_ai_api(request.message, request.api_config, request.proxy_config, progress,
+                                request.channel_id)
         
-        # 更新任务状态
-        self.update_state(
-            state='PROGRESS',
-            meta={'status': '处理完成，准备返回结果...', 'progress': 90}
-        )
+        # 更新任务状态，并在最终结果之前发布剩余进度事件
+        progress.state('处理完成，准备返回结果...', progress=90)
+        progress.close()
         
-        # 构建结果
-        result = TaskResult(
+        # 构建结果；超大正文只存一份，结果后端、频道消息和幂等记录都只携带引用
+        result = _compact_result(TaskResult(
             success=True,
             response=response,
             task_id=task_id,
             channel_id=request.channel_id
-        )
+        ).dict())
         
-        # 发布结果到Redis频道
-        _publish_result(request.channel_id, result.dict())
+        # 发布结果到Redis频道 (包括重复提交后等待同一结果的频道)
+        _publish_result(request.channel_id, result)
+        _finish_idempotent(request.idempotency_key, task_id, result)
         
         logger.info(f"任务 {task_id} 处理完成")
         
-        return result.dict()
+        return result
         
     except Exception as e:
         logger.error(f"任务处理失败: {str(e)}")
+        if progress is not None:
+            progress.close()
         
         # 构建错误结果
         error_result = TaskResult(
@@ -124,10 +336,51 @@ def process_ai_message(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         
         # 发布错误结果
         _publish_result(task_data.get('channel_id', 'unknown'), error_result.dict())
+        _finish_idempotent(task_data.get('idempotency_key'), self.request.id, error_result.dict())
         
         return error_result.dict()
 
-def _call_ai_api(message: str, api_config: Optional[Dict], proxy_config: Optional[Dict]) -> str:
+def _compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """超大正文单独存储，失败时保留内联正文"""
+    try:
+        return result_store.offload_response(redis_client, result)
+    except Exception as e:
+        logger.warning(f"单独存储结果正文失败，使用内联结果: {e}")
+        return result
+
+def _completed_result(idempotency_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """返回幂等键已完成的结果，没有则返回None"""
+    if not idempotency_key:
+        return None
+    try:
+        record = idempotency.get_record(redis_client, idempotency_key)
+    except Exception as e:
+        logger.warning(f"查询幂等记录失败: {e}")
+        return None
+    if record and record.get('state') == idempotency.STATE_COMPLETED:
+        return record['result']
+    return None
+
+def _finish_idempotent(idempotency_key: Optional[str], task_id: str, result: Dict[str, Any]) -> None:
+    """
+    结束幂等任务：成功时保存结果，失败时释放幂等键以允许重试；
+    并把结果推送给重复提交后等待的频道
+    """
+    if not idempotency_key:
+        return
+    try:
+        if result.get('success'):
+            waiting = idempotency.complete(redis_client, idempotency_key, task_id, result)
+        else:
+            waiting = idempotency.fail(redis_client, idempotency_key)
+    except Exception as e:
+        logger.warning(f"更新幂等记录失败: {e}")
+        return
+    for channel_id in waiting:
+        _publish_result(channel_id, result)
+
+def _call_ai_api(message: str, api_config: Optional[Dict], proxy_config: Optional[Dict],
+                 progress: Optional[ProgressPublisher] = None, channel_id: Optional[str] = None) -> str:
     """
     调用AI API
     
@@ -135,6 +388,8 @@ def _call_ai_api(message: str, api_config: Optional[Dict], proxy_config: Optiona
         message: 用户消息
         api_config: API配置
         proxy_config: 代理配置
+        progress: 进度发布器，提供时以流式方式调用上游并发布token增量
+        channel_id: 频道ID，提交到其他队列的工具任务向其发布进度
         
     Returns:
         AI响应
@@ -142,16 +397,26 @@ def _call_ai_api(message: str, api_config: Optional[Dict], proxy_config: Optiona
     try:
         # 如果有自定义API配置，使用自定义配置
         if api_config and api_config.get('endpoint') and api_config.get('api_key'):
-            return _call_custom_api(message, api_config, proxy_config)
+            return _call_custom_api(message, api_config, proxy_config, progress)
         else:
             # 使用默认配置
-            return _call_default_api(message, proxy_config)
+            return _call_default_api(message, proxy_config, progress, channel_id)
             
     except Exception as e:
         logger.error(f"AI API调用失败: {str(e)}")
         raise
 
-def _call_custom_api(message: str, api_config: Dict, proxy_config: Optional[Dict]) -> str:
+def _post_chat_completion(client: httpx.Client, endpoint: str, headers: Dict[str, str],
+                          data: Dict[str, Any], progress: Optional[ProgressPublisher] = None) -> str:
+    """
+    发送chat/completions请求并返回回复内容
+
+    提供progress时使用SSE流式响应，逐段发布token增量
+    """
+    return post_chat_completion(client, endpoint, headers, data, progress.token if progress is not None else None)
+
+def _call_custom_api(message: str, api_config: Dict, proxy_config: Optional[Dict],
+                     progress: Optional[ProgressPublisher] = None) -> str:
     """调用自定义AI API"""
     endpoint = api_config['endpoint']
     api_key = api_config['api_key']
@@ -176,49 +441,41 @@ def _call_custom_api(message: str, api_config: Dict, proxy_config: Optional[Dict
     }
     
     # 配置代理
-    proxies = None
+    proxy_url = None
     if proxy_config and proxy_config.get('enabled'):
         proxy_url = _build_proxy_url(proxy_config)
-        proxies = {'http': proxy_url, 'https': proxy_url}
-    
-    # 创建HTTP客户端，根据是否有代理配置
-    if proxies:
-        client = httpx.Client(proxy=proxies['https'], timeout=60.0)
-    else:
-        client = httpx.Client(timeout=60.0)
-
-    with client:
-        response = client.post(endpoint, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        if result.get('choices') and result['choices'][0].get('message'):
-            return result['choices'][0]['message']['content']
-        else:
-            raise Exception("API响应格式异常")
 
-def _call_default_api(message: str, proxy_config: Optional[Dict]) -> str:
+    # 使用共享连接池发送请求
+    client = _get_http_client(endpoint, proxy_url)
+    return _post_chat_completion(client, endpoint, headers, data, progress)
+
+def _call_default_api(message: str, proxy_config: Optional[Dict],
+                      progress: Optional[ProgressPublisher] = None, channel_id: Optional[str] = None) -> str:
     """调用智能体API（使用本地智能体和工具）"""
-    try:
-        # 导入智能体相关模块
-        from agent_tools import create_intelligent_agent, run_agent_with_tools
+    agent_template, run_agent_with_tools = _load_agent()
+    if agent_template is None:
+        return _call_basic_api(message, proxy_config, progress)
 
-        # 创建智能体实例
-        agent = create_intelligent_agent(proxy_config)
+    try:
+        # 复用预构建的工具注册表，仅替换本次请求的代理和连接池
+        proxy_url = _build_proxy_url(proxy_config) if proxy_config and proxy_config.get('enabled') else None
+        agent = dict(agent_template)
+        agent['proxy_config'] = proxy_config
+        agent['http_client'] = _get_http_client(DEEPSEEK_API_BASE, proxy_url)
+        agent['tools'] = queued_tools(agent['tools'], channel_id)
+        if progress is not None:
+            agent['on_event'] = progress.event
+            agent['on_token'] = progress.token
 
         # 使用智能体处理消息
-        response = run_agent_with_tools(agent, message)
-
-        return response
+        return run_agent_with_tools(agent, message)
 
-    except ImportError as e:
-        logger.warning(f"智能体模块导入失败，回退到基础API: {e}")
-        return _call_basic_api(message, proxy_config)
     except Exception as e:
         logger.error(f"智能体调用失败: {e}")
-        return _call_basic_api(message, proxy_config)
+        return _call_basic_api(message, proxy_config, progress)
 
-def _call_basic_api(message: str, proxy_config: Optional[Dict]) -> str:
+def _call_basic_api(message: str, proxy_config: Optional[Dict],
+                    progress: Optional[ProgressPublisher] = None) -> str:
     """调用基础DeepSeek API（回退方案）"""
     # 获取DeepSeek API密钥
     api_key = os.getenv('DEEPSEEK_API_KEY')
@@ -227,7 +484,7 @@ def _call_basic_api(message: str, proxy_config: Optional[Dict]) -> str:
         return f"收到消息: {message}\n\n注意：未配置API密钥，当前为测试模式。请在.env文件中设置DEEPSEEK_API_KEY。"
 
     # DeepSeek API配置
-    endpoint = "https://api.deepseek.com/v1/chat/completions"
+    endpoint = f"{DEEPSEEK_API_BASE.rstrip('/')}/v1/chat/completions"
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {api_key}'
@@ -242,27 +499,14 @@ def _call_basic_api(message: str, proxy_config: Optional[Dict]) -> str:
     }
 
     # 配置代理
-    proxies = None
+    proxy_url = None
     if proxy_config and proxy_config.get('enabled'):
         proxy_url = _build_proxy_url(proxy_config)
-        proxies = {'http': proxy_url, 'https': proxy_url}
 
     try:
-        # 创建HTTP客户端，根据是否有代理配置
-        if proxies:
-            client = httpx.Client(proxy=proxies['https'], timeout=60.0)
-        else:
-            client = httpx.Client(timeout=60.0)
-
-        with client:
-            response = client.post(endpoint, headers=headers, json=data)
-            response.raise_for_status()
-
-            result = response.json()
-            if result.get('choices') and result['choices'][0].get('message'):
-                return result['choices'][0]['message']['content']
-            else:
-                raise Exception("API响应格式异常")
+        # 使用共享连接池发送请求
+        client = _get_http_client(endpoint, proxy_url)
+        return _post_chat_completion(client, endpoint, headers, data, progress)
 
     except httpx.HTTPStatusError as e:
         logger.error(f"DeepSeek API HTTP错误: {e.response.status_code} - {e.response.text}")
@@ -288,20 +532,123 @@ def _build_proxy_url(proxy_config: Dict) -> str:
     
     return f"{proxy_type}://{auth}{host}:{port}"
 
-def _publish_result(channel_id: str, result: Dict[str, Any]) -> None:
+def _publish_result(channel_id: str, result: Dict[str, Any], urgent: bool = True) -> None:
     """
     将结果发布到Redis频道
     
     Args:
         channel_id: 频道ID
         result: 结果数据
+        urgent: 是否立即发送；进度事件为False，可与其他消息合并到同一次pipeline
     """
-    try:
-        channel_name = f"result:{channel_id}"
-        redis_client.publish(channel_name, json.dumps(result))
+    channel_name = f"result:{channel_id}"
+    result_publisher.publish(channel_name, codec.dumps(result), urgent=urgent)
+    if urgent:
         logger.info(f"结果已发布到频道: {channel_name}")
+
+# --- 重型工具任务 ---
+# 这些工具在 sandbox_tools 的工具注册表中实现；智能体的工具循环通过 queued_tools 把它们提交到
+# files/search 队列并等待结果。只有确认有其他Worker (心跳登记) 消费目标队列时才提交：
+# 当前Worker自己也消费该队列时在本槽位内执行 (占着槽位等待同一进程池会互相等待)，
+# 没有Worker消费时在调用方进程内执行
+TOOL_TASK_DISPATCH = os.getenv('TOOL_TASK_DISPATCH', 'true').lower() == 'true'   # false: 重型工具总在调用方本地执行
+TOOL_TASK_TIMEOUT = float(os.getenv('TOOL_TASK_TIMEOUT', '300'))                  # 等待工具任务结果的秒数
+
+FILE_TASK_TOOLS = {
+    'archive_files', 'extract_archive', 'list_archive', 'backup_file', 'replace_in_file', 'replace_in_files',
+    'diff_files', 'file_fingerprint', 'tree', 'get_folder_info', 'delete_folder', 'batch_files'
+}
+SEARCH_TASK_TOOLS = {'find_files', 'tavily_search_tool'}
+
+def _run_tool(task_id: str, tool_name: str, allowed: set, args: Optional[list],
+              kwargs: Optional[Dict[str, Any]], channel_id: Optional[str]) -> Dict[str, Any]:
+    """执行注册表中的工具并把结果发布到频道"""
+    # 工具报告的进度按间隔合并后发布到同一频道
+    progress = ProgressPublisher(
+        task_id, publish=lambda message: _publish_result(channel_id, message, urgent=False)
+    ) if channel_id else None
+    try:
+        if tool_name not in allowed:
+            raise ValueError(f"工具 '{tool_name}' 不能在该队列执行")
+        import sandbox_tools
+        tool = sandbox_tools.TOOLS[tool_name]
+        with tool_progress(functools.partial(progress.tool_progress, tool_name) if progress else None):
+            result = tool(*(args or []), **(kwargs or {}))
+        if isinstance(result, list):
+            result = "\n".join(map(str, result))
+        elif not isinstance(result, str):
+            result = json.dumps(result, ensure_ascii=False)
+        payload = _compact_result({"response": result, "success": True, "tool": tool_name, "task_id": task_id})
     except Exception as e:
-        logger.error(f"发布结果失败: {str(e)}")
+        logger.error(f"工具任务 {tool_name} 执行失败: {e}")
+        payload = {"response": "", "success": False, "error": str(e), "tool": tool_name, "task_id": task_id}
+
+    if progress is not None:
+        progress.close()
+    if channel_id:
+        _publish_result(channel_id, {"type": "tool_result", "data": payload})
+    return payload
+
+@celery_app.task(bind=True, name='run_file_tool', priority=FILE_TASK_PRIORITY)
+def run_file_tool(self, tool_name: str, args: Optional[list] = None,
+                  kwargs: Optional[Dict[str, Any]] = None, channel_id: Optional[str] = None) -> Dict[str, Any]:
+    """在files队列执行归档、解压等重型文件工具"""
+    return _run_tool(self.request.id, tool_name, FILE_TASK_TOOLS, args, kwargs, channel_id)
+
+@celery_app.task(bind=True, name='run_search_tool', priority=SEARCH_TASK_PRIORITY)
+def run_search_tool(self, tool_name: str, args: Optional[list] = None,
+                    kwargs: Optional[Dict[str, Any]] = None, channel_id: Optional[str] = None) -> Dict[str, Any]:
+    """在search队列执行文件内容搜索和网络搜索"""
+    return _run_tool(self.request.id, tool_name, SEARCH_TASK_TOOLS, args, kwargs, channel_id)
+
+def _tool_task(tool_name: str):
+    if tool_name in FILE_TASK_TOOLS:
+        return run_file_tool, FILES_QUEUE
+    if tool_name in SEARCH_TASK_TOOLS:
+        return run_search_tool, SEARCH_QUEUE
+    return None, None
+
+def _should_dispatch(queue: str) -> bool:
+    """目标队列由其他Worker消费时提交，当前Worker自己消费或无人消费时在本地执行"""
+    if queue in _worker_info.get('queues', ()):
+        return False
+    try:
+        consumers = metrics.queue_consumers(redis_client, queue)
+    except Exception as e:
+        logger.warning(f"查询队列 {queue} 的消费者失败，在本地执行工具: {e}")
+        return False
+    return any(hostname != _worker_info.get('hostname') for hostname in consumers)
+
+def queued_tool(tool_name: str, func, channel_id: Optional[str] = None):
+    """
+    把重型工具包装为提交到对应队列并等待结果的函数；其他工具原样返回
+
+    工具的进度事件由执行它的Worker发布到channel_id
+    """
+    task, queue = _tool_task(tool_name)
+    if task is None or not TOOL_TASK_DISPATCH:
+        return func
+
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        if not _should_dispatch(queue):
+            return func(*args, **kwargs)
+        try:
+            async_result = task.apply_async(args=[tool_name, list(args), kwargs, channel_id])
+        except Exception as e:
+            logger.warning(f"提交工具任务 {tool_name} 失败，在本地执行: {e}")
+            return func(*args, **kwargs)
+        # 在聊天任务中等待子任务：_should_dispatch 保证目标队列由其他Worker的进程池消费
+        payload = async_result.get(timeout=TOOL_TASK_TIMEOUT, disable_sync_subtasks=False)
+        payload = result_store.resolve_response_sync(redis_client, payload)
+        if not payload.get('success'):
+            raise RuntimeError(payload.get('error') or f"工具任务 {tool_name} 执行失败")
+        return payload['response']
+    return call
+
+def queued_tools(tools: Dict[str, Any], channel_id: Optional[str] = None) -> Dict[str, Any]:
+    """工具注册表中的重型工具替换为提交到队列执行的版本"""
+    return {name: queued_tool(name, func, channel_id) for name, func in tools.items()}
 
 @celery_app.task(name='health_check')
 def health_check() -> Dict[str, Any]:
@@ -313,4 +660,4 @@ def health_check() -> Dict[str, Any]:
     }
 
 # 导出Celery应用供其他模块使用
-__all__ = ['celery_app', 'process_ai_message', 'health_check']
+__all__ = ['celery_app', 'process_ai_message', 'run_file_tool', 'run_search_tool', 'health_check', 'queued_tools']
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档创建测试
+"""
+
+import os
+import io
+import zlib
+import tarfile
+import zipfile
+
+import pytest
+
+import archive_engine
+from archive_engine import Member, write_archive, write_tar, write_zip
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """src/ 下的小目录树：多块文件、空文件、非ASCII文件名和空目录"""
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "empty_dir").mkdir()
+    (src / "big.bin").write_bytes(os.urandom(50_000) + b"abc" * 40_000)
+    (src / "empty.txt").write_bytes(b"")
+    (src / "sub" / "说明.txt").write_text("你好\n" * 100, encoding="utf-8")
+    members = [Member(src, "src", True)]
+    for root, dirs, files in os.walk(src):
+        for name in sorted(dirs + files):
+            path = os.path.join(root, name)
+            members.append(Member(path, os.path.relpath(path, tmp_path).replace(os.sep, "/"), os.path.isdir(path)))
+    return tmp_path, members
+
+
+def _contents(tmp_path, members):
+    return {m.arcname: open(m.path, "rb").read() for m in members if not m.is_dir}
+
+
+class TestCrcCombine:
+    """CRC32合并测试类"""
+
+    @pytest.mark.parametrize("a,b", [(b"hello", b" world"), (b"", b"x"), (b"x", b""), (os.urandom(3000), os.urandom(70_001))])
+    def test_matches_zlib(self, a, b):
+        """测试两段CRC的合并结果与整体计算一致"""
+        assert archive_engine._crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+
+
+class TestWriteZip:
+    """并行zip写入测试类"""
+
+    def test_roundtrip_multi_block(self, tree, monkeypatch):
+        """测试分块并行压缩的归档可被zipfile读取，内容与CRC正确"""
+        monkeypatch.setattr(archive_engine, "ARCHIVE_BLOCK_BYTES", 8192)
+        tmp_path, members = tree
+        target = tmp_path / "out.zip"
+        assert write_zip(target, members, workers=3) == len(members)
+        with zipfile.ZipFile(target) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+            for name, data in _contents(tmp_path, members).items():
+                assert zf.read(name) == data
+            assert "src/empty_dir/" in names
+            assert zf.getinfo("src/empty_dir/").is_dir()
+            assert zf.getinfo("src/big.bin").compress_size < zf.getinfo("src/big.bin").file_size
+        # 成员顺序与输入一致
+        assert names == [m.arcname + ("/" if m.is_dir else "") for m in members]
+
+    def test_many_small_files_skip_crc_combine(self, tmp_path, monkeypatch):
+        """测试单块成员直接使用块的CRC，不构建CRC推进矩阵 (大量小文件时的主要开销)"""
+        src = tmp_path / "many"
+        src.mkdir()
+        members = []
+        for i in range(500):
+            path = src / f"f{i}.txt"
+            path.write_bytes(os.urandom(i % 97 + 1))
+            members.append(Member(path, f"many/f{i}.txt", False))
+        built = []
+        real_operator = archive_engine._crc_shift_operator
+        monkeypatch.setattr(archive_engine, "_crc_shift_operator", lambda n: built.append(n) or real_operator(n))
+        write_zip(tmp_path / "many.zip", members, workers=4)
+        assert built == []
+        with zipfile.ZipFile(tmp_path / "many.zip") as zf:
+            assert zf.testzip() is None
+            assert len(zf.namelist()) == 500
+
+    def test_progress_reported(self, tree, monkeypatch):
+        """测试进度回调的字节数单调递增，最终等于总大小"""
+        monkeypatch.setattr(archive_engine, "ARCHIVE_BLOCK_BYTES", 16384)
+        tmp_path, members = tree
+        reports = []
+        write_zip(tmp_path / "out.zip", members, on_progress=reports.append, workers=2)
+        done = [r.bytes_done for r in reports]
+        assert done == sorted(done)
+        assert reports[-1].files_done == reports[-1].files_total == 3
+        assert reports[-1].bytes_done == reports[-1].bytes_total
+
+    def test_failure_cancels_and_raises(self, tree):
+        """测试成员读取失败时抛出异常"""
+        tmp_path, members = tree
+        members.append(Member(tmp_path / "missing.txt", "missing.txt", False))
+        with pytest.raises(OSError):
+            write_zip(tmp_path / "out.zip", members)
+
+
+class TestWriteTar:
+    """tar写入测试类"""
+
+    def test_gztar_roundtrip(self, tree):
+        """测试tar.gz包含全部成员"""
+        tmp_path, members = tree
+        target = tmp_path / "out.tar.gz"
+        write_archive(target, members, "gztar")
+        with tarfile.open(target) as tf:
+            assert tf.getnames() == [m.arcname for m in members]
+            for name, data in _contents(tmp_path, members).items():
+                assert tf.extractfile(name).read() == data
+
+    @pytest.mark.skipif(not archive_engine.ZSTD_AVAILABLE, reason="未安装zstandard")
+    def test_zstdtar_roundtrip(self, tree):
+        """测试tar.zst可以解压并得到相同内容"""
+        import zstandard
+        tmp_path, members = tree
+        target = tmp_path / "out.tar.zst"
+        write_tar(target, members, "zstdtar", workers=2)
+        with open(target, "rb") as f:
+            raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tf:
+            for name, data in _contents(tmp_path, members).items():
+                assert tf.extractfile(name).read() == data
+
+    def test_unknown_format(self, tree):
+        """测试不支持的格式"""
+        tmp_path, members = tree
+        with pytest.raises(ValueError):
+            write_archive(tmp_path / "out.rar", members, "rar")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档读取测试
+"""
+
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import archive_reader
+from archive_reader import ArchiveFormatError, member_index, safe_target
+
+
+@pytest.fixture
+def zip_archive(tmp_path):
+    path = tmp_path / "a.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("docs/", "")
+        zf.writestr("docs/a.md", "a")
+        zf.writestr("docs/sub/b.md", "bb")
+        zf.writestr("docs0.txt", "not under docs/")
+        zf.writestr("src\\main.py", "print(1)\n")
+        zf.writestr("big.bin", os.urandom(100_000))
+    return path
+
+
+class TestMemberIndex:
+    """成员索引测试类"""
+
+    def test_prefix_lookup(self, zip_archive):
+        """测试目录前缀只匹配 prefix/ 下的成员，反斜杠规范化为 /"""
+        index = member_index(zip_archive)
+        assert [m.name for m in index.under("docs")] == ["docs/a.md", "docs/sub/b.md"]
+        assert [m.name for m in index.under("docs/sub/")] == ["docs/sub/b.md"]
+        assert [m.name for m in index.under("src")] == ["src/main.py"]
+        assert len(index.under("")) == 6
+
+    def test_select_exact_and_prefix(self, zip_archive):
+        """测试选择成员：精确匹配、目录前缀、去重，报告未匹配的请求"""
+        selected, missing = member_index(zip_archive).select(["docs", "docs/a.md", "docs0.txt", "nope"])
+        assert [m.name for m in selected] == ["docs", "docs/a.md", "docs/sub/b.md", "docs0.txt"]
+        assert missing == ["nope"]
+
+    def test_cached_until_modified(self, zip_archive):
+        """测试索引按 mtime 缓存，归档修改后重新读取"""
+        first = member_index(zip_archive)
+        assert member_index(zip_archive) is first
+        with zipfile.ZipFile(zip_archive, "a") as zf:
+            zf.writestr("new.txt", "n")
+        st = os.stat(zip_archive)
+        os.utime(zip_archive, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert "new.txt" in member_index(zip_archive).by_name
+
+    def test_unrecognized_format(self, tmp_path):
+        """测试无法识别的格式"""
+        (tmp_path / "x.dat").write_bytes(b"hello")
+        with pytest.raises(ArchiveFormatError):
+            member_index(tmp_path / "x.dat")
+
+
+class TestExtract:
+    """解压测试类"""
+
+    def test_parallel_zip_extract(self, zip_archive, tmp_path):
+        """测试多线程解压全部zip成员"""
+        dest = tmp_path / "out"
+        dest.mkdir()
+        index = member_index(zip_archive)
+        reports = []
+        extracted, skipped = archive_reader.extract_zip(zip_archive, dest, index.members, reports.append, workers=3)
+        assert skipped == []
+        assert len(extracted) == 6
+        assert (dest / "docs" / "sub" / "b.md").read_text() == "bb"
+        assert (dest / "src" / "main.py").read_text() == "print(1)\n"
+        assert reports[-1].files_done == reports[-1].files_total == 5
+
+    def test_zip_unsafe_members_skipped(self, tmp_path):
+        """测试含 .. 的成员和穿过符号链接的成员被跳过"""
+        outside = tmp_path / "outside"
+        outside.mkdir()
+        dest = tmp_path / "out"
+        dest.mkdir()
+        (dest / "link").symlink_to(outside)
+        path = tmp_path / "evil.zip"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("../escape.txt", "x")
+            zf.writestr("link/pwned.txt", "x")
+            zf.writestr("ok.txt", "ok")
+        extracted, skipped = archive_reader.extract_zip(path, dest, member_index(path).members)
+        assert extracted == ["ok.txt"]
+        assert sorted(skipped) == ["../escape.txt", "link/pwned.txt"]
+        assert os.listdir(outside) == []
+        assert not (tmp_path / "escape.txt").exists()
+
+    def test_tar_selected_members(self, tmp_path):
+        """测试tar.gz按选择的成员单遍解压"""
+        path = tmp_path / "a.tar.gz"
+        with tarfile.open(path, "w:gz") as tf:
+            for name, data in (("d/a.txt", b"a"), ("d/b.txt", b"b"), ("e.txt", b"e")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        index = member_index(path)
+        assert index.kind == "tar"
+        selected, _ = index.select(["d"])
+        dest = tmp_path / "out"
+        extracted, skipped = archive_reader.extract_tar(path, index.kind, dest, selected)
+        assert sorted(extracted) == ["d/a.txt", "d/b.txt"]
+        assert not (dest / "e.txt").exists()
+
+    @pytest.mark.parametrize("data_filter", [True, False])
+    def test_tar_links_outside_dest_skipped(self, tmp_path, monkeypatch, data_filter):
+        """测试指向目标目录之外的符号链接/硬链接成员被跳过 (包括没有 'data' 过滤器时)"""
+        if not data_filter:
+            monkeypatch.setattr(archive_reader, "_TAR_FILTER", {})
+        elif not archive_reader._TAR_FILTER:
+            pytest.skip("tarfile 没有 'data' 过滤器")
+        (tmp_path / "secret.txt").write_text("s")
+        path = tmp_path / "links.tar"
+        with tarfile.open(path, "w") as tf:
+            info = tarfile.TarInfo("ok.txt")
+            info.size = 2
+            tf.addfile(info, io.BytesIO(b"ok"))
+            for name, kind, target in (("inner", tarfile.SYMTYPE, "ok.txt"),
+                                       ("evil", tarfile.SYMTYPE, "../secret.txt"),
+                                       ("abs", tarfile.SYMTYPE, str(tmp_path / "secret.txt")),
+                                       ("hard", tarfile.LNKTYPE, "../secret.txt")):
+                info = tarfile.TarInfo(name)
+                info.type, info.linkname = kind, target
+                tf.addfile(info)
+        dest = tmp_path / "out"
+        extracted, skipped = archive_reader.extract_tar(path, "tar", dest)
+        assert sorted(extracted) == ["inner", "ok.txt"]
+        assert sorted(skipped) == ["abs", "evil", "hard"]
+        assert sorted(os.listdir(dest)) == ["inner", "ok.txt"]
+
+    def test_safe_target(self, tmp_path):
+        """测试目标路径校验"""
+        assert safe_target(tmp_path, "a/./b.txt") == tmp_path / "a" / "b.txt"
+        assert safe_target(tmp_path, "/etc/passwd") is None
+        assert safe_target(tmp_path, "a/../../b") is None
+        assert safe_target(tmp_path, "C:\\x") is None
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis负载编解码测试
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import codec
+
+
+class TestCodec:
+    """编解码测试类"""
+
+    def test_small_payload_unchanged(self):
+        """测试阈值以下的负载保持纯JSON，订阅端可以直接解析"""
+        message = {"type": "progress", "data": {"events": []}}
+        encoded = codec.dumps(message, threshold=1024)
+        assert encoded == json.dumps(message).encode('utf-8')
+        assert codec.loads(encoded) == message
+
+    def test_zlib_round_trip_with_header(self):
+        """测试zlib压缩带头部标记，大幅缩小重复文本"""
+        text = "\n".join(f"├── src/module_{i % 20}/file_{i}.py" for i in range(5000)).encode('utf-8')
+        encoded = codec.encode(text, threshold=1024, algorithm='zlib')
+        assert encoded.startswith(codec.ZLIB_HEADER)
+        assert len(encoded) * 4 < len(text)
+        assert codec.decode(encoded) == text
+
+    @pytest.mark.skipif(not codec.ZSTD_AVAILABLE, reason="未安装zstandard")
+    def test_zstd_round_trip_with_header(self):
+        """测试zstd压缩带头部标记"""
+        text = ("find_files 结果 " * 10000).encode('utf-8')
+        encoded = codec.encode(text, threshold=1024, algorithm='zstd')
+        assert encoded.startswith(codec.ZSTD_HEADER)
+        assert codec.decode(encoded) == text
+
+    @pytest.mark.skipif(not codec.ZSTD_AVAILABLE, reason="未安装zstandard")
+    def test_zstd_concurrent_threads(self):
+        """测试多个线程同时压缩解压时各用各的zstd对象"""
+        payloads = [(f"thread {n} " * 2000).encode('utf-8') for n in range(8)]
+
+        def round_trip(data):
+            return all(codec.decode(codec.encode(data, threshold=0, algorithm='zstd')) == data for _ in range(50))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert all(executor.map(round_trip, payloads))
+
+    def test_incompressible_payload_kept_raw(self):
+        """测试压缩后不变小的负载保持原样"""
+        data = os.urandom(4096)
+        assert codec.encode(data, threshold=1024, algorithm='zlib') == data
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+差异比较测试
+"""
+
+import time
+import random
+
+import diff_engine
+
+
+def _apply(a, codes, b):
+    """按操作序列由a重建b"""
+    out = []
+    for tag, i1, i2, j1, j2 in codes:
+        out.extend(a[i1:i2] if tag == 'equal' else b[j1:j2])
+    return out
+
+
+class TestDiffEngine:
+    """差异比较测试类"""
+
+    def test_opcodes_rebuild_target(self):
+        """测试操作序列能由a重建b，相等部分确实相等"""
+        rng = random.Random(7)
+        for _ in range(50):
+            a = [rng.choice("abcdefg") for _ in range(rng.randint(0, 60))]
+            b = [rng.choice("abcdefgh") for _ in range(rng.randint(0, 60))]
+            a_ids, b_ids = diff_engine.intern_lines(a, b)
+            codes = diff_engine.opcodes(a_ids, b_ids)
+            assert _apply(a_ids, codes, b_ids) == b_ids
+            assert all(a_ids[i1:i2] == b_ids[j1:j2] for tag, i1, i2, j1, j2 in codes if tag == 'equal')
+
+    def test_unified_format_matches_difflib(self):
+        """测试简单修改的统一格式输出与difflib一致"""
+        a = [f"line {i}\n" for i in range(20)]
+        b = list(a)
+        b[5] = "changed\n"
+        b.insert(15, "inserted\n")
+        text, truncated = diff_engine.unified_diff(a, b, "a.txt", "b.txt")
+        import difflib
+        expected = "".join(difflib.unified_diff(a, b, "a.txt", "b.txt"))
+        assert not truncated
+        assert text == expected
+
+    def test_output_capped(self):
+        """测试超过 max_lines 时截断"""
+        a = [f"a{i}\n" for i in range(100)]
+        b = [f"b{i}\n" for i in range(100)]
+        text, truncated = diff_engine.unified_diff(a, b, "a", "b", max_lines=10)
+        assert truncated and text.count("\n") == 10
+
+    def test_large_generated_files_fast(self):
+        """测试大文件的少量修改在短时间内完成"""
+        a = [f"row {i}: {i * 7919 % 10007}\n" for i in range(200_000)]
+        b = list(a)
+        for k in range(0, 200_000, 20_000):
+            b[k] = f"edited {k}\n"
+        start = time.perf_counter()
+        text, _ = diff_engine.unified_diff(a, b, "a", "b")
+        assert time.perf_counter() - start < 5
+        assert text.count("\n+edited") == 10
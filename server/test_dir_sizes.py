@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录大小聚合测试
+"""
+
+import os
+import shutil
+
+import pytest
+
+import dir_sizes
+from dir_sizes import DirSizeIndex, DirTotals
+from sandbox_index import SandboxIndex
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "a" / "b" / "c").mkdir(parents=True)
+    (tmp_path / "a" / "x.txt").write_bytes(b"x" * 10)
+    (tmp_path / "a" / "b" / "y.txt").write_bytes(b"y" * 20)
+    (tmp_path / "a" / "b" / "c" / "z.txt").write_bytes(b"z" * 30)
+    index = SandboxIndex(tmp_path)
+    return tmp_path, index, DirSizeIndex(index, workers=4)
+
+
+def _change(index, sizes, *paths):
+    """模拟本进程的写操作通知"""
+    index.invalidate(*paths)
+    sizes.on_change(*paths)
+
+
+class TestDirSizeIndex:
+    """目录大小聚合测试类"""
+
+    def test_initial_totals(self, tree):
+        """测试首次统计整个子树"""
+        root, _, sizes = tree
+        assert sizes.totals(root / "a") == DirTotals(60, 3, 2)
+        assert sizes.totals(root / "a" / "b") == DirTotals(50, 2, 1)
+        assert sizes.totals(root) == DirTotals(60, 3, 3)
+
+    def test_cached_between_queries(self, tree):
+        """测试校验间隔内的重复查询不再读取目录"""
+        root, index, sizes = tree
+        sizes.totals(root / "a")
+        scans = index.scans
+        for _ in range(10):
+            sizes.totals(root / "a")
+        assert index.scans == scans
+
+    def test_own_writes_propagate_deltas(self, tree):
+        """测试写入、删除、新建目录和重命名的变化量传播到所有祖先，不重新遍历"""
+        root, index, sizes = tree
+        sizes.totals(root)
+        (root / "a" / "b" / "c" / "z.txt").write_bytes(b"z" * 35)
+        _change(index, sizes, root / "a" / "b" / "c" / "z.txt")
+        (root / "a" / "x.txt").unlink()
+        _change(index, sizes, root / "a" / "x.txt")
+        (root / "a" / "new" / "deep").mkdir(parents=True)
+        (root / "a" / "new" / "deep" / "n.txt").write_bytes(b"n" * 5)
+        _change(index, sizes, root / "a" / "new" / "deep" / "n.txt")
+        scans = index.scans
+        # 查询直接返回增量维护的结果
+        assert sizes.totals(root, revalidate_seconds=3600) == DirTotals(60, 3, 5)
+        assert sizes.totals(root / "a", revalidate_seconds=3600) == DirTotals(60, 3, 4)
+        assert index.scans == scans
+
+        os.rename(root / "a" / "b", root / "b2")
+        _change(index, sizes, root / "a" / "b", root / "b2")
+        assert sizes.totals(root, revalidate_seconds=3600) == DirTotals(60, 3, 5)
+        assert sizes.totals(root / "a", revalidate_seconds=3600) == DirTotals(5, 1, 2)
+
+        shutil.rmtree(root / "b2")
+        _change(index, sizes, root / "b2")
+        assert sizes.totals(root, revalidate_seconds=3600) == DirTotals(5, 1, 3)
+
+    def test_external_changes_revalidated(self, tree):
+        """测试外部修改在校验时被发现 (目录mtime变化)"""
+        root, _, sizes = tree
+        assert sizes.totals(root / "a") == DirTotals(60, 3, 2)
+        (root / "a" / "b" / "c" / "ext.txt").write_bytes(b"e" * 7)
+        assert sizes.totals(root / "a", revalidate_seconds=0) == DirTotals(67, 4, 2)
+
+    def test_in_place_modification_restat(self, tree, monkeypatch):
+        """测试原地修改文件 (目录mtime不变) 只在重新stat的间隔到期或显式刷新时发现"""
+        root, _, sizes = tree
+        c = root / "a" / "b" / "c"
+        mtime = os.stat(c).st_mtime_ns - 10 ** 10      # 目录mtime不在沙箱索引的"近期修改"窗口内
+        os.utime(c, ns=(mtime, mtime))
+        assert sizes.totals(root / "a") == DirTotals(60, 3, 2)
+        with open(c / "z.txt", "ab") as f:
+            f.write(b"z" * 5)
+        os.utime(c, ns=(mtime, mtime))
+
+        stats = []
+        real_stat = os.stat
+        monkeypatch.setattr(os, "stat", lambda p, *a, **k: stats.append(p) or real_stat(p, *a, **k))
+        # 普通的校验只stat目录，不stat文件
+        assert sizes.totals(root / "a", revalidate_seconds=0) == DirTotals(60, 3, 2)
+        assert not [p for p in stats if str(p).endswith(".txt")]
+
+        assert sizes.totals(root / "a", refresh=True) == DirTotals(65, 3, 2)
+        assert sizes.totals(root, revalidate_seconds=0) == DirTotals(65, 3, 3)
+
+        with open(c / "z.txt", "ab") as f:
+            f.write(b"z" * 5)
+        os.utime(c, ns=(mtime, mtime))
+        monkeypatch.setattr(dir_sizes, "DIR_SIZE_RESTAT_SECONDS", 0)
+        assert sizes.totals(root / "a", revalidate_seconds=0) == DirTotals(70, 3, 2)
+
+    def test_accept_filter(self, tree):
+        """测试被accept拒绝的条目不计入"""
+        root, index, _ = tree
+        sizes = DirSizeIndex(index, accept=lambda d, name, is_symlink: name != "b")
+        assert sizes.totals(root / "a") == DirTotals(10, 1, 0)
+
+    def test_missing_directory(self, tree):
+        """测试目录不存在时抛出OSError"""
+        root, _, sizes = tree
+        with pytest.raises(OSError):
+            sizes.totals(root / "missing")
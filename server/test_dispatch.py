@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天任务分发测试
+"""
+
+import asyncio
+
+from dispatch import ChatDispatcher
+
+
+def _make_dispatcher(mode, broker_up=True, enqueue_error=None, local_limit=1):
+    calls = {"enqueued": [], "local": []}
+
+    async def enqueue(task_data):
+        if enqueue_error:
+            raise enqueue_error
+        calls["enqueued"].append(task_data)
+        return "task-1"
+
+    async def run_local(task_data):
+        calls["local"].append(task_data)
+
+    dispatcher = ChatDispatcher(enqueue, run_local, lambda: broker_up, mode=mode, local_limit=local_limit)
+    return dispatcher, calls
+
+
+class TestChatDispatcher:
+    """聊天任务分发器测试类"""
+
+    def test_never_runs_locally(self):
+        """测试never策略总是进程内执行"""
+        dispatcher, calls = _make_dispatcher('never')
+        assert asyncio.run(dispatcher.dispatch({"message": "hi"})) is None
+        assert calls["local"] and not calls["enqueued"]
+
+    def test_always_enqueues_when_broker_up(self):
+        """测试always策略在Redis可用时提交到Worker"""
+        dispatcher, calls = _make_dispatcher('always')
+        assert asyncio.run(dispatcher.dispatch({"message": "hi"})) == "task-1"
+        assert calls["enqueued"] and not calls["local"]
+
+    def test_falls_back_when_broker_down(self):
+        """测试Redis不可用时回退到进程内执行"""
+        dispatcher, calls = _make_dispatcher('always', broker_up=False)
+        asyncio.run(dispatcher.dispatch({"message": "hi"}))
+        assert calls["local"] and not calls["enqueued"]
+
+    def test_falls_back_when_enqueue_fails(self):
+        """测试提交任务失败时回退到进程内执行"""
+        dispatcher, calls = _make_dispatcher('always', enqueue_error=ConnectionError("down"))
+        assert asyncio.run(dispatcher.dispatch({"message": "hi"})) is None
+        assert calls["local"]
+
+    def test_adaptive_routes_by_local_load(self):
+        """测试adaptive策略按进程内负载路由"""
+        dispatcher, _ = _make_dispatcher('adaptive', local_limit=1)
+        assert dispatcher.choose_route() == 'local'
+        dispatcher.local_inflight = 1
+        assert dispatcher.choose_route() == 'worker'
@@ -6,8 +6,21 @@ FastAPI应用测试文件
 
 import pytest
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.testclient import TestClient
+import main
 from main import app
+import sandbox_tools
+from sandbox_index import SandboxIndex
+from path_guard import PathGuard
+import search_engine
+from trigram_index import TrigramIndex
+from fingerprint import FingerprintCache
+from dir_sizes import DirSizeIndex
+import file_transfer
+import codec
+from test_idempotency import _FakeRedis as _IdemRedis, _FakeAsyncRedis as _IdemAsyncRedis
 
 # 创建测试客户端
 client = TestClient(app)
@@ -104,6 +117,400 @@ class TestHealthCheck:
         # 根端点可能不存在，这是正常的
         assert response.status_code in [200, 404]
 
+class _FakePubSub:
+    """按顺序产出预先发布的消息的 redis.asyncio PubSub"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.patterns = []
+        self.closed = False
+
+    async def psubscribe(self, *patterns):
+        self.patterns.extend(patterns)
+
+    async def listen(self):
+        for channel, payload in self.messages:
+            yield {"type": "pmessage", "pattern": b"result:*", "channel": channel.encode(), "data": codec.dumps(payload)}
+
+    async def punsubscribe(self, *patterns):
+        self.patterns.clear()
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+class TestRedisListener:
+    """Redis结果监听器测试类"""
+
+    def test_forwards_published_results(self, monkeypatch):
+        """测试 result:* 频道上的任务结果和进度事件转发到对应的WebSocket"""
+        pubsub = _FakePubSub([
+            ("result:ch-1", {"type": "progress", "data": {"event": "tool_start", "tool": "tree"}}),
+            ("result:ch-1", {"response": "完成", "success": True, "task_id": "t-1"}),
+        ])
+
+        class FakeRedis:
+            def __init__(self, connection_pool):
+                assert connection_pool is pool
+
+            def pubsub(self):
+                return pubsub
+
+        pool = object()     # 与真实的连接池一样没有 pubsub()
+        websocket = _FakeWebSocket()
+        monkeypatch.setattr(main, "redis_pool", pool)
+        monkeypatch.setattr(main.redis, "Redis", FakeRedis)
+        monkeypatch.setitem(main.manager.active_connections, "ch-1", websocket)
+
+        asyncio.run(main.redis_listener())
+        assert pubsub.closed and not pubsub.patterns
+        assert [m["type"] for m in websocket.sent] == ["progress", "result"]
+        assert websocket.sent[1]["data"]["response"] == "完成"
+        assert websocket.sent[1]["data"]["task_id"] == "t-1"
+
+
+class TestIdempotentChat:
+    """聊天幂等键测试类"""
+
+    @pytest.fixture
+    def chat_env(self, monkeypatch):
+        store = _IdemRedis()
+        runs = []
+
+        def run_agent(agent, message):
+            runs.append(message)
+            return f"回复: {message}"
+
+        monkeypatch.setattr(main, "REDIS_AVAILABLE", True)
+        monkeypatch.setattr(main, "redis_pool", object())
+        monkeypatch.setattr(main.redis, "Redis", lambda connection_pool: _IdemAsyncRedis(store))
+        monkeypatch.setattr(main, "create_intelligent_agent", lambda *args: {})
+        monkeypatch.setattr(main, "run_agent_with_tools", run_agent)
+        monkeypatch.setattr(main.chat_dispatcher, "mode", "never")
+        sockets = {}
+        for channel_id in ("ch-a", "ch-b"):
+            sockets[channel_id] = _FakeWebSocket()
+            monkeypatch.setitem(main.manager.active_connections, channel_id, sockets[channel_id])
+        return runs, sockets
+
+    def _send(self, channel_id, key):
+        message = {"data": {"message": "你好", "idempotency_key": key}}
+        asyncio.run(main.handle_chat_message(message, channel_id))
+
+    def _results(self, websocket):
+        return [m["data"]["response"] for m in websocket.sent if m["type"] == "result"]
+
+    def test_local_route_runs_once(self, chat_env):
+        """测试进程内执行的一轮对话被重试时不再执行，重试的频道收到原结果"""
+        runs, sockets = chat_env
+        self._send("ch-a", "turn-1")
+        self._send("ch-b", "turn-1")
+        assert runs == ["你好"]
+        assert self._results(sockets["ch-a"]) == ["回复: 你好"]
+        assert self._results(sockets["ch-b"]) == ["回复: 你好"]
+
+    def test_http_fallback_reuses_turn(self, chat_env):
+        """测试WebSocket已执行的一轮对话降级到HTTP重试时复用结果"""
+        runs, _ = chat_env
+        self._send("ch-a", "turn-2")
+        response = client.post("/chat", json={"message": "你好", "idempotency_key": "turn-2"})
+        assert response.status_code == 200
+        assert response.json()["response"] == "回复: 你好"
+        assert runs == ["你好"]
+
+    def test_enqueue_failure_falls_back_under_same_claim(self, chat_env, monkeypatch):
+        """测试提交Worker失败回退到进程内执行时沿用已登记的幂等键"""
+        runs, sockets = chat_env
+
+        async def failing_enqueue(task_data):
+            raise ConnectionError("broker down")
+
+        monkeypatch.setattr(main.chat_dispatcher, "mode", "always")
+        monkeypatch.setattr(main.chat_dispatcher, "_enqueue", failing_enqueue)
+        self._send("ch-a", "turn-3")
+        self._send("ch-b", "turn-3")
+        assert runs == ["你好"]
+        assert self._results(sockets["ch-b"]) == ["回复: 你好"]
+
+@pytest.fixture
+def sandbox(tmp_path, tmp_path_factory, monkeypatch):
+    """把文件操作的沙箱目录指向临时目录"""
+    monkeypatch.setattr(sandbox_tools, "base_dir", tmp_path)
+    monkeypatch.setattr(sandbox_tools, "sandbox_index", SandboxIndex(tmp_path))
+    monkeypatch.setattr(sandbox_tools, "path_guard", PathGuard(tmp_path))
+    monkeypatch.setattr(sandbox_tools, "fingerprints", FingerprintCache(str(tmp_path_factory.mktemp("cache") / "fingerprints.sqlite")))
+    monkeypatch.setattr(sandbox_tools, "dir_sizes", DirSizeIndex(sandbox_tools.sandbox_index, accept=sandbox_tools.path_guard.child_ok))
+    return tmp_path
+
+class TestFolderAPI:
+    """文件夹API测试类"""
+
+    def test_children_paginated_with_cursor(self, sandbox):
+        """测试懒加载接口逐页返回一层子节点和 has_children 提示"""
+        (sandbox / "docs").mkdir()
+        (sandbox / "docs" / "a.md").write_text("a")
+        (sandbox / "empty").mkdir()
+        for i in range(5):
+            (sandbox / f"f{i}.txt").write_text("x" * i)
+
+        response = client.get("/api/folders/children", params={"path": ".", "limit": 3})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 7
+        assert [c["name"] for c in data["children"]] == ["docs", "empty", "f0.txt"]
+        assert data["children"][0]["has_children"] is True
+        assert data["children"][1]["has_children"] is False
+        assert "children" not in data["children"][0]
+
+        names = [c["name"] for c in data["children"]]
+        cursor = data["next_cursor"]
+        while cursor:
+            page = client.get("/api/folders/children", params={"path": ".", "limit": 3, "cursor": cursor}).json()
+            names += [c["name"] for c in page["children"]]
+            cursor = page["next_cursor"]
+        assert names == ["docs", "empty"] + [f"f{i}.txt" for i in range(5)]
+
+    def test_info_totals_follow_own_writes(self, sandbox):
+        """测试文件夹统计在本进程的写入、删除、重命名后保持正确"""
+        (sandbox / "proj" / "src").mkdir(parents=True)
+        (sandbox / "proj" / "src" / "a.py").write_text("12345")
+        info = client.get("/api/folders/info", params={"path": "proj"}).json()
+        assert (info["total_size"], info["file_count"], info["folder_count"]) == (5, 1, 1)
+
+        sandbox_tools.write_file("proj/src/b.py", "123")
+        sandbox_tools.write_file("proj/new/deep.txt", "1234567")
+        sandbox_tools.delete_file("proj/src/a.py")
+        sandbox_tools.rename_file("proj/src", "proj/lib")
+        info = client.get("/api/folders/info", params={"path": "proj"}).json()
+        assert (info["total_size"], info["file_count"], info["folder_count"]) == (10, 2, 2)
+        assert sandbox_tools.get_folder_info("proj/lib")["total_size"] == 3
+
+    def test_children_rejects_paths_outside_sandbox(self, sandbox):
+        """测试懒加载接口拒绝沙箱外的路径"""
+        response = client.get("/api/folders/children", params={"path": ".."})
+        assert response.status_code == 400
+
+class TestSearchAPI:
+    """内容搜索API测试类"""
+
+    @pytest.fixture(autouse=True)
+    def thread_pool(self, monkeypatch):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            monkeypatch.setattr(search_engine, "_executor", executor)
+            yield
+
+    def test_search_streams_ndjson(self, sandbox):
+        """测试搜索结果逐行返回，最后一行为汇总"""
+        (sandbox / "src").mkdir()
+        (sandbox / "src" / "a.py").write_text("def main():\n    pass\n")
+        (sandbox / "notes.md").write_text("main idea\n")
+        (sandbox / "blob.bin").write_bytes(b"main\x00")
+
+        response = client.get("/api/files/search", params={"regex": "main", "pattern": "*.py"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert records[0] == {"path": "src/a.py", "line": 1, "text": "def main():"}
+        assert records[-1] == {"done": True, "count": 1, "truncated": False}
+
+    def test_search_truncates_at_max_results(self, sandbox):
+        """测试达到 max_results 后标记截断"""
+        (sandbox / "a.txt").write_text("x\n" * 20)
+        response = client.get("/api/files/search", params={"regex": "x", "max_results": 5})
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert len(records) == 6
+        assert records[-1] == {"done": True, "count": 5, "truncated": True}
+
+    def test_search_with_trigram_index(self, sandbox, tmp_path_factory, monkeypatch):
+        """测试启用三元组索引后只扫描包含字面量的文件，结果不变"""
+        index = TrigramIndex(str(tmp_path_factory.mktemp("cache") / "trigram.sqlite"))
+        monkeypatch.setattr(sandbox_tools, "trigram_index", index)
+        (sandbox / "a.py").write_text("import os\nos.getenv('X')\n")
+        (sandbox / "b.py").write_text("print('hi')\n")
+
+        response = client.get("/api/files/search", params={"regex": r"getenv\(", "pattern": "*.py"})
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert records == [{"path": "a.py", "line": 2, "text": "os.getenv('X')"},
+                           {"done": True, "count": 1, "truncated": False}]
+        index.close()
+
+    def test_search_rejects_invalid_regex(self, sandbox):
+        """测试无效正则返回400"""
+        assert client.get("/api/files/search", params={"regex": "("}).status_code == 400
+
+class TestFileTransferAPI:
+    """文件传输API测试类"""
+
+    def test_download_with_range_and_etag(self, sandbox):
+        """测试下载支持Range请求和ETag条件请求"""
+        (sandbox / "data.txt").write_bytes(b"0123456789")
+
+        response = client.get("/api/files", params={"path": "data.txt"})
+        assert response.status_code == 200
+        assert response.content == b"0123456789"
+        etag = response.headers["etag"]
+
+        partial = client.get("/api/files", params={"path": "data.txt"}, headers={"Range": "bytes=2-5"})
+        assert partial.status_code == 206
+        assert partial.content == b"2345"
+        assert partial.headers["content-range"] == "bytes 2-5/10"
+
+        cached = client.get("/api/files", params={"path": "data.txt"}, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+    def test_download_rejects_missing_and_outside(self, sandbox):
+        """测试下载不存在的文件返回404，沙箱外的路径返回400"""
+        assert client.get("/api/files", params={"path": "missing.txt"}).status_code == 404
+        assert client.get("/api/files", params={"path": "../x"}).status_code == 400
+
+    def test_upload_streams_to_disk(self, sandbox):
+        """测试分块上传写入文件，不允许覆盖时返回409"""
+        chunks = (b"x" * 65536 for _ in range(40))
+        response = client.put("/api/files", params={"path": "up/big.bin"}, content=chunks)
+        assert response.status_code == 200
+        assert response.json() == {"success": True, "path": "up/big.bin", "size": 65536 * 40, "created": True}
+        assert (sandbox / "up" / "big.bin").stat().st_size == 65536 * 40
+
+        conflict = client.put("/api/files", params={"path": "up/big.bin", "overwrite": False}, content=b"new")
+        assert conflict.status_code == 409
+        assert (sandbox / "up" / "big.bin").stat().st_size == 65536 * 40
+
+    def test_upload_too_large_leaves_target_untouched(self, sandbox, monkeypatch):
+        """测试超过大小上限时返回413，原文件不变且不留临时文件"""
+        monkeypatch.setattr(file_transfer, "UPLOAD_MAX_BYTES", 10)
+        (sandbox / "keep.txt").write_text("original")
+        response = client.put("/api/files", params={"path": "keep.txt"}, content=b"y" * 100)
+        assert response.status_code == 413
+        assert (sandbox / "keep.txt").read_text() == "original"
+        assert sorted(p.name for p in sandbox.iterdir()) == ["keep.txt"]
+
+class TestFingerprintTools:
+    """内容指纹相关工具测试类"""
+
+    def test_backup_skipped_when_unchanged(self, sandbox):
+        """测试文件自上次备份以来未修改时不重复备份，修改后创建新备份"""
+        (sandbox / "notes.txt").write_text("v1\n")
+        first = sandbox_tools.backup_file("notes.txt")
+        assert "已成功备份" in first
+        assert "未修改" in sandbox_tools.backup_file("notes.txt")
+        assert len(list((sandbox / "backups").iterdir())) == 1
+
+        (sandbox / "notes.txt").write_text("v2 changed\n")
+        # 时间戳精确到秒，把已有备份改名为更早的时间避免重名
+        old = next((sandbox / "backups").iterdir())
+        old.rename(old.with_name("notes.20000101000000.txt.bak"))
+        sandbox_tools.on_sandbox_change(old, old.with_name("notes.20000101000000.txt.bak"))
+        assert "已成功备份" in sandbox_tools.backup_file("notes.txt")
+        assert len(list((sandbox / "backups").iterdir())) == 2
+
+    def test_file_fingerprint_and_diff(self, sandbox):
+        """测试指纹工具报告行数，内容相同的文件diff直接判定相同"""
+        (sandbox / "a.txt").write_text("one\ntwo\nthree")
+        (sandbox / "b.txt").write_text("one\ntwo\nthree")
+        result = sandbox_tools.file_fingerprint("a.txt")
+        assert "3 行文本" in result and "13 字节" in result
+        assert "内容完全相同" in sandbox_tools.diff_files("a.txt", "b.txt")
+        (sandbox / "c.bin").write_bytes(b"\x00\x01")
+        assert "二进制文件" in sandbox_tools.file_fingerprint("c.bin")
+
+class TestArchiveTools:
+    """归档工具测试类"""
+
+    def test_zip_directory(self, sandbox):
+        """测试zip归档包含目录下的文件和空目录，不包含归档文件本身"""
+        import zipfile
+        (sandbox / "proj" / "src").mkdir(parents=True)
+        (sandbox / "proj" / "empty").mkdir()
+        (sandbox / "proj" / "src" / "a.py").write_text("print(1)\n")
+        result = sandbox_tools.archive_files("proj/out.zip", ["proj"])
+        assert "成功创建归档" in result and "1 个文件" in result
+        with zipfile.ZipFile(sandbox / "proj" / "out.zip") as zf:
+            assert zf.read("proj/src/a.py") == b"print(1)\n"
+            assert "proj/empty/" in zf.namelist()
+            assert "proj/out.zip" not in zf.namelist()
+
+    def test_tar_format_aliases(self, sandbox):
+        """测试 tar.gz 等扩展名形式的格式参数"""
+        import tarfile
+        (sandbox / "a.txt").write_text("a")
+        assert "gztar" in sandbox_tools.archive_files("a.tgz", ["a.txt"], "tar.gz")
+        with tarfile.open(sandbox / "a.tgz") as tf:
+            assert tf.getnames() == ["a.txt"]
+        assert "不支持的归档格式" in sandbox_tools.archive_files("a.rar", ["a.txt"], "rar")
+
+    def test_list_and_extract_members(self, sandbox):
+        """测试不解压列出成员，按目录前缀解压部分成员"""
+        (sandbox / "proj" / "docs").mkdir(parents=True)
+        (sandbox / "proj" / "docs" / "a.md").write_text("aaa")
+        (sandbox / "proj" / "main.py").write_text("x")
+        sandbox_tools.archive_files("p.zip", ["proj"])
+
+        listing = sandbox_tools.list_archive("p.zip", prefix="proj/docs")
+        assert "1 个成员" in listing and "proj/docs/a.md (3 字节)" in listing
+        assert "没有" in sandbox_tools.list_archive("p.zip", prefix="nope")
+
+        result = sandbox_tools.extract_archive("p.zip", "out", ["proj/docs", "missing"])
+        assert "成功解压 2 个" in result
+        assert (sandbox / "out" / "proj" / "docs" / "a.md").read_text() == "aaa"
+        assert not (sandbox / "out" / "proj" / "main.py").exists()
+        assert "未找到" in sandbox_tools.extract_archive("p.zip", "out", ["missing"])
+
+class TestBatchAPI:
+    """批量文件操作API测试类"""
+
+    def test_batch_roundtrip(self, sandbox):
+        """测试一次请求完成多个操作，返回每个操作的结果，文件夹统计随之更新"""
+        (sandbox / "inbox").mkdir()
+        for name in ("a.txt", "b.txt"):
+            (sandbox / "inbox" / name).write_text(name)
+        assert sandbox_tools.get_folder_info("inbox")["file_count"] == 2
+
+        response = client.post("/api/files/batch", json={"operations": [
+            {"op": "create", "path": "archive"},
+            {"op": "move", "path": "inbox/a.txt", "dest": "archive/a.txt"},
+            {"op": "move", "path": "inbox/b.txt", "dest": "archive/b.txt"},
+            {"op": "write", "path": "archive/README", "content": "说明"},
+            {"op": "delete", "path": "inbox"},
+        ]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert [r["status"] for r in data["results"]] == ["ok"] * 5
+        assert sorted(p.name for p in (sandbox / "archive").iterdir()) == ["README", "a.txt", "b.txt"]
+        assert not (sandbox / "inbox").exists()
+        assert sandbox_tools.get_folder_info("archive")["file_count"] == 3
+
+    def test_invalid_batch_not_executed(self, sandbox):
+        """测试有无效操作时整批不执行，返回每个无效操作的错误"""
+        response = client.post("/api/files/batch", json={"operations": [
+            {"op": "create", "path": "new"},
+            {"op": "write", "path": "../escape.txt", "content": "x"},
+            {"op": "delete", "path": "missing"},
+        ]})
+        assert response.status_code == 400
+        assert [e["index"] for e in response.json()["detail"]["errors"]] == [1, 2]
+        assert not (sandbox / "new").exists()
+
+    def test_agent_tool_summary(self, sandbox):
+        """测试智能体工具报告失败和跳过的操作"""
+        (sandbox / "f.txt").write_text("f")
+        result = sandbox_tools.batch_files([
+            {"op": "create", "path": "d"},
+            {"op": "move", "path": "d", "dest": "f.txt"},
+            {"op": "write", "path": "d/x", "content": "x"},
+        ])
+        assert "成功 1，失败 1，跳过 1" in result
+        assert "错误：批量操作未执行" in sandbox_tools.batch_files([{"op": "rename", "path": "x"}])
+
 if __name__ == "__main__":
     # 运行测试
     pytest.main([__file__, "-v"])
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量文件操作测试
+"""
+
+import pytest
+
+import file_batch
+from file_batch import BatchValidationError, execute, normalize, parse, plan, validate
+from path_guard import PathGuard
+
+
+def _waves(raw_ops):
+    return [[op.index for op in wave] for wave in plan(parse(raw_ops))]
+
+
+class TestPlan:
+    """分轮测试类"""
+
+    def test_independent_ops_share_a_wave(self):
+        """测试路径互不重叠的操作在同一轮"""
+        ops = [{"op": "write", "path": f"d{i}/f.txt", "content": ""} for i in range(4)]
+        assert _waves(ops) == [[0, 1, 2, 3]]
+
+    def test_ancestor_and_same_path_are_ordered(self):
+        """测试对同一路径或祖先/子路径的操作按列表顺序分在后面的轮次"""
+        ops = [
+            {"op": "create", "path": "a"},
+            {"op": "write", "path": "a/b/c.txt", "content": "x"},
+            {"op": "write", "path": "z.txt", "content": "z"},
+            {"op": "move", "path": "a", "dest": "b"},
+            {"op": "write", "path": "b/new.txt", "content": "y"},
+            {"op": "delete", "path": "z.txt"},
+        ]
+        assert _waves(ops) == [[0, 2], [1, 5], [3], [4]]
+
+    def test_normalize(self):
+        """测试路径规范化拒绝沙箱根目录、绝对路径和 .."""
+        assert normalize("a\\b/./c/") == "a/b/c"
+        assert normalize("a/../b") == "b"
+        for bad in ("", ".", "/etc", "../x", "a/../../x", "C:/x", None):
+            assert normalize(bad) is None
+
+
+class TestValidate:
+    """执行前校验测试类"""
+
+    def test_collects_all_errors(self, tmp_path):
+        """测试一次报告所有无效操作"""
+        (tmp_path / "exists").mkdir()
+        ops = [
+            {"op": "copy", "path": "a"},
+            {"op": "write", "path": "a.txt"},
+            {"op": "move", "path": "a", "dest": "a/b"},
+            {"op": "create", "path": "exists"},
+            {"op": "delete", "path": "missing"},
+            {"op": "create", "path": "ok"},
+        ]
+        with pytest.raises(BatchValidationError) as excinfo:
+            validate(tmp_path, ops, PathGuard(tmp_path).validate)
+        assert [index for index, _ in excinfo.value.errors] == [0, 1, 2, 3, 4]
+        assert not (tmp_path / "ok").exists()
+
+    def test_dependent_ops_not_prechecked(self, tmp_path):
+        """测试依赖批内之前操作的操作不按当前磁盘状态检查"""
+        ops = [{"op": "create", "path": "a"}, {"op": "write", "path": "a/x", "content": ""},
+               {"op": "delete", "path": "a/x"}]
+        validate(tmp_path, ops, PathGuard(tmp_path).validate)
+
+    def test_outside_sandbox(self, tmp_path):
+        """测试通过符号链接离开沙箱的路径被拒绝"""
+        (tmp_path / "sandbox").mkdir()
+        (tmp_path / "sandbox" / "link").symlink_to(tmp_path)
+        with pytest.raises(BatchValidationError):
+            validate(tmp_path / "sandbox", [{"op": "write", "path": "link/x", "content": ""}],
+                     PathGuard(tmp_path / "sandbox").validate)
+
+    def test_too_many_operations(self, tmp_path, monkeypatch):
+        """测试操作数上限"""
+        monkeypatch.setattr(file_batch, "BATCH_MAX_OPERATIONS", 2)
+        with pytest.raises(BatchValidationError):
+            parse([{"op": "create", "path": str(i)} for i in range(3)])
+
+
+class TestExecute:
+    """执行测试类"""
+
+    def _run(self, base, ops, **kwargs):
+        guard = PathGuard(base)
+        _, waves = validate(base, ops, guard.validate)
+        return execute(base, waves, guard.validate, **kwargs)
+
+    def test_reorganize(self, tmp_path):
+        """测试创建、写入、移动、删除按顺序生效，结果按原始顺序返回"""
+        (tmp_path / "old").mkdir()
+        (tmp_path / "old" / "a.txt").write_text("a")
+        (tmp_path / "junk.txt").write_text("j")
+        changed, progress = [], []
+        ops = [
+            {"op": "create", "path": "new"},
+            {"op": "move", "path": "old/a.txt", "dest": "new/a.txt"},
+            {"op": "write", "path": "new/a.txt", "content": "b", "mode": "a"},
+            {"op": "delete", "path": "old"},
+            {"op": "delete", "path": "junk.txt"},
+        ] + [{"op": "write", "path": f"many/{i}.txt", "content": str(i)} for i in range(20)]
+        results = self._run(tmp_path, ops, on_change=lambda *p: changed.extend(p),
+                            on_progress=lambda done, total: progress.append((done, total)), workers=4)
+        assert [r["index"] for r in results] == list(range(len(ops)))
+        assert all(r["status"] == "ok" for r in results)
+        assert (tmp_path / "new" / "a.txt").read_text() == "ab"
+        assert not (tmp_path / "old").exists() and not (tmp_path / "junk.txt").exists()
+        assert sorted(p.name for p in (tmp_path / "many").iterdir()) == sorted(f"{i}.txt" for i in range(20))
+        assert tmp_path / "new" / "a.txt" in changed and tmp_path / "old" in changed
+        assert progress[-1] == (len(ops), len(ops))
+
+    def test_failure_skips_dependents_only(self, tmp_path):
+        """测试失败的操作只跳过依赖它的后续操作"""
+        ops = [
+            {"op": "create", "path": "dir"},
+            {"op": "write", "path": "taken", "content": "t"},
+            {"op": "move", "path": "dir", "dest": "taken"},     # 目标已由批内的操作创建，执行时失败
+            {"op": "write", "path": "dir/x.txt", "content": "x"},
+            {"op": "write", "path": "other.txt", "content": "o"},
+        ]
+        results = self._run(tmp_path, ops)
+        assert [r["status"] for r in results] == ["ok", "ok", "error", "skipped", "ok"]
+        assert "#2" in results[3]["message"]
+        assert (tmp_path / "other.txt").read_text() == "o"
+        assert not (tmp_path / "dir" / "x.txt").exists()
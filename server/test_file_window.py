@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件窗口读取测试
+"""
+
+import pytest
+
+import file_window
+from file_window import LineIndex, WindowError, read_window
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes("".join(f"line {i}\n" for i in range(1, 5001)).encode())
+    return path
+
+
+class TestFileWindow:
+    """窗口读取测试类"""
+
+    def test_line_range(self, log_file, monkeypatch):
+        """测试按行范围读取，稀疏索引的检查点不影响行号"""
+        monkeypatch.setattr(file_window, 'LINE_INDEX_STRIDE', 100)
+        window = read_window(log_file, start_line=2500, end_line=2502)
+        assert window.text == "line 2500\nline 2501\nline 2502\n"
+        assert (window.first_line, window.last_line, window.truncated) == (2500, 2502, False)
+
+        assert read_window(log_file, start_line=6000).text == ""
+        assert read_window(log_file, start_line=5000).text == "line 5000\n"
+
+    def test_line_index_matches_splitlines(self, tmp_path):
+        """测试行索引与逐行切分的结果一致 (含无结尾换行的最后一行)"""
+        data = b"a\n\nbb\nccc\nlast"
+        path = tmp_path / "f.txt"
+        path.write_bytes(data)
+        index = LineIndex(data, len(data), stride=3)
+        assert index.total_lines == 5
+        starts = [index.line_start(data, n) for n in range(1, 6)]
+        assert [data[s:].split(b"\n")[0] for s in starts] == data.split(b"\n")
+        assert [index.line_of(data, s) for s in starts] == [1, 2, 3, 4, 5]
+
+    def test_head_and_tail(self, log_file):
+        """测试开头/末尾N行"""
+        assert read_window(log_file, head=2).text == "line 1\nline 2\n"
+        tail = read_window(log_file, tail=2)
+        assert tail.text == "line 4999\nline 5000\n"
+        assert tail.end == tail.size
+
+    def test_byte_window_and_truncation(self, log_file):
+        """测试字节窗口，超过上限时截断到完整的行"""
+        window = read_window(log_file, offset=7, length=7)
+        assert window.text == "line 2\n"
+
+        clipped = read_window(log_file, max_bytes=20)
+        assert clipped.truncated and clipped.text == "line 1\nline 2\n"
+        tail = read_window(log_file, tail=100, max_bytes=25)
+        assert tail.text == "line 4999\nline 5000\n"
+
+    def test_index_revalidated_after_change(self, log_file):
+        """测试文件变化后行索引重建"""
+        assert read_window(log_file, start_line=3, end_line=3).text == "line 3\n"
+        log_file.write_text("x\ny\nz\n")
+        assert read_window(log_file, start_line=3, end_line=3).text == "z\n"
+
+    def test_invalid_arguments(self, log_file):
+        """测试参数组合或取值无效"""
+        with pytest.raises(WindowError):
+            read_window(log_file, head=1, tail=1)
+        with pytest.raises(WindowError):
+            read_window(log_file, start_line=0)
+        with pytest.raises(WindowError):
+            read_window(log_file, start_line=5, end_line=4)
+
+    def test_render_notes_partial_window(self, log_file):
+        """测试未覆盖整个文件的窗口附带位置说明"""
+        text = file_window.render("app.log", read_window(log_file, start_line=10, end_line=11))
+        assert text.startswith("line 10\nline 11\n")
+        assert "第 10-11 行" in text
+        small = log_file.parent / "small.txt"
+        small.write_text("abc")
+        assert file_window.render("small.txt", read_window(small)) == "abc"
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容指纹缓存测试
+"""
+
+import os
+
+import pytest
+
+import fingerprint
+from fingerprint import FingerprintCache, compute
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = FingerprintCache(str(tmp_path / ".cache" / "fingerprints.sqlite"))
+    yield c
+    c.close()
+
+
+def _age(path, seconds=60):
+    """把mtime调早，使记录不处于不可信的时间窗口内"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 1_000_000_000))
+
+
+class TestCompute:
+    """指纹计算测试类"""
+
+    def test_lines_and_binary(self, tmp_path):
+        """测试行数 (末尾无换行的最后一行也计入) 和二进制判断"""
+        (tmp_path / "a.txt").write_bytes(b"one\ntwo\nthree")
+        (tmp_path / "b.txt").write_bytes(b"one\ntwo\n")
+        (tmp_path / "c.bin").write_bytes(b"PK\x00\x03")
+        (tmp_path / "empty").write_bytes(b"")
+        assert compute(tmp_path / "a.txt").lines == 3
+        assert compute(tmp_path / "b.txt").lines == 2
+        assert compute(tmp_path / "empty").lines == 0
+        assert not compute(tmp_path / "a.txt").binary
+        assert compute(tmp_path / "c.bin").binary
+
+    def test_digest_spans_chunks(self, tmp_path, monkeypatch):
+        """测试分块读取时摘要与内容一致，只相差一个字节的文件摘要不同"""
+        monkeypatch.setattr(fingerprint, "FINGERPRINT_CHUNK", 7)
+        data = bytes(range(256)) * 50
+        (tmp_path / "x").write_bytes(data)
+        (tmp_path / "y").write_bytes(data[:-1] + b"\x00")
+        (tmp_path / "z").write_bytes(data)
+        assert compute(tmp_path / "x").digest == compute(tmp_path / "z").digest
+        assert compute(tmp_path / "x").digest != compute(tmp_path / "y").digest
+        assert compute(tmp_path / "x").digest.startswith(fingerprint.FINGERPRINT_ALGORITHM + ":")
+
+
+class TestFingerprintCache:
+    """指纹缓存测试类"""
+
+    def test_cached_without_rereading(self, cache, tmp_path, monkeypatch):
+        """测试文件未变化时从缓存返回，不再读取内容"""
+        path = tmp_path / "a.txt"
+        path.write_text("hello\n")
+        _age(path)
+        first = cache.get(path)
+        monkeypatch.setattr(fingerprint, "compute", lambda *a, **k: pytest.fail("不应重新计算"))
+        assert cache.get(path) == first
+        assert cache.peek(path) == first
+
+    def test_persisted_across_instances(self, cache, tmp_path):
+        """测试记录持久化，新实例直接命中"""
+        path = tmp_path / "a.txt"
+        path.write_text("hello\n")
+        _age(path)
+        first = cache.get(path)
+        cache.close()
+        reopened = FingerprintCache(cache.path)
+        assert reopened.peek(path) == first
+        reopened.close()
+
+    def test_change_detected(self, cache, tmp_path):
+        """测试大小、mtime或inode变化后重新计算"""
+        path = tmp_path / "a.txt"
+        path.write_text("hello\n")
+        _age(path)
+        first = cache.get(path)
+        path.write_text("world\n")
+        _age(path, 30)
+        assert cache.peek(path) is None
+        assert cache.get(path).digest != first.digest
+
+    def test_recent_mtime_not_trusted(self, cache, tmp_path):
+        """测试刚修改过的文件 (同一时间片内可能再次修改) 的记录不被信任"""
+        path = tmp_path / "a.txt"
+        path.write_text("hello\n")
+        cache.get(path)
+        assert cache.peek(path) is None
+
+    def test_invalidate_directory(self, cache, tmp_path):
+        """测试使目录失效时删除其下所有文件的记录，同名前缀的兄弟目录不受影响"""
+        (tmp_path / "d").mkdir()
+        (tmp_path / "dd").mkdir()
+        for path in (tmp_path / "d" / "a", tmp_path / "dd" / "b"):
+            path.write_text("x")
+            _age(path)
+            cache.get(path)
+        cache.invalidate(tmp_path / "d")
+        assert cache.peek(tmp_path / "d" / "a") is None
+        assert cache.peek(tmp_path / "dd" / "b") is not None
+
+    def test_same_content(self, cache, tmp_path):
+        """测试内容比较：大小不同时不计算指纹"""
+        (tmp_path / "a").write_text("same")
+        (tmp_path / "b").write_text("same")
+        (tmp_path / "c").write_text("other!")
+        _age(tmp_path / "c")
+        assert cache.same_content(tmp_path / "a", tmp_path / "b")
+        assert not cache.same_content(tmp_path / "a", tmp_path / "c")
+        assert cache.peek(tmp_path / "c") is None
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务提交幂等性测试
+"""
+
+import asyncio
+
+import pytest
+
+import idempotency
+
+
+class _FakeRedis:
+    """内存中的最小Redis实现，覆盖幂等登记表用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        current = self.data.get(key, set())
+        removed = len(current & set(members))
+        current.difference_update(members)
+        return removed
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class _FakeAsyncRedis:
+    """把 _FakeRedis 包装成 redis.asyncio 风格的接口"""
+
+    def __init__(self, sync):
+        self.sync = sync
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            return getattr(self.sync, name)(*args, **kwargs)
+        return call
+
+    def pipeline(self):
+        return _FakeAsyncPipeline(self.sync.pipeline())
+
+
+class _FakeAsyncPipeline:
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+    async def execute(self):
+        return self.pipe.execute()
+
+
+class TestIdempotency:
+    """幂等登记表测试类"""
+
+    def test_duplicate_claim_joins_original_task(self):
+        """测试重复提交返回原任务并登记等待频道，完成后通知这些频道"""
+        store = _FakeRedis()
+        client = _FakeAsyncRedis(store)
+
+        async def scenario():
+            first = await idempotency.claim(client, "k1", "task-1", "ch-a")
+            second = await idempotency.claim(client, "k1", "task-2", "ch-b")
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first is None
+        assert second["task_id"] == "task-1"
+        assert second["state"] == idempotency.STATE_PENDING
+
+        waiting = idempotency.complete(store, "k1", "task-1", {"success": True, "response": "ok"})
+        assert waiting == ["ch-b"]
+        record = idempotency.get_record(store, "k1")
+        assert record["state"] == idempotency.STATE_COMPLETED
+        assert record["result"]["response"] == "ok"
+
+    def test_failed_task_releases_key(self):
+        """测试任务失败后释放幂等键，客户端可以重新提交"""
+        store = _FakeRedis()
+        client = _FakeAsyncRedis(store)
+
+        async def claim(task_id, channel_id):
+            return await idempotency.claim(client, "k2", task_id, channel_id)
+
+        assert asyncio.run(claim("task-1", "ch-a")) is None
+        assert asyncio.run(claim("task-2", "ch-b"))["task_id"] == "task-1"
+        assert idempotency.fail(store, "k2") == ["ch-b"]
+        assert asyncio.run(claim("task-3", "ch-a")) is None
+
+    def test_local_run_finishes_record(self):
+        """测试API进程内执行的任务记录结果，失败时释放幂等键，并返回等待的频道"""
+        store = _FakeRedis()
+        client = _FakeAsyncRedis(store)
+
+        async def scenario():
+            await idempotency.claim(client, "k3", "task-1", "ch-a")
+            await idempotency.claim(client, "k3", "task-2", "ch-b")
+            waiting = await idempotency.finish(client, "k3", "task-1", {"success": True, "response": "ok"})
+            record = await idempotency.wait_completed(client, "k3")
+            await idempotency.claim(client, "k4", "task-3", "ch-a")
+            await idempotency.claim(client, "k4", "task-4", "ch-b")
+            failed = await idempotency.finish(client, "k4", "task-3", None)
+            return waiting, record, failed, await idempotency.wait_completed(client, "k4")
+
+        waiting, record, failed, released = asyncio.run(scenario())
+        assert waiting == ["ch-b"]
+        assert record["result"]["response"] == "ok"
+        assert failed == ["ch-b"]
+        assert released is None
+
+    def test_attach_after_original_completed(self):
+        """测试原任务在查到进行中记录之后、登记等待频道之前完成时，返回已完成的记录由调用方推送"""
+        store = _FakeRedis()
+        client = _FakeAsyncRedis(store)
+        sadd = store.sadd
+
+        def complete_then_sadd(key, *members):
+            store.sadd = sadd
+            assert idempotency.complete(store, "k5", "task-1", {"success": True, "response": "ok"}) == []
+            sadd(key, *members)
+
+        async def scenario():
+            await idempotency.claim(client, "k5", "task-1", "ch-a")
+            store.sadd = complete_then_sadd
+            return await idempotency.claim(client, "k5", "task-2", "ch-b")
+
+        record = asyncio.run(scenario())
+        assert record["state"] == idempotency.STATE_COMPLETED
+        assert record["result"]["response"] == "ok"
+        assert store.smembers(idempotency.subscribers_key("k5")) == set()
+
+    def test_attach_pushed_by_original_not_delivered_twice(self):
+        """测试原任务在登记等待频道之后完成时，结果只由原任务推送一次"""
+        store = _FakeRedis()
+        client = _FakeAsyncRedis(store)
+        sadd = store.sadd
+        waiting = []
+
+        def sadd_then_complete(key, *members):
+            store.sadd = sadd
+            sadd(key, *members)
+            waiting.extend(idempotency.complete(store, "k6", "task-1", {"success": True, "response": "ok"}))
+
+        async def scenario():
+            await idempotency.claim(client, "k6", "task-1", "ch-a")
+            store.sadd = sadd_then_complete
+            return await idempotency.claim(client, "k6", "task-2", "ch-b")
+
+        record = asyncio.run(scenario())
+        assert waiting == ["ch-b"]
+        assert record["state"] == idempotency.STATE_PENDING
+
+    def test_claim_conflict_raises(self):
+        """测试幂等键反复被占用又释放时报错而不是当作登记成功"""
+        store = _FakeRedis()
+        store.set = lambda key, value, nx=False, ex=None: None
+        with pytest.raises(idempotency.ClaimConflict):
+            asyncio.run(idempotency.claim(_FakeAsyncRedis(store), "k7", "task-1", "ch-a"))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+队列与Worker负载指标测试
+"""
+
+import time
+
+import pytest
+
+import metrics
+
+
+class _FakeRedis:
+    """内存中的最小Redis实现，覆盖指标用到的命令"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hincrby(self, key, field, amount):
+        h = self.hashes.setdefault(key, {})
+        h[field] = int(h.get(field, 0)) + amount
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hkeys(self, key):
+        return list(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, str(value))
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:end + 1]
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class TestQueueMetrics:
+    """队列指标测试类"""
+
+    def test_snapshot_reports_depth_latency_and_utilization(self):
+        """测试快照汇总各优先级子队列深度、等待/执行时间和利用率"""
+        client = _FakeRedis()
+        client.lists['chat'] = ['m1', 'm2']
+        client.lists['chat:3'] = ['m3']
+        metrics.register_worker(client, 'w1@host', 4, ['chat'])
+
+        now = time.time()
+        metrics.task_started(client, 'w1@host', 'chat', sent_at=now - 1.5, now=now)
+        metrics.task_started(client, 'w1@host', 'chat', sent_at=now - 0.5, now=now)
+        metrics.task_finished(client, 'w1@host', 'chat', runtime=2.0)
+
+        snapshot = metrics.collect(client, ['chat', 'files'])
+        chat = snapshot['queues']['chat']
+        assert chat['depth'] == 3
+        assert chat['wait_time']['count'] == 2
+        assert chat['wait_time']['avg'] == 1.0
+        assert chat['exec_time']['p50'] == 2.0
+        assert chat['active'] == 1
+        assert chat['utilization'] == 0.25
+        assert snapshot['queues']['files']['utilization'] is None
+
+        metrics.reset_worker(client, 'w1@host')
+        assert metrics.collect(client, ['chat'])['workers'] == 0
+
+    def test_backlog_policy_scales_with_depth(self):
+        """测试积压策略按积压量和执行时间计算目标并发与副本数"""
+        policy = metrics.BacklogPolicy(target_wait=2, min_concurrency=1, max_concurrency=100)
+        snapshot = {"queues": {"chat": {
+            "depth": 40, "active": 10, "workers": 2, "concurrency": 20,
+            "exec_time": {"avg": 0.5}
+        }}}
+        assert policy.recommend(snapshot) == {"chat": {"concurrency": 20, "replicas": 2}}
+
+        snapshot["queues"]["chat"]["depth"] = 400
+        assert policy.recommend(snapshot) == {"chat": {"concurrency": 100, "replicas": 10}}
+
+    def test_load_policy_accepts_function(self):
+        """测试策略可以配置为普通函数"""
+        policy = metrics.load_policy('test_metrics:_fixed_policy')
+        assert policy.recommend({}) == {"chat": {"concurrency": 7, "replicas": 1}}
+
+    def test_incomplete_policy_fails_at_load(self):
+        """测试未实现 recommend() 的策略在加载时失败"""
+        with pytest.raises(TypeError):
+            metrics.load_policy('test_metrics:_IncompletePolicy')
+        with pytest.raises(TypeError):
+            metrics.AutoscalePolicy()
+
+
+def _fixed_policy(snapshot):
+    return {"chat": {"concurrency": 7, "replicas": 1}}
+
+
+class _IncompletePolicy(metrics.AutoscalePolicy):
+    pass
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱路径校验测试
+"""
+
+import os
+
+from path_guard import PathGuard
+
+
+class TestPathGuard:
+    """沙箱路径校验测试类"""
+
+    def test_validate_matches_sandbox_rules(self, tmp_path):
+        """测试越界、不存在和类型不符的路径被拒绝"""
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "f.txt").write_text("x")
+        guard = PathGuard(tmp_path)
+
+        assert guard.validate(tmp_path / "dir" / "f.txt", check_existence=True, expect_file=True) == (True, "")
+        assert guard.validate(tmp_path / "new.txt") == (True, "")
+        assert not guard.validate(tmp_path / "missing", check_existence=True)[0]
+        assert not guard.validate(tmp_path / "dir", expect_file=True)[0]
+        assert not guard.validate(tmp_path / ".." / "escape")[0]
+
+    def test_prefix_sibling_not_contained(self, tmp_path):
+        """测试与根目录同前缀的兄弟目录不被视为沙箱内"""
+        (tmp_path / "box").mkdir()
+        (tmp_path / "box2").mkdir()
+        guard = PathGuard(tmp_path / "box")
+        assert not guard.validate(tmp_path / "box" / ".." / "box2")[0]
+
+    def test_child_symlink_checked_every_time(self, tmp_path, monkeypatch):
+        """测试普通子条目不做系统调用，符号链接每次都重新解析"""
+        inside = tmp_path / "box"
+        inside.mkdir()
+        (inside / "real.txt").write_text("x")
+        (tmp_path / "secret.txt").write_text("s")
+        os.symlink(inside / "real.txt", inside / "ok_link")
+        os.symlink(tmp_path / "secret.txt", inside / "bad_link")
+        guard = PathGuard(inside)
+
+        calls = []
+        real_realpath = os.path.realpath
+        monkeypatch.setattr(os.path, "realpath", lambda p: calls.append(p) or real_realpath(p))
+
+        assert guard.child_ok(inside, "real.txt", False)
+        assert calls == []
+        assert guard.child_ok(inside, "ok_link", True)
+        assert not guard.child_ok(inside, "bad_link", True)
+        assert not guard.child_ok(inside, "bad_link", True)
+        assert len(calls) == 3
+
+    def test_link_chain_changed_elsewhere(self, tmp_path):
+        """测试链接所在目录未变化、目标链在其他目录被改向沙箱外时立即拒绝"""
+        inside = tmp_path / "box"
+        (inside / "a").mkdir(parents=True)
+        (inside / "b").mkdir()
+        (inside / "b" / "data").mkdir()
+        (tmp_path / "outside").mkdir()
+        os.symlink(inside / "b" / "hop", inside / "a" / "link")
+        os.symlink(inside / "b" / "data", inside / "b" / "hop")
+        guard = PathGuard(inside)
+        assert guard.child_ok(inside / "a", "link", True)
+
+        # 只修改 b 目录中的中间链接，a 目录 (链接所在目录) 不变
+        os.unlink(inside / "b" / "hop")
+        os.symlink(tmp_path / "outside", inside / "b" / "hop")
+        assert not guard.child_ok(inside / "a", "link", True)
+
+    def test_path_ok_detects_leaf_symlink(self, tmp_path):
+        """测试path_ok识别指向沙箱外的叶子链接"""
+        inside = tmp_path / "box"
+        inside.mkdir()
+        (tmp_path / "secret.txt").write_text("s")
+        os.symlink(tmp_path / "secret.txt", inside / "bad_link")
+        (inside / "plain.txt").write_text("p")
+        guard = PathGuard(inside)
+
+        assert guard.path_ok(inside / "plain.txt")
+        assert not guard.path_ok(inside / "bad_link")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis批量发布测试
+"""
+
+import time
+import asyncio
+
+from publisher import RedisPublisher, AsyncRedisPublisher
+
+
+class _RecordingClient:
+    """记录每次pipeline发送的消息"""
+
+    def __init__(self):
+        self.batches = []
+
+    def pipeline(self, transaction=True):
+        return _RecordingPipeline(self)
+
+
+class _RecordingPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def publish(self, channel, data):
+        self.commands.append((channel, data))
+
+    def execute(self):
+        self.client.batches.append(self.commands)
+        return [1] * len(self.commands)
+
+
+class _AsyncRecordingPipeline(_RecordingPipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self):
+        return super().execute()
+
+
+class _AsyncRecordingClient(_RecordingClient):
+    def pipeline(self, transaction=True):
+        return _AsyncRecordingPipeline(self)
+
+
+class TestRedisPublisher:
+    """同步批量发布器测试类"""
+
+    def test_messages_coalesced_into_one_pipeline(self):
+        """测试合并窗口内的消息通过一次pipeline按顺序发送"""
+        client = _RecordingClient()
+        publisher = RedisPublisher(client, flush_interval_ms=200)
+        for i in range(5):
+            publisher.publish("result:ch", {"seq": i})
+        assert publisher.flush(timeout=2)
+        assert len(client.batches) == 1
+        assert [data for _, data in client.batches[0]] == [f'{{"seq": {i}}}' for i in range(5)]
+        publisher.close()
+
+    def test_urgent_message_skips_flush_window(self):
+        """测试urgent消息不等待合并窗口"""
+        client = _RecordingClient()
+        publisher = RedisPublisher(client, flush_interval_ms=10_000)
+        publisher.publish("result:ch", "progress")
+        publisher.publish("result:ch", "final", urgent=True)
+        deadline = time.monotonic() + 2
+        while not client.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.batches == [[("result:ch", "progress"), ("result:ch", "final")]]
+        publisher.close()
+
+    def test_close_sends_remaining_messages(self):
+        """测试关闭时发送剩余消息，之后的消息直接发送"""
+        client = _RecordingClient()
+        publisher = RedisPublisher(client, flush_interval_ms=10_000, max_batch=2)
+        for i in range(3):
+            publisher.publish("result:ch", str(i))
+        publisher.close()
+        assert [data for batch in client.batches for _, data in batch] == ["0", "1", "2"]
+        publisher.publish("result:ch", "late")
+        assert client.batches[-1] == [("result:ch", "late")]
+
+
+class TestAsyncRedisPublisher:
+    """异步批量发布器测试类"""
+
+    def test_async_publisher_batches_and_flushes(self):
+        """测试异步发布器合并发送并在flush后全部送达"""
+        async def scenario():
+            client = _AsyncRecordingClient()
+            publisher = AsyncRedisPublisher(client, flush_interval_ms=200)
+            for i in range(4):
+                publisher.publish("result:ch", str(i))
+            await publisher.flush()
+            await publisher.aclose()
+            return client.batches
+
+        batches = asyncio.run(scenario())
+        assert batches == [[("result:ch", str(i)) for i in range(4)]]
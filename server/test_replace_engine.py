@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式正则替换测试
+"""
+
+import io
+import os
+import re
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import replace_engine
+
+
+def _stream_subn(text, pattern, repl, count=0, chunk=7, window=5):
+    dst = io.StringIO()
+    n = replace_engine.replace_stream(io.StringIO(text), dst, re.compile(pattern), repl, count,
+                                      chunk_chars=chunk, window=window)
+    return dst.getvalue(), n
+
+
+class TestReplaceStream:
+    """分块替换测试类"""
+
+    @pytest.mark.parametrize("pattern,repl", [
+        (r"foo", "bar"),
+        (r"^a", "A"),
+        (r"\bab\b", "<\\g<0>>"),
+        (r"(?<=x)y+", "Y"),
+        (r"b*", "-"),
+        (r"\s+", " "),
+        (r"(a)(b)", r"\2\1"),
+    ])
+    def test_matches_whole_text_subn(self, pattern, repl):
+        """测试小块、小窗口下的结果与整体 re.subn 完全一致 (含跨块匹配、锚点和空匹配)"""
+        rng = random.Random(pattern)
+        text = "".join(rng.choice(["a", "b", "ab ", "foo", "x", "yy", "\n", " ", "xy"]) for _ in range(400))
+        assert _stream_subn(text, pattern, repl) == re.subn(pattern, repl, text)
+
+    def test_count_limit(self):
+        """测试替换次数上限，剩余内容原样保留"""
+        text = "foo " * 50
+        assert _stream_subn(text, "foo", "bar", count=3) == re.subn("foo", "bar", text, count=3)
+
+
+class TestReplaceFile:
+    """文件替换测试类"""
+
+    def test_atomic_replace_preserves_line_endings(self, tmp_path):
+        """测试原子替换文件内容，保留CRLF行尾和权限位"""
+        path = tmp_path / "a.txt"
+        path.write_bytes(b"hello world\r\nhello\r\n")
+        os.chmod(path, 0o640)
+        assert replace_engine.replace_file(str(path), "hello", "bye") == 2
+        assert path.read_bytes() == b"bye world\r\nbye\r\n"
+        assert path.stat().st_mode & 0o777 == 0o640
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a.txt"]
+
+    def test_no_match_leaves_file_untouched(self, tmp_path):
+        """测试没有匹配时不改写文件"""
+        path = tmp_path / "a.txt"
+        path.write_text("abc")
+        mtime = path.stat().st_mtime_ns
+        assert replace_engine.replace_file(str(path), "zzz", "y") == 0
+        assert path.stat().st_mtime_ns == mtime
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a.txt"]
+
+    def test_decode_error_keeps_original(self, tmp_path):
+        """测试读取失败时原文件不变且不留临时文件"""
+        path = tmp_path / "bad.txt"
+        path.write_bytes(b"abc\xff\xfe")
+        with pytest.raises(UnicodeDecodeError):
+            replace_engine.replace_file(str(path), "abc", "x")
+        assert path.read_bytes() == b"abc\xff\xfe"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["bad.txt"]
+
+    def test_replace_files_reports_per_file(self, tmp_path):
+        """测试多文件模式逐个报告替换次数，二进制文件跳过"""
+        (tmp_path / "a.py").write_text("x = 1\nx = 2\n")
+        (tmp_path / "b.py").write_text("y = 1\n")
+        (tmp_path / "c.bin").write_bytes(b"x\x00x")
+        paths = [str(tmp_path / n) for n in ("a.py", "b.py", "c.bin")]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = {os.path.basename(r.path): (r.count, r.error)
+                       for r in replace_engine.replace_files(paths, r"\bx\b", "z", executor=pool)}
+        assert results == {"a.py": (2, None), "b.py": (0, None), "c.bin": (0, None)}
+        assert (tmp_path / "a.py").read_text() == "z = 1\nz = 2\n"
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑结果存储测试
+"""
+
+import json
+import asyncio
+
+import result_store
+import tasks
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+class _FakeAsyncRedis:
+    def __init__(self, data):
+        self.data = data
+
+    async def get(self, key):
+        return self.data.get(key)
+
+
+class TestResultStore:
+    """紧凑结果存储测试类"""
+
+    def test_compresses_only_above_threshold(self):
+        """测试小结果保持纯JSON，大结果压缩且可以还原"""
+        small = {"response": "ok"}
+        assert result_store.dumps(small) == json.dumps(small).encode('utf-8')
+
+        large = {"response": "重复的文本 " * 2000}
+        encoded = result_store.dumps(large)
+        assert encoded.startswith(b'\x00z')
+        assert len(encoded) < len(json.dumps(large, ensure_ascii=False).encode('utf-8')) / 10
+        assert result_store.loads(encoded) == large
+
+    def test_result_backend_round_trip(self):
+        """测试结果后端使用紧凑序列化器且兼容旧的纯JSON条目"""
+        backend = tasks.celery_app.backend
+        meta = {"status": "SUCCESS", "result": {"response": "x" * 10000}}
+        assert backend.decode(backend.encode(meta)) == meta
+        assert backend.decode(json.dumps({"status": "SUCCESS"}).encode()) == {"status": "SUCCESS"}
+        assert tasks.celery_app.conf.result_expires == result_store.RESULT_EXPIRES
+
+    def test_large_response_stored_once_and_resolved(self):
+        """测试超大正文单独存储，结果中只保留引用，订阅端可以取回"""
+        client = _FakeRedis()
+        result = {"success": True, "response": "a" * 200, "task_id": "t1"}
+        compact = result_store.offload_response(client, result, limit=100)
+        assert compact["response"] == ""
+        assert len(client.data) == 1
+        assert result_store.content_key(compact["response_ref"]) in client.data
+
+        resolved = asyncio.run(result_store.resolve_response(_FakeAsyncRedis(client.data), compact))
+        assert resolved == result
+
+        expired = asyncio.run(result_store.resolve_response(_FakeAsyncRedis({}), compact))
+        assert expired["success"] is False
+        assert result_store.resolve_response_sync(client, compact) == result
+        assert result_store.resolve_response_sync(_FakeRedis(), compact)["success"] is False
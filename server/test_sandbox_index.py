@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙箱目录索引测试
+"""
+
+import os
+
+import sandbox_index
+from sandbox_index import SandboxIndex
+
+
+def _age(path, seconds=10):
+    """把目录mtime调早，使其不处于"刚修改"的不可信窗口"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 1_000_000_000))
+
+
+class TestSandboxIndex:
+    """沙箱目录索引测试类"""
+
+    def test_listing_cached_until_directory_changes(self, tmp_path):
+        """测试目录mtime不变时复用缓存，外部新增条目后重新扫描"""
+        (tmp_path / "b.txt").write_text("bb")
+        (tmp_path / "sub").mkdir()
+        _age(tmp_path)
+        index = SandboxIndex(tmp_path)
+
+        names = [e.name for e in index.listdir(tmp_path)]
+        assert names == ["sub", "b.txt"]
+        index.listdir(tmp_path)
+        assert index.scans == 1
+
+        (tmp_path / "a.txt").write_text("a")
+        _age(tmp_path, 5)
+        assert [e.name for e in index.listdir(tmp_path)] == ["sub", "a.txt", "b.txt"]
+        assert index.scans == 2
+
+    def test_invalidate_updates_entry_without_rescan(self, tmp_path):
+        """测试本进程的写操作增量更新父目录条目"""
+        _age(tmp_path)
+        index = SandboxIndex(tmp_path)
+        index.listdir(tmp_path)
+
+        target = tmp_path / "new.txt"
+        target.write_text("hello")
+        index.invalidate(target)
+        entries = {e.name: e for e in index.listdir(tmp_path)}
+        assert entries["new.txt"].size == 5
+        assert index.scans == 1
+
+        target.unlink()
+        index.invalidate(target)
+        assert index.listdir(tmp_path) == []
+        assert index.scans == 1
+
+    def test_recently_modified_directory_rescanned(self, tmp_path, monkeypatch):
+        """测试mtime与扫描时间过近的目录不信任缓存"""
+        index = SandboxIndex(tmp_path)
+        index.listdir(tmp_path)
+        index.listdir(tmp_path)
+        assert index.scans == 2
+
+        monkeypatch.setattr(sandbox_index, 'SANDBOX_INDEX_RACY_NS', 0)
+        index.listdir(tmp_path)
+        assert index.scans == 2
+
+    def test_walk_skips_symlinked_directories(self, tmp_path):
+        """测试遍历不进入符号链接指向的目录"""
+        (tmp_path / "real").mkdir()
+        (tmp_path / "real" / "f.txt").write_text("x")
+        os.symlink(tmp_path / "real", tmp_path / "link")
+        index = SandboxIndex(tmp_path)
+
+        visited = [str(d.relative_to(tmp_path)) for d, _ in index.walk(tmp_path)]
+        assert visited == [".", "real"]
+        link = index.entry(tmp_path / "link")
+        assert link.is_dir and link.is_symlink
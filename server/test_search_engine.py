@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行内容搜索测试
+"""
+
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import search_engine
+from search_engine import SearchMatch, SearchError
+
+
+@pytest.fixture
+def pool():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+class TestSearchEngine:
+    """内容搜索测试类"""
+
+    def test_matches_with_line_numbers(self, tmp_path, pool):
+        """测试按单行语义匹配并给出行号"""
+        f = tmp_path / "a.py"
+        f.write_text("import os\r\nx = 1\n\ndef foo():\n    return os.sep\n")
+        events = list(search_engine.search([f], r"os\b", executor=pool))
+        assert events == [SearchMatch(str(f), 1, "import os"), SearchMatch(str(f), 5, "    return os.sep")]
+
+        # 跨行的候选不算匹配，^ 和 $ 按行锚定
+        assert list(search_engine.search([f], r"1\s+def", executor=pool)) == []
+        assert [e.line_no for e in search_engine.search([f], r"^$", executor=pool)] == [3]
+
+    def test_crlf_line_end_anchor(self, tmp_path):
+        """测试CRLF文件中 $ 仍按行尾锚定"""
+        f = tmp_path / "crlf.txt"
+        f.write_bytes(b"foo\r\nbar\r\nfoo bar\r\n")
+        assert search_engine.scan_batch([str(f)], r"foo$", 0, 10) == [SearchMatch(str(f), 1, "foo")]
+        assert search_engine.scan_batch([str(f)], r"bar$", 0, 10) == [
+            SearchMatch(str(f), 2, "bar"), SearchMatch(str(f), 3, "foo bar")]
+
+    def test_string_anchors_match_every_line(self, tmp_path, pool, monkeypatch):
+        """测试 \\A、\\Z 按单行语义匹配每一行 (包括分块扫描的后续块)"""
+        monkeypatch.setattr(search_engine, 'SEARCH_MMAP_THRESHOLD', 1024)
+        monkeypatch.setattr(search_engine, 'SEARCH_CHUNK_BYTES', 100)
+        f = tmp_path / "big.log"
+        f.write_text("".join(f"{'key' if i % 50 == 0 else 'val'} {i}\r\n" for i in range(1, 201)))
+        expected = [i for i in range(1, 201) if i % 50 == 0]
+        assert [e.line_no for e in search_engine.search([f], r"\Akey", executor=pool)] == expected
+        assert [e.line_no for e in search_engine.search([f], r"0\Z", executor=pool)] == \
+            [i for i in range(1, 201) if i % 10 == 0]
+
+    def test_case_insensitive_flag(self, tmp_path, pool):
+        """测试忽略大小写"""
+        f = tmp_path / "a.txt"
+        f.write_text("Hello\nhello\n")
+        events = list(search_engine.search([f], "HELLO", re.IGNORECASE, executor=pool))
+        assert [e.line_no for e in events] == [1, 2]
+
+    def test_binary_files_skipped(self, tmp_path, pool):
+        """测试含NUL字节的文件被跳过"""
+        f = tmp_path / "blob.bin"
+        f.write_bytes(b"needle\x00\x01\x02")
+        assert list(search_engine.search([f], "needle", executor=pool)) == []
+
+    def test_large_file_scanned_in_chunks(self, tmp_path, pool, monkeypatch):
+        """测试mmap分块扫描的行号跨块连续"""
+        monkeypatch.setattr(search_engine, 'SEARCH_MMAP_THRESHOLD', 1024)
+        monkeypatch.setattr(search_engine, 'SEARCH_CHUNK_BYTES', 100)
+        f = tmp_path / "big.log"
+        f.write_text("".join(f"line {i} {'needle' if i % 97 == 0 else 'hay'}\n" for i in range(1, 1001)))
+        events = list(search_engine.search([f], "needle", executor=pool))
+        assert [e.line_no for e in events] == [i for i in range(1, 1001) if i % 97 == 0]
+
+    def test_max_results_stops_early(self, tmp_path, pool):
+        """测试达到上限后停止并取消剩余批次"""
+        files = []
+        for i in range(50):
+            f = tmp_path / f"f{i}.txt"
+            f.write_text("match\n" * 10)
+            files.append(f)
+        events = list(search_engine.search(files, "match", max_results=15, executor=pool, batch_size=2))
+        assert len(events) == 15
+
+    def test_unreadable_file_reported(self, tmp_path, pool):
+        """测试读取失败的文件作为错误事件返回"""
+        events = list(search_engine.search([tmp_path / "missing.txt"], "x", executor=pool))
+        assert len(events) == 1 and isinstance(events[0], SearchError)
+
+    def test_invalid_regex_raises_before_scanning(self, pool):
+        """测试无效正则在扫描前报错"""
+        with pytest.raises(re.error):
+            next(search_engine.search([], "(", executor=pool))
+
+    def test_process_pool(self, tmp_path):
+        """测试在spawn进程池中扫描"""
+        f = tmp_path / "a.txt"
+        f.write_text("alpha\nbeta\n")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            assert list(search_engine.search([f], "beta", executor=executor)) == [SearchMatch(str(f), 2, "beta")]
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Celery任务模块测试
+"""
+
+import sys
+import json
+import time
+
+import httpx
+import pytest
+
+import tasks
+from progress import ProgressPublisher, report_tool_progress, tool_progress
+
+
+class TestWorkerResources:
+    """Worker进程级共享资源测试类"""
+
+    def teardown_method(self):
+        tasks._close_worker_resources()
+
+    def test_http_clients_pooled_by_endpoint_and_proxy(self):
+        """测试相同端点+代理复用同一个客户端"""
+        a = tasks._get_http_client("https://api.example.com/v1/chat/completions")
+        b = tasks._get_http_client("https://api.example.com/other")
+        c = tasks._get_http_client("https://api.example.com/v1", "http://127.0.0.1:8080")
+        d = tasks._get_http_client("http://api.example.com/v1")
+        assert a is b
+        assert a is not c
+        assert a is not d
+
+    def test_shutdown_closes_clients(self):
+        """测试Worker退出时关闭所有连接池"""
+        client = tasks._get_http_client("https://api.example.com")
+        tasks._close_worker_resources()
+        assert client.is_closed
+        assert not tasks._http_clients
+
+    def test_agent_registry_prebuilt_once(self):
+        """测试工具注册表只构建一次"""
+        template, runner = tasks._load_agent()
+        assert template is not None and callable(runner)
+        assert tasks._load_agent()[0] is template
+        assert "read_file" in template["tools"]
+
+
+class TestTaskRouting:
+    """任务队列路由测试类"""
+
+    def _queue_for(self, task_name):
+        return tasks.celery_app.amqp.router.route({}, task_name)['queue'].name
+
+    def test_tasks_routed_to_named_queues(self):
+        """测试聊天、搜索、文件任务进入各自队列"""
+        assert self._queue_for('process_ai_message') == tasks.CHAT_QUEUE
+        assert self._queue_for('run_search_tool') == tasks.SEARCH_QUEUE
+        assert self._queue_for('run_file_tool') == tasks.FILES_QUEUE
+
+    def test_chat_has_highest_priority(self):
+        """测试聊天任务优先级最高 (Redis中数值越小越优先)"""
+        assert tasks.process_ai_message.priority < tasks.run_search_tool.priority
+        assert tasks.process_ai_message.priority < tasks.run_file_tool.priority
+
+    def test_file_queue_rejects_other_tools(self):
+        """测试files队列拒绝执行非文件类工具"""
+        result = tasks.run_file_tool.apply(args=['write_file', ['x.txt', 'data']]).get()
+        assert result['success'] is False
+
+    def test_tool_task_does_not_import_app(self, monkeypatch):
+        """测试工具任务从 sandbox_tools 取工具，不导入FastAPI应用"""
+        import sandbox_tools
+        monkeypatch.setitem(sys.modules, 'main', None)
+        monkeypatch.setitem(sandbox_tools.TOOLS, 'tree', lambda path=".": f"tree of {path}")
+        result = tasks.run_file_tool.apply(args=['tree', ['docs']]).get()
+        assert result['success'] is True
+        assert result['response'] == "tree of docs"
+
+
+class _FakeToolTask:
+    def __init__(self, payload=None, error=None):
+        self.payload, self.error, self.calls = payload, error, []
+
+    def apply_async(self, args):
+        if self.error:
+            raise self.error
+        self.calls.append(args)
+        return self
+
+    def get(self, timeout, disable_sync_subtasks):
+        return self.payload
+
+
+class _FakeWorkerRegistry:
+    def __init__(self):
+        self.data = {}
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+
+class TestQueuedTools:
+    """智能体重型工具提交到队列测试类"""
+
+    @pytest.fixture(autouse=True)
+    def consumers(self, monkeypatch):
+        """默认有另一个Worker消费files和search队列"""
+        registry = _FakeWorkerRegistry()
+        tasks.metrics.register_worker(registry, "files@host", 2, [tasks.FILES_QUEUE, tasks.SEARCH_QUEUE])
+        monkeypatch.setattr(tasks, 'redis_client', registry)
+        monkeypatch.setattr(tasks, '_worker_info', {})
+        return registry
+
+    def test_only_heavy_tools_are_queued(self, monkeypatch):
+        """测试重型工具提交到对应队列并返回结果，其他工具原样保留"""
+        files = _FakeToolTask({"response": "archived", "success": True})
+        monkeypatch.setattr(tasks, 'run_file_tool', files)
+        read_file = lambda name: name
+        tools = tasks.queued_tools({'archive_files': lambda *a, **k: "local", 'read_file': read_file}, "ch-1")
+        assert tools['read_file'] is read_file
+        assert tools['archive_files'](["a.txt"], "out.zip", format="zip") == "archived"
+        assert files.calls == [['archive_files', [["a.txt"], "out.zip"], {"format": "zip"}, "ch-1"]]
+
+    def test_failed_task_raises(self, monkeypatch):
+        """测试工具任务失败时抛出异常，由工具循环报告给模型"""
+        monkeypatch.setattr(tasks, 'run_search_tool', _FakeToolTask({"success": False, "error": "boom"}))
+        tool = tasks.queued_tool('find_files', lambda *a: "local")
+        with pytest.raises(RuntimeError, match="boom"):
+            tool("pattern")
+
+    def test_broker_unavailable_runs_locally(self, monkeypatch):
+        """测试无法提交任务时在本地执行"""
+        monkeypatch.setattr(tasks, 'run_search_tool', _FakeToolTask(error=ConnectionError("down")))
+        assert tasks.queued_tool('find_files', lambda query: f"local {query}")("x") == "local x"
+
+    def test_no_consumer_runs_locally(self, monkeypatch):
+        """测试没有Worker消费目标队列时在本地执行，不会等待无人处理的任务"""
+        files = _FakeToolTask({"response": "archived", "success": True})
+        monkeypatch.setattr(tasks, 'run_file_tool', files)
+        monkeypatch.setattr(tasks, 'redis_client', _FakeWorkerRegistry())
+        assert tasks.queued_tool('tree', lambda: "local")() == "local"
+        assert files.calls == []
+
+    def test_own_queue_runs_in_slot(self, monkeypatch, consumers):
+        """测试当前Worker自己消费目标队列时在本槽位内执行，不占着槽位等待同一进程池"""
+        files = _FakeToolTask({"response": "archived", "success": True})
+        monkeypatch.setattr(tasks, 'run_file_tool', files)
+        monkeypatch.setattr(tasks, '_worker_info', {"hostname": "all@host", "queues": ["chat", "search", "files"]})
+        tasks.metrics.register_worker(consumers, "all@host", 4, ["chat", "search", "files"])
+        assert tasks.queued_tool('tree', lambda: "local")() == "local"
+        assert files.calls == []
+
+    def test_stale_consumer_ignored(self, monkeypatch):
+        """测试心跳过期的Worker不算消费者"""
+        registry = _FakeWorkerRegistry()
+        tasks.metrics.register_worker(registry, "files@host", 2, [tasks.FILES_QUEUE])
+        now = time.time() + tasks.metrics.METRICS_WORKER_TTL + 1
+        assert tasks.metrics.queue_consumers(registry, tasks.FILES_QUEUE, now=now) == []
+        assert tasks.metrics.queue_consumers(registry, tasks.FILES_QUEUE) == ["files@host"]
+
+    def test_dispatch_disabled(self, monkeypatch):
+        """测试关闭后重型工具原样返回"""
+        monkeypatch.setattr(tasks, 'TOOL_TASK_DISPATCH', False)
+        func = lambda: "local"
+        assert tasks.queued_tool('tree', func) is func
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressPublishing:
+    """增量进度发布测试类"""
+
+    def _make(self, clock):
+        published, states = [], []
+        publisher = ProgressPublisher("t1", published.append, states.append,
+                                      flush_interval_ms=100, state_interval_ms=1000, clock=clock)
+        return publisher, published, states
+
+    def test_token_deltas_coalesced_per_interval(self):
+        """测试间隔内的token增量合并为一个事件"""
+        clock = _FakeClock()
+        publisher, published, _ = self._make(clock)
+        publisher.token("Hel")
+        publisher.token("lo")
+        assert published == []
+        clock.now = 0.2
+        publisher.token("!")
+        assert len(published) == 1
+        assert published[0]["data"]["events"] == [{"event": "token", "text": "Hello!"}]
+
+    def test_tool_events_flush_immediately(self):
+        """测试工具事件连同待发送的token一起立即发布"""
+        clock = _FakeClock()
+        publisher, published, _ = self._make(clock)
+        publisher.token("a")
+        publisher.event("tool_started", tool="list_files")
+        assert [e["event"] for e in published[0]["data"]["events"]] == ["token", "tool_started"]
+
+    def test_tool_progress_keeps_latest(self):
+        """测试同一工具连续的进度只保留最新一次，按间隔发布"""
+        clock = _FakeClock()
+        publisher, published, _ = self._make(clock)
+        with tool_progress(lambda **fields: publisher.tool_progress("archive_files", **fields)):
+            report_tool_progress(files_done=1)
+            report_tool_progress(files_done=2)
+        report_tool_progress(files_done=3)    # with块之外没有订阅者
+        assert published == []
+        publisher.close()
+        assert published[0]["data"]["events"] == [{"event": "tool_progress", "tool": "archive_files", "files_done": 2}]
+
+    def test_state_updates_throttled(self):
+        """测试状态写入被节流，关闭时写入最后一次状态"""
+        clock = _FakeClock()
+        publisher, _, states = self._make(clock)
+        publisher.state("start", progress=10)
+        clock.now = 0.5
+        publisher.state("middle", progress=50)
+        assert [s["status"] for s in states] == ["start"]
+        publisher.close()
+        assert [s["status"] for s in states] == ["start", "middle"]
+
+    def test_pending_events_flushed_by_timer(self):
+        """测试间隔内没有新事件时，待发送的事件由定时器在间隔后发布"""
+        published = []
+        publisher = ProgressPublisher("t1", published.append, flush_interval_ms=20)
+        publisher.token("a")
+        publisher.token("b")
+        assert published == []
+        deadline = time.monotonic() + 2
+        while not published and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert published[0]["data"]["events"] == [{"event": "token", "text": "ab"}]
+        publisher.close()
+        assert len(published) == 1
+
+    def test_streaming_completion_publishes_tokens(self):
+        """测试流式调用上游时逐段发布token并返回完整回复"""
+        def handler(request):
+            body = json.loads(request.content)
+            assert body["stream"] is True
+            lines = [f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}" for part in ("Hi", " there")]
+            return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                  content="\n\n".join(lines + ["data: [DONE]"]).encode())
+
+        published = []
+        publisher = ProgressPublisher("t1", published.append, flush_interval_ms=0)
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            text = tasks._post_chat_completion(client, "https://api.example.com/v1/chat/completions", {}, {}, publisher)
+        publisher.close()
+        assert text == "Hi there"
+        tokens = "".join(e["text"] for m in published for e in m["data"]["events"] if e["event"] == "token")
+        assert tokens == "Hi there"
+
+    def test_default_agent_streams_tokens(self, monkeypatch):
+        """测试默认智能体路径以流式调用上游并发布token增量"""
+        import agent_tools
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            lines = [f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}" for part in ("你", "好")]
+            return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                  content="\n\n".join(lines + ["data: [DONE]"]).encode())
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(agent_tools, "deepseek_api_key", "test-key")
+        monkeypatch.setattr(tasks, "_get_http_client", lambda *args: client)
+        published = []
+        publisher = ProgressPublisher("t1", published.append, flush_interval_ms=0)
+        assert tasks._call_default_api("打个招呼", None, publisher) == "你好"
+        publisher.close()
+        client.close()
+        tokens = "".join(e["text"] for m in published for e in m["data"]["events"] if e["event"] == "token")
+        assert tokens == "你好"
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+三元组索引测试
+"""
+
+import os
+import re
+
+import pytest
+
+from trigram_index import TrigramIndex, required_literals
+
+
+def _info(path):
+    st = os.stat(path)
+    return str(path), st.st_mtime, st.st_size
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = TrigramIndex(str(tmp_path / ".cache" / "trigram.sqlite"))
+    yield idx
+    idx.close()
+
+
+class TestRequiredLiterals:
+    """字面量提取测试类"""
+
+    def test_concatenated_literals(self):
+        """测试顺序拼接的字面量被提取，分支和字符类处断开"""
+        assert required_literals(r"def main\(") == ["def main("]
+        assert required_literals(r"foo(bar|baz)qux") == ["fooba", "qux"]
+        assert required_literals(r"class\s+Handler") == ["class", "handler"]
+
+    def test_unfilterable_patterns(self):
+        """测试无必需字面量的正则不做过滤"""
+        assert required_literals(r".*") == []
+        assert required_literals(r"ab|cd") == []
+        assert required_literals(r"(?:abcd)?") == []
+
+    def test_ignorecase_excludes_non_ascii_folding_letters(self):
+        """测试忽略大小写时 s/i (可匹配 ſ、ı) 不参与过滤"""
+        assert required_literals("parser", re.IGNORECASE) == ["par"]
+        assert re.search("parser", "parſer", re.IGNORECASE)
+
+
+class TestTrigramIndex:
+    """三元组索引测试类"""
+
+    def test_candidates_narrowed_by_literals(self, tmp_path, index):
+        """测试只有包含全部字面量的文件成为候选"""
+        a = tmp_path / "a.py"; a.write_text("def main():\n    return 0\n")
+        b = tmp_path / "b.py"; b.write_text("def helper():\n    pass\n")
+        c = tmp_path / "c.bin"; c.write_bytes(b"def main\x00")
+        files = [_info(p) for p in (a, b, c)]
+
+        assert index.candidates(files, r"def\s+main\(") == [str(a)]
+        assert index.candidates(files, r"DEF HELPER", re.IGNORECASE) == [str(b)]
+        assert index.candidates(files, r".*") == [str(a), str(b), str(c)]
+
+    def test_changed_file_reindexed(self, tmp_path, index):
+        """测试mtime或大小变化的文件在查询前重新索引"""
+        a = tmp_path / "a.txt"; a.write_text("alpha\n")
+        assert index.candidates([_info(a)], "omega") == []
+        a.write_text("omega omega\n")
+        assert index.candidates([_info(a)], "omega") == [str(a)]
+
+    def test_invalidate_and_persistence(self, tmp_path, index):
+        """测试索引持久化到磁盘，invalidate 删除目录下的记录"""
+        (tmp_path / "d").mkdir()
+        a = tmp_path / "d" / "a.txt"; a.write_text("needle\n")
+        files = [_info(a)]
+        index.candidates(files, "needle")
+        index.close()
+
+        reopened = TrigramIndex(index.path)
+        conn = reopened._connect()
+        assert conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 1
+        reopened.invalidate(tmp_path / "d")
+        assert conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM trigrams").fetchone()[0] == 0
+        reopened.close()
+
+    def test_oversized_files_always_candidates(self, tmp_path):
+        """测试超过大小上限的文件不建索引而总是作为候选"""
+        index = TrigramIndex(str(tmp_path / "t.sqlite"), max_file_bytes=8)
+        big = tmp_path / "big.txt"; big.write_text("nothing relevant here\n")
+        assert index.candidates([_info(big)], "needle") == [str(big)]
+        index.close()
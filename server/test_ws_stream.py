@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket分块传输测试
+"""
+
+import asyncio
+
+from ws_stream import ChunkedSender
+
+
+class TestChunkedSender:
+    """分块发送器测试类"""
+
+    def test_small_payload_not_chunked(self):
+        """测试小于阈值的文本不分块"""
+        sender = ChunkedSender(None, chunk_size=4, threshold=10)
+        assert not sender.should_chunk("x" * 10)
+        assert sender.should_chunk("x" * 11)
+
+    def test_chunks_reassemble_with_acks(self):
+        """测试分块帧按序号发送，ACK释放窗口后可以完整重组"""
+        async def scenario():
+            frames = []
+            sender = None
+
+            async def send(message, channel_id):
+                frames.append(message)
+                # 模拟客户端：每 ack_every 个分块确认一次
+                if message["type"] == "result_chunk":
+                    seq = message["data"]["seq"]
+                    if (seq + 1) % sender.ack_every == 0:
+                        sender.handle_ack(channel_id, {"stream_id": message["data"]["stream_id"], "seq": seq})
+
+            sender = ChunkedSender(send, chunk_size=3, threshold=1, ack_every=2, window=2, ack_timeout=1)
+            text = "abcdefghijklmnopq"
+            ok = await sender.send("ch", "result", text, {"success": True})
+            return ok, frames, text
+
+        ok, frames, text = asyncio.run(scenario())
+        assert ok
+        assert frames[0]["type"] == "result_start"
+        assert frames[0]["data"]["meta"] == {"success": True}
+        chunks = [f["data"] for f in frames if f["type"] == "result_chunk"]
+        assert [c["seq"] for c in chunks] == list(range(len(chunks)))
+        assert "".join(c["chunk"] for c in chunks) == text
+        assert frames[-1]["type"] == "result_end"
+
+    def test_stream_aborts_without_acks(self):
+        """测试客户端不确认时在窗口耗尽后中止"""
+        async def scenario():
+            frames = []
+
+            async def send(message, channel_id):
+                frames.append(message)
+
+            sender = ChunkedSender(send, chunk_size=1, threshold=1, ack_every=2, window=2, ack_timeout=0.05)
+            ok = await sender.send("ch", "result", "abcdefgh")
+            return ok, frames
+
+        ok, frames = asyncio.run(scenario())
+        assert not ok
+        assert sum(1 for f in frames if f["type"] == "result_chunk") == 2
+        assert frames[-1]["type"] == "error"
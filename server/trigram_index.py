@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容搜索的三元组倒排索引 (可选，TRIGRAM_INDEX_ENABLED=true 启用)
+- 索引保存在sqlite中：每个文本文件记录 (路径, mtime, 大小) 和其小写内容中出现的全部3字节三元组
+- 查询时从正则表达式中提取必须出现的字面量片段，只有包含全部对应三元组的文件才交给真正的正则扫描
+- 文件的mtime或大小与记录不同时在查询前重新索引；本进程的写操作通过 invalidate() 删除记录
+- 无法提取字面量的正则 (如 '.*'、分支) 不做过滤；超大文件不建索引，总是作为候选
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse       # Python 3.11+
+except ImportError:                            # pragma: no cover
+    import sre_parse
+
+# --- 三元组索引配置 ---
+TRIGRAM_INDEX_ENABLED = os.getenv('TRIGRAM_INDEX_ENABLED', 'false').lower() == 'true'
+TRIGRAM_INDEX_PATH = os.getenv('TRIGRAM_INDEX_PATH', str(Path(__file__).parent / '.cache' / 'trigram.sqlite'))
+TRIGRAM_MAX_FILE_BYTES = int(os.getenv('TRIGRAM_MAX_FILE_BYTES', str(1 << 20)))   # 超过该大小的文件不建索引
+TRIGRAM_SNIFF_BYTES = 8192
+TRIGRAM_MAX_QUERY = 64               # 单次查询最多使用的三元组数 (任意子集都是必要条件)
+
+SCHEMA_VERSION = 1
+
+# 忽略大小写时可与非ASCII字符匹配的ASCII字母 (ſ、ı)，小写后的三元组无法覆盖
+_CASEFOLD_UNSAFE = frozenset('sSiI')
+
+
+def file_trigrams(data: bytes) -> Set[int]:
+    """文件内容 (小写后的UTF-8) 中出现的三元组"""
+    text = data.decode('utf-8', errors='ignore').lower().encode('utf-8')
+    return {int.from_bytes(text[i:i + 3], 'big') for i in range(len(text) - 2)}
+
+
+def required_literals(pattern: str, flags: int = 0) -> List[str]:
+    """
+    正则表达式的每个匹配都必须包含的ASCII字面量片段 (长度>=3，已小写)
+
+    只收集顺序拼接的字面量；分支、字符类、可选重复等处断开；无法解析时返回空列表
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return []
+    ignorecase = bool((flags | parsed.state.flags) & re.IGNORECASE) and not (parsed.state.flags & re.ASCII)
+    runs: List[str] = []
+    current: List[str] = []
+
+    def flush():
+        if len(current) >= 3:
+            runs.append(''.join(current).lower())
+        current.clear()
+
+    def visit(items, ignorecase):
+        for op, av in items:
+            if op == sre_parse.LITERAL and av < 128 and not (ignorecase and chr(av) in _CASEFOLD_UNSAFE):
+                current.append(chr(av))
+            elif op == sre_parse.SUBPATTERN:
+                _, add_flags, del_flags, sub = av
+                visit(sub, (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE)
+            elif op == sre_parse.AT:
+                continue
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                flush()
+                visit(av[2], ignorecase)
+                flush()
+            else:
+                flush()
+
+    visit(parsed, ignorecase)
+    flush()
+    return runs
+
+
+def query_trigrams(pattern: str, flags: int = 0) -> Set[int]:
+    """匹配的文件必须包含的三元组；为空表示无法过滤"""
+    trigrams: Set[int] = set()
+    for run in required_literals(pattern, flags):
+        data = run.encode('ascii')
+        trigrams.update(int.from_bytes(data[i:i + 3], 'big') for i in range(len(data) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    """sqlite持久化的三元组索引"""
+
+    def __init__(self, path: str = TRIGRAM_INDEX_PATH, max_file_bytes: int = TRIGRAM_MAX_FILE_BYTES):
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # --- 连接与表结构 ---
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(f'''
+                    DROP TABLE IF EXISTS files;
+                    DROP TABLE IF EXISTS trigrams;
+                    CREATE TABLE files (
+                        id INTEGER PRIMARY KEY,
+                        path TEXT UNIQUE NOT NULL,
+                        mtime REAL NOT NULL,
+                        size INTEGER NOT NULL,
+                        kind INTEGER NOT NULL          -- 0: 文本 1: 二进制 2: 未建索引(超大)
+                    );
+                    CREATE TABLE trigrams (
+                        tri INTEGER NOT NULL,
+                        file_id INTEGER NOT NULL,
+                        PRIMARY KEY (tri, file_id)
+                    ) WITHOUT ROWID;
+                    CREATE INDEX trigrams_file ON trigrams(file_id);
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- 查询 ---
+    def candidates(self, files: Iterable[Tuple[str, float, int]], pattern: str, flags: int = 0) -> List[str]:
+        """
+        过滤可能匹配正则的文件
+
+        Args:
+            files: (路径, mtime, 大小)，通常来自沙箱索引的遍历
+            pattern/flags: 内容搜索的正则表达式
+
+        Returns:
+            可能匹配的文件路径 (保持输入顺序)；无法提取字面量时返回全部路径
+        """
+        files = list(files)
+        required = sorted(query_trigrams(pattern, flags))[:TRIGRAM_MAX_QUERY]
+        if not required:
+            return [path for path, _, _ in files]
+        with self._lock:
+            conn = self._connect()
+            self._refresh(conn, files)
+            placeholders = ','.join('?' * len(required))
+            matched = {row[0] for row in conn.execute(
+                f'SELECT f.path FROM trigrams t JOIN files f ON f.id = t.file_id '
+                f'WHERE t.tri IN ({placeholders}) GROUP BY t.file_id HAVING COUNT(*) = ?',
+                (*required, len(required)))}
+            matched.update(row[0] for row in conn.execute('SELECT path FROM files WHERE kind = 2'))
+        return [path for path, _, _ in files if path in matched]
+
+    def _refresh(self, conn: sqlite3.Connection, files: List[Tuple[str, float, int]]) -> None:
+        """重新索引mtime或大小变化的文件"""
+        known: Dict[str, Tuple[int, float, int]] = {
+            path: (file_id, mtime, size)
+            for file_id, path, mtime, size in conn.execute('SELECT id, path, mtime, size FROM files')}
+        stale = [(path, mtime, size) for path, mtime, size in files
+                 if known.get(path, (None, None, None))[1:] != (mtime, size)]
+        if not stale:
+            return
+        with conn:
+            for path, mtime, size in stale:
+                old = known.get(path)
+                if old is not None:
+                    self._delete_ids(conn, [old[0]])
+                kind, trigrams = self._read(path, size)
+                file_id = conn.execute('INSERT INTO files (path, mtime, size, kind) VALUES (?, ?, ?, ?)',
+                                       (path, mtime, size, kind)).lastrowid
+                conn.executemany('INSERT INTO trigrams (tri, file_id) VALUES (?, ?)',
+                                 ((tri, file_id) for tri in trigrams))
+
+    def _read(self, path: str, size: int) -> Tuple[int, Set[int]]:
+        if size > self.max_file_bytes:
+            return 2, set()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            # 读取失败的文件仍交给扫描器，由其报告错误
+            return 2, set()
+        if len(data) > self.max_file_bytes:
+            return 2, set()
+        if b'\x00' in data[:TRIGRAM_SNIFF_BYTES]:
+            return 1, set()
+        return 0, file_trigrams(data)
+
+    # --- 增量更新 ---
+    def invalidate(self, *paths: Any) -> None:
+        """本进程修改了这些路径：删除其 (及目录下全部文件的) 记录，下次查询时重新索引"""
+        if self._conn is None and not os.path.exists(self.path):
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for path in paths:
+                    key = os.path.abspath(path)
+                    prefix = key.rstrip(os.sep) + os.sep
+                    ids = [row[0] for row in conn.execute(
+                        'SELECT id FROM files WHERE path = ? OR substr(path, 1, ?) = ?',
+                        (key, len(prefix), prefix))]
+                    self._delete_ids(conn, ids)
+
+    @staticmethod
+    def _delete_ids(conn: sqlite3.Connection, ids: List[int]) -> None:
+        for file_id in ids:
+            conn.execute('DELETE FROM trigrams WHERE file_id = ?', (file_id,))
+            conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
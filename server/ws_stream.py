@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket大结果分块传输
+将超大结果拆分为带序号的分块帧，并基于客户端ACK的信用额度进行流量控制
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- 分块传输配置 ---
+WS_CHUNK_SIZE = int(os.getenv('WS_CHUNK_SIZE', str(64 * 1024)))            # 每个分块的字符数
+WS_CHUNK_THRESHOLD = int(os.getenv('WS_CHUNK_THRESHOLD', str(256 * 1024)))  # 超过该长度才分块
+WS_ACK_EVERY = int(os.getenv('WS_ACK_EVERY', '8'))                          # 客户端每收到N个分块确认一次
+WS_CHUNK_WINDOW = int(os.getenv('WS_CHUNK_WINDOW', '32'))                   # 允许未确认的最大分块数
+WS_ACK_TIMEOUT = float(os.getenv('WS_ACK_TIMEOUT', '30'))                   # 等待ACK的超时时间(秒)
+
+SendFunc = Callable[[dict, str], Awaitable[None]]
+
+
+class _StreamState:
+    """单个分块流的确认状态"""
+
+    __slots__ = ('acked', 'event', 'closed')
+
+    def __init__(self):
+        self.acked = -1
+        self.event = asyncio.Event()
+        self.closed = False
+
+
+class ChunkedSender:
+    """
+    分块发送器
+
+    帧格式:
+      {type}_start: stream_id, total_chunks, total_length, chunk_size, ack_every, meta
+      {type}_chunk: stream_id, seq, chunk
+      {type}_end:   stream_id, total_chunks
+    客户端每收到 ack_every 个分块发送 {"type": "ack", "data": {"stream_id", "seq"}}，
+    服务端最多保持 window 个未确认分块在途。
+    """
+
+    def __init__(self, send: SendFunc,
+                 chunk_size: int = WS_CHUNK_SIZE,
+                 threshold: int = WS_CHUNK_THRESHOLD,
+                 ack_every: int = WS_ACK_EVERY,
+                 window: int = WS_CHUNK_WINDOW,
+                 ack_timeout: float = WS_ACK_TIMEOUT):
+        self._send = send
+        self.chunk_size = max(1, chunk_size)
+        self.threshold = threshold
+        self.ack_every = max(1, ack_every)
+        # 窗口不能小于确认间隔，否则客户端永远等不到发送ACK的时机
+        self.window = max(window, self.ack_every)
+        self.ack_timeout = ack_timeout
+        self._streams: Dict[str, Dict[str, _StreamState]] = {}
+
+    def should_chunk(self, text: str) -> bool:
+        """判断文本是否需要分块发送"""
+        return self.threshold > 0 and len(text) > self.threshold
+
+    async def send(self, channel_id: str, frame_type: str, text: str,
+                   meta: Optional[Dict[str, Any]] = None) -> bool:
+        """分块发送文本，返回是否完整送达"""
+        stream_id = uuid.uuid4().hex
+        total_chunks = (len(text) + self.chunk_size - 1) // self.chunk_size
+        state = _StreamState()
+        self._streams.setdefault(channel_id, {})[stream_id] = state
+
+        try:
+            await self._send({
+                "type": f"{frame_type}_start",
+                "data": {
+                    "stream_id": stream_id,
+                    "total_chunks": total_chunks,
+                    "total_length": len(text),
+                    "chunk_size": self.chunk_size,
+                    "ack_every": self.ack_every,
+                    "meta": meta or {}
+                }
+            }, channel_id)
+
+            for seq in range(total_chunks):
+                if not await self._wait_for_credit(state, seq):
+                    logger.warning(f"分块流 {stream_id} 中止 (频道 {channel_id}, 已确认 {state.acked + 1}/{total_chunks})")
+                    if not state.closed:
+                        await self._send({
+                            "type": "error",
+                            "data": {"message": "分块传输超时，客户端未确认", "stream_id": stream_id}
+                        }, channel_id)
+                    return False
+
+                start = seq * self.chunk_size
+                await self._send({
+                    "type": f"{frame_type}_chunk",
+                    "data": {"stream_id": stream_id, "seq": seq, "chunk": text[start:start + self.chunk_size]}
+                }, channel_id)
+
+            await self._send({
+                "type": f"{frame_type}_end",
+                "data": {"stream_id": stream_id, "total_chunks": total_chunks}
+            }, channel_id)
+            return True
+        finally:
+            streams = self._streams.get(channel_id)
+            if streams is not None:
+                streams.pop(stream_id, None)
+                if not streams:
+                    self._streams.pop(channel_id, None)
+
+    async def _wait_for_credit(self, state: _StreamState, seq: int) -> bool:
+        """等待直到发送第 seq 个分块不会超出窗口"""
+        while seq - state.acked > self.window:
+            if state.closed:
+                return False
+            state.event.clear()
+            try:
+                await asyncio.wait_for(state.event.wait(), self.ack_timeout)
+            except asyncio.TimeoutError:
+                return False
+        return not state.closed
+
+    def handle_ack(self, channel_id: str, data: Dict[str, Any]) -> None:
+        """处理客户端ACK，释放发送额度"""
+        state = self._streams.get(channel_id, {}).get(data.get('stream_id'))
+        if state is None:
+            return
+        try:
+            seq = int(data.get('seq', -1))
+        except (TypeError, ValueError):
+            return
+        if seq > state.acked:
+            state.acked = seq
+            state.event.set()
+
+    def drop_channel(self, channel_id: str) -> None:
+        """频道断开时中止该频道上所有分块流"""
+        for state in self._streams.pop(channel_id, {}).values():
+            state.closed = True
+            state.event.set()
@@ -12,6 +12,7 @@ class WebSocketAPIClient {
         this.reconnectDelay = 1000; // 1秒
         this.heartbeatInterval = null;
         this.heartbeatTimeout = 30000; // 30秒
+        this.chunkStreams = new Map(); // stream_id -> 分块重组状态
         
         // 事件监听器
         this.onConnectionChange = null;
@@ -116,8 +117,72 @@ class WebSocketAPIClient {
      * 处理消息
      */
     handleMessage(data) {
-        console.log('收到WebSocket消息:', data);
-        
+        const messageType = data.type;
+
+        // 分块帧：重组完成后再作为完整消息分发
+        if (/_(start|chunk|end)$/.test(messageType || '') && data.data?.stream_id) {
+            const assembled = this.handleChunkFrame(data);
+            if (!assembled) {
+                return;
+            }
+            data = assembled;
+        } else {
+            console.log('收到WebSocket消息:', data);
+        }
+
+        return this.dispatchMessage(data);
+    }
+
+    /**
+     * 处理分块帧，按间隔发送ACK；整条消息重组完成时返回该消息
+     */
+    handleChunkFrame(frame) {
+        const payload = frame.data;
+        const suffixIndex = frame.type.lastIndexOf('_');
+        const baseType = frame.type.slice(0, suffixIndex);
+        const kind = frame.type.slice(suffixIndex + 1);
+
+        if (kind === 'start') {
+            this.chunkStreams.set(payload.stream_id, {
+                chunks: new Array(payload.total_chunks),
+                received: 0,
+                ackEvery: payload.ack_every || 1,
+                meta: payload.meta || {}
+            });
+            console.log(`开始接收分块消息 ${payload.stream_id}: ${payload.total_chunks} 块, ${payload.total_length} 字符`);
+            return null;
+        }
+
+        const stream = this.chunkStreams.get(payload.stream_id);
+        if (!stream) {
+            return null;
+        }
+
+        if (kind === 'chunk') {
+            stream.chunks[payload.seq] = payload.chunk;
+            stream.received++;
+            if (stream.received % stream.ackEvery === 0) {
+                this.sendMessage('ack', { stream_id: payload.stream_id, seq: payload.seq }).catch(error => {
+                    console.error('发送分块ACK失败:', error);
+                });
+            }
+            return null;
+        }
+
+        // end
+        this.chunkStreams.delete(payload.stream_id);
+        const { timestamp, ...meta } = stream.meta;
+        return {
+            type: baseType,
+            data: { ...meta, response: stream.chunks.join('') },
+            timestamp: timestamp
+        };
+    }
+
+    /**
+     * 分发完整消息到处理器
+     */
+    dispatchMessage(data) {
         const messageType = data.type;
         
         // 调用注册的消息处理器
@@ -144,6 +209,7 @@ class WebSocketAPIClient {
         
         this.isConnected = false;
         this.stopHeartbeat();
+        this.chunkStreams.clear();
         
         if (this.onConnectionChange) {
             this.onConnectionChange(false, null);
@@ -197,7 +263,8 @@ class WebSocketAPIClient {
             message: message,
             user_id: options.userId || 'chrome_extension_user',
             proxy_config: options.proxyConfig || null,
-            api_config: options.apiConfig || null
+            api_config: options.apiConfig || null,
+            idempotency_key: options.idempotencyKey || null
         };
 
         await this.sendMessage('chat', chatData);
@@ -288,8 +355,11 @@ async function initializeWebSocket() {
 
 /**
  * 发送消息到后端 (WebSocket版本)
+ * @param {string} message 用户消息
+ * @param {Function} [onProgress] 可选，接收增量进度事件 {event, text|tool, ...}
+ * @param {string} [idempotencyKey] 可选，本轮对话的幂等键，由调用方每轮生成一次并在重试时复用
  */
-async function sendMessageToBackendWS(message) {
+async function sendMessageToBackendWS(message, onProgress = null, idempotencyKey = null) {
     try {
         // 获取用户设置
         const settings = await new Promise((resolve) => {
@@ -309,7 +379,10 @@ async function sendMessageToBackendWS(message) {
         const client = getWebSocketClient();
         
         // 构建配置
-        const options = {};
+        // 幂等键：重试同一轮对话时传入相同的键，后端只会执行一次
+        const options = {
+            idempotencyKey: idempotencyKey
+        };
         
         // 代理配置
         if (settings.proxyEnabled && settings.proxyHost && settings.proxyPort) {
@@ -339,34 +412,55 @@ async function sendMessageToBackendWS(message) {
         
         // 返回Promise，等待响应
         return new Promise((resolve, reject) => {
-            const timeout = setTimeout(() => {
-                reject(new Error('消息处理超时'));
-            }, 60000); // 60秒超时
+            let timeout = null;
+            const armTimeout = () => {
+                clearTimeout(timeout);
+                timeout = setTimeout(() => {
+                    client.offMessageType('result');
+                    client.offMessageType('error');
+                    client.offMessageType('progress');
+                    reject(new Error('消息处理超时'));
+                }, 60000); // 60秒内无任何结果或进度则超时
+            };
+            armTimeout();
+
+            const cleanup = () => {
+                clearTimeout(timeout);
+                client.offMessageType('result');
+                client.offMessageType('error');
+                client.offMessageType('progress');
+            };
 
             // 监听结果消息
             const handleResult = (data) => {
                 if (data.type === 'result') {
-                    clearTimeout(timeout);
-                    client.offMessageType('result');
-                    client.offMessageType('error');
+                    cleanup();
                     
-                    if (data.success) {
-                        resolve(data.response);
+                    const result = data.data || data;
+                    if (result.success) {
+                        resolve(result.response);
                     } else {
-                        reject(new Error(data.error || '处理失败'));
+                        reject(new Error(result.error || '处理失败'));
                     }
                 } else if (data.type === 'error') {
-                    clearTimeout(timeout);
-                    client.offMessageType('result');
-                    client.offMessageType('error');
+                    cleanup();
                     
                     const errorMsg = data.data?.message || '未知错误';
                     reject(new Error(errorMsg));
                 }
             };
 
+            // Worker增量进度：token增量、工具开始/结束
+            const handleProgress = (data) => {
+                armTimeout();
+                if (onProgress) {
+                    (data.data?.events || []).forEach(event => onProgress(event));
+                }
+            };
+
             client.onMessageType('result', handleResult);
             client.onMessageType('error', handleResult);
+            client.onMessageType('progress', handleProgress);
         });
 
     } catch (error) {